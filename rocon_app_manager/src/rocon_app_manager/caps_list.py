@@ -89,6 +89,15 @@ class CapsList(object):
                 self._available_semantic_interfaces.append(interface)
                 self._providers[interface] = self._spec_index.specs[self._spec_index.specs[interface].default_provider]
 
+    def available_capabilities(self):
+        '''
+        Returns the names of the interfaces and semantic interfaces with a default provider
+
+        :returns: names of the available capabilities
+        :rtype: frozenset
+        '''
+        return frozenset(self._available_interfaces).union(self._available_semantic_interfaces)
+
     def compatibility_check(self, app):
         '''
         Checks, if all required capabilities of an app are available
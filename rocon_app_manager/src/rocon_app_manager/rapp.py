@@ -14,6 +14,7 @@ import tempfile
 import rospy
 import traceback
 import rocon_python_utils
+import rocon_app_utilities.tarball_resources as tarball_resources
 import rocon_app_manager_msgs.msg as rapp_manager_msgs
 import rocon_std_msgs.msg as rocon_std_msgs
 from .exceptions import MissingCapabilitiesException
@@ -31,6 +32,7 @@ class Rapp(object):
     '''
     # standard args that can be put inside a rapp launcher, the rapp manager
     # will fill these args in when starting the rapp
+    __slots__ = ['_connections', '_raw_data', '_launch', '_public_interface_strings', 'data']
 
     def __init__(self, rapp_specification):
         '''
@@ -39,9 +41,11 @@ class Rapp(object):
            :param package_relative_rapp_filename: string specified by the package export
            :type package_relative_rapp_filename: os.path
         '''
-        self._connections = _create_empty_connection_type_dictionary()
+        self._connections = None  # created when started, most rapps never are
         self._raw_data = rapp_specification
-        self.data = rapp_specification.data
+        self._launch = None
+        self._public_interface_strings = None  # (connection type, str of its connections), built once for to_msg
+        self.data = rapp_specification.data  # shared with the specification, not copied
         self.data['status'] = 'Ready'
         self.data['published_interfaces'] = []
         self.data['published_parameters'] = {}
@@ -66,12 +70,13 @@ class Rapp(object):
         a.description = self.data['description']
         a.compatibility = self.data['compatibility']
         a.status = self.data['status']
-        a.icon = rocon_python_utils.ros.icon_to_msg(self.data['icon'])
+        a.icon = rocon_python_utils.ros.icon_to_msg(tarball_resources.materialize(self.data['icon']))
         a.implementations = []
 
-        key = 'public_interface'
-        if key in self.data:
-            a.public_interface = [rocon_std_msgs.KeyValue(key, str(val)) for key, val in self.data[key].items()]
+        if 'public_interface' in self.data:
+            if self._public_interface_strings is None:
+                self._public_interface_strings = tuple((key, str(val)) for key, val in self.data['public_interface'].items())
+            a.public_interface = [rocon_std_msgs.KeyValue(key, val) for key, val in self._public_interface_strings]
 
         key = 'public_parameters'
         if key in self.data:
@@ -193,7 +198,7 @@ class Rapp(object):
 
     def stop(self):
         data = self.data
-        connections = copy.deepcopy(self._connections)
+        connections = copy.deepcopy(self._connections) if self._connections is not None else _create_empty_connection_type_dictionary()
 
         try:
             if self._launch:
@@ -29,6 +29,7 @@ import rospkg.os_detect
 import rocon_python_utils
 import rocon_app_utilities
 import rocon_app_utilities.rapp_repositories as rapp_repositories
+from rocon_app_utilities.index_watcher import IndexWatcher, find_rapps_reading, index_dependencies
 
 # local imports
 from . import exceptions
@@ -62,10 +63,14 @@ class RappManager(object):
         (self._rocon_uri, self._icon) = self._set_platform_info()
 
         self.caps_list = {}
+        self._available_capabilities = frozenset([])  # as last checked by _filter_capability_unavailable_rapps
         self._initialising_services = False
+        self._rapps_lock = threading.Lock()  # held while the rapp lists are swapped after a refresh
+        self._indexer_lock = threading.Lock()  # held while the indexer, the dependency checker or the capabilities are used off the main thread
 
         rospy.loginfo("Rapp Manager : indexing rapps...")
-        self._indexer = rapp_repositories.get_combined_index(package_whitelist=self._param['rapp_package_whitelist'], package_blacklist=self._param['rapp_package_blacklist'])
+        # watched rapps are indexed from their files, not from cached index archives
+        self._indexer = rapp_repositories.get_combined_index(package_whitelist=self._param['rapp_package_whitelist'], package_blacklist=self._param['rapp_package_blacklist'], live=self._param['watch_rapps'])
 
         if self._param['auto_rapp_installation']:
             try:
@@ -79,6 +84,10 @@ class RappManager(object):
         self._preferred = {}
         self._configure_preferred_rapp_for_virtuals()
 
+        self._watcher = None
+        if self._param['watch_rapps']:
+            self._init_watcher()
+
         self._init_default_service_names()
         self._init_gateway_services()
         #if we dont depend on gateway we can init services right now
@@ -201,16 +210,27 @@ class RappManager(object):
         self._initialising_services = False
         return True
 
-    def _determine_runnable_rapps(self):
+    def _determine_runnable_rapps(self, affected=None):
         '''
          Prune unsupported apps due to lack of support for required capabilities.
 
+         :param affected: names of the rapps which changed since the last call. Only these are checked for
+                          capabilities and dependencies again, None to check all.
+         :type affected: set
+
          :returns: incompatible app list dictionaries for capability incompatibilities respectively
          :rtype: {rocon_app_manager.Rapp}, [str], [str]
         '''
         rospy.loginfo("Rapp Manager : determining runnable rapps...")
         compatible_rapps, platform_incompatible_rapps, invalid_rapps = self._indexer.get_compatible_rapps(uri=self._rocon_uri, ancestor_share_check=False)
-        runnable_rapp_specs, capabilities_incompatible_rapps = self._filter_capability_unavailable_rapps(compatible_rapps)
+        if affected is None:
+            checked_rapps = compatible_rapps
+        else:
+            classified = set(self._runnable_apps) | set(self._installable_apps) | set(self._noninstallable_rapps) | set(self._capabilities_filtered_apps)
+            checked_rapps = dict((name, rapp) for name, rapp in compatible_rapps.items() if name in affected or name not in classified)
+            invalid_rapps = dict((name, reason) for name, reason in invalid_rapps.items() if name in affected)
+            platform_incompatible_rapps = dict((name, rapp) for name, rapp in platform_incompatible_rapps.items() if name in affected)
+        runnable_rapp_specs, capabilities_incompatible_rapps = self._filter_capability_unavailable_rapps(checked_rapps, init_capabilities=affected is None)
 
         if self._param['auto_rapp_installation']:
             runnable_rapp_specs, installable_rapp_specs, noninstallable_rapp_specs = self._determine_installed_rapps(runnable_rapp_specs)
@@ -243,6 +263,16 @@ class RappManager(object):
         platform_filtered_rapps = platform_incompatible_rapps.keys()
         capabilities_filtered_rapps = capabilities_incompatible_rapps.keys()
 
+        if affected is not None:
+            # unaffected rapps keep their last classification
+            kept = set(compatible_rapps) - set(checked_rapps)
+            runnable_rapps.update((name, rapp) for name, rapp in self._runnable_apps.items() if name in kept)
+            installable_rapps.update((name, rapp) for name, rapp in self._installable_apps.items() if name in kept)
+            noninstallable_rapps += [name for name in self._noninstallable_rapps if name in kept]
+            capabilities_filtered_rapps += [name for name in self._capabilities_filtered_apps if name in kept]
+            platform_filtered_rapps += [name for name in self._platform_filtered_apps if name not in affected]
+            invalid_rapps.update((name, reason) for name, reason in self._invalid_apps.items() if name not in affected)
+
         return (runnable_rapps, installable_rapps, noninstallable_rapps, platform_filtered_rapps, capabilities_filtered_rapps, invalid_rapps)
 
     def _configure_preferred_rapp_for_virtuals(self):
@@ -285,35 +315,38 @@ class RappManager(object):
         self._virtual_apps = v_rapps
         self._preferred = preferred
 
-    def _filter_capability_unavailable_rapps(self, compatible_rapps):
+    def _filter_capability_unavailable_rapps(self, compatible_rapps, init_capabilities=True):
         '''
           Filters out rapps which does not meet the platform's capability
 
           :params compatible_rapps: Platform compatible rapp dict
           :type compatible_rapplist: dict
+          :params init_capabilities: query the list of available capabilities again instead of using the last one
+          :type init_capabilities: bool
 
           :returns: runnable rapp, capability filtered rapp
           :rtype: dict, dict
         '''
-        is_caps_available = self._init_capabilities()  # First try initialise the list of available capabilities
+        if init_capabilities:
+            is_caps_available = self._init_capabilities()  # First try initialise the list of available capabilities
+        else:
+            is_caps_available = isinstance(self.caps_list, CapsList)
+        available_capabilities = self.caps_list.available_capabilities() if is_caps_available else frozenset([])
+        self._available_capabilities = available_capabilities
         capabilities_filtered_apps = {}
         runnable_apps = {}
 
-        # Then add runnable apps to list
+        # Then add runnable apps to list, the index knows which rapps require the missing capabilities
+        unused_runnable, missing_capabilities = self._indexer.filter_capabilities(available_capabilities, compatible_rapps.keys())
         for rapp_name, rapp in compatible_rapps.items():
-            if not is_caps_available:
-                if 'required_capabilities' in rapp.data:
-                    reason = "cannot be run, since capabilities are not available. Rapp will be excluded from the list of runnable apps."
-                    capabilities_filtered_apps[rapp_name] = reason
-                else:
-                    runnable_apps[rapp_name] = rapp
+            if rapp_name not in missing_capabilities:
+                runnable_apps[rapp_name] = rapp
+            elif not is_caps_available:
+                reason = "cannot be run, since capabilities are not available. Rapp will be excluded from the list of runnable apps."
+                capabilities_filtered_apps[rapp_name] = reason
             else:
-                try:
-                    self.caps_list.compatibility_check(rapp)
-                    runnable_apps[rapp_name] = rapp
-                except exceptions.MissingCapabilitiesException as e:
-                    reason = "cannot be run, since some required capabilities (" + str(e.missing_caps) + ") are not installed. Rapp will be excluded from the list of runnable rapps."
-                    capabilities_filtered_apps[rapp_name] = reason
+                reason = "cannot be run, since some required capabilities (" + ' '.join(sorted(missing_capabilities[rapp_name])) + ") are not installed. Rapp will be excluded from the list of runnable rapps."
+                capabilities_filtered_apps[rapp_name] = reason
         return runnable_apps, capabilities_filtered_apps
 
     def _determine_installed_rapps(self, rapps):
@@ -346,10 +379,71 @@ class RappManager(object):
 
         return (runnable_rapps, installable_rapps, noninstallable_rapps)
 
+    def _init_watcher(self):
+        '''
+          Watches the files of the indexed rapps and the local rapp repositories in a background thread.
+        '''
+        self._watcher = IndexWatcher(self._refresh_rapps, debounce=self._param['watch_rapps_debounce'])
+        self._watcher.watch(self._watched_paths())
+        self._watcher.start()
+        rospy.on_shutdown(self._watcher.stop)
+        rospy.loginfo("Rapp Manager : watching rapps for changes ..")
+
+    def _watched_paths(self):
+        paths = index_dependencies(self._indexer)
+        paths.update(rapp_repositories.get_local_base_paths())
+        return paths
+
+    def _refresh_rapps(self, changed_paths):
+        '''
+          Re-indexes the rapps after their files changed and checks the affected rapps again. Runs in the
+          thread of the watcher, the service callbacks keep using the old lists until the new ones are complete.
+          The indexer is refreshed in place under _indexer_lock, so an installation waits for it to complete.
+
+          :param changed_paths: the changed files
+          :type changed_paths: set
+        '''
+        rospy.loginfo("Rapp Manager : rapp files changed, re-indexing rapps...")
+        index = rapp_repositories.get_combined_index(package_whitelist=self._param['rapp_package_whitelist'], package_blacklist=self._param['rapp_package_blacklist'], live=True)
+        with self._indexer_lock:
+            # e.g. an edited launch file leaves the raw data of its rapp unchanged
+            edited = find_rapps_reading(self._indexer, changed_paths) | find_rapps_reading(index, changed_paths)
+            affected = self._indexer.refresh(index, edited)
+            self._watcher.watch(self._watched_paths())
+            affected.update(self._update_capabilities())
+            if not affected:
+                return
+            rospy.loginfo("Rapp Manager : rapps changed %s" % sorted(affected))
+            rapps = self._determine_runnable_rapps(affected)
+            with self._rapps_lock:
+                self._runnable_apps, self._installable_apps, self._noninstallable_rapps, self._platform_filtered_apps, self._capabilities_filtered_apps, self._invalid_apps = rapps
+                self._configure_preferred_rapp_for_virtuals()
+        if 'rapp_list' in self._publishers:
+            self._publish_rapp_list()
+            try:
+                self._publishers['incompatible_rapp_list'].publish([], [], self._platform_filtered_apps, self._capabilities_filtered_apps)
+            except rospy.exceptions.ROSException:  # publishing to a closed topic.
+                pass
+
+    def _update_capabilities(self):
+        '''
+          Queries the available capabilities again.
+
+          :returns: names of the rapps requiring a capability which appeared or disappeared since the last check
+          :rtype: set
+        '''
+        self._init_capabilities()
+        available_capabilities = self.caps_list.available_capabilities() if isinstance(self.caps_list, CapsList) else frozenset([])
+        changed = available_capabilities.symmetric_difference(self._available_capabilities)
+        if changed:
+            rospy.loginfo("Rapp Manager : capabilities changed %s" % sorted(changed))
+        return self._indexer.find_rapps_requiring(changed)
+
     def _init_capabilities(self):
         try:
             self.caps_list = CapsList()
         except exceptions.NotFoundException as e:
+            self.caps_list = {}
             if 'Timed out' in str(e) or "Couldn't find" in str(e):
                 rospy.loginfo("Rapp Manager : disabling apps requiring capabilities [%s]" % str(e))
             else:
@@ -479,6 +573,10 @@ class RappManager(object):
         return app_msg_list
 
     def _get_available_rapp_list(self):
+        with self._rapps_lock:
+            return self._get_available_rapp_list_unlocked()
+
+    def _get_available_rapp_list_unlocked(self):
         avail = {}
         for name, rapp in self._virtual_apps.items():
             avail[name] = rapp.to_msg()
@@ -573,11 +671,11 @@ class RappManager(object):
             rospy.logwarn("Rapp Manager : %s" % reason)
             return resp
 
-        # check if the app requires capabilities
-        caps_list = self.caps_list if 'required_capabilities' in rapp.data else None
-        if caps_list:
+        # check if the app requires capabilities, the watcher may replace the list of capabilities meanwhile
+        caps_list = self.caps_list
+        if caps_list and 'required_capabilities' in rapp.data:
             rospy.loginfo("Rapp Manager : Starting required capabilities.")
-            result, message = start_capabilities_from_caps_list(rapp.data['required_capabilities'], self.caps_list)
+            result, message = start_capabilities_from_caps_list(rapp.data['required_capabilities'], caps_list)
 
             if not result:  # if not none, it failed to start capabilities
                 resp.started = False
@@ -592,7 +690,7 @@ class RappManager(object):
                                                            req.parameters,
                                                            self._param['app_output_to_screen'],
                                                            self._param['simulation'],
-                                                           self.caps_list)
+                                                           caps_list)
 
         rospy.loginfo("Rapp Manager : Remote Name [%s]" % self._remote_name)
 
@@ -784,12 +882,14 @@ class RappManager(object):
 
         if self._param['auto_rapp_installation']:
             rospy.loginfo("Rapp Manager : Installing rapp '" + rapp.data['name'] + "'")
-            success, reason = rapp.install(self._dependency_checker)
+            with self._indexer_lock:  # the watcher may be refreshing the indexer of the dependency checker
+                success, reason = rapp.install(self._dependency_checker)
             if success:
                 rospy.loginfo("Rapp Manager : Rapp '" + rapp.data['name'] + "'has been installed.")
                 # move rapp from installable to runnable
-                self._runnable_apps[requested_rapp_name] = rapp
-                del self._installable_apps[requested_rapp_name]
+                with self._rapps_lock:
+                    self._runnable_apps[requested_rapp_name] = rapp
+                    self._installable_apps.pop(requested_rapp_name, None)
                 # TODO : consider calling publish_rapp_list if we split publishing runnable and installed there.
 
                 success = True
@@ -47,4 +47,8 @@ def setup_ros_parameters():
     # Simulation
     param['simulation'] = rospy.get_param('~simulation', False)
 
+    # Re-index rapps when their files change
+    param['watch_rapps'] = rospy.get_param('~watch_rapps', False)
+    param['watch_rapps_debounce'] = rospy.get_param('~watch_rapps_debounce', 1.0)
+
     return param
@@ -10,6 +10,8 @@ import roslib.names
 import rocon_std_msgs.msg as rocon_std_msgs
 import rocon_app_manager_msgs.msg as rapp_manager_msgs
 import rocon_python_comms
+import rocon_app_utilities.tarball_resources as tarball_resources
+from rocon_app_utilities.interface_index import CONNECTION_TYPES
 import copy
 from .exceptions import MissingCapabilitiesException
 
@@ -135,7 +137,8 @@ def prepare_launcher(data, public_parameters, application_namespace, gateway_nam
     '''
     # Create modified roslaunch file include the application namespace (robot name + 'application')
 
-    launch_text = _prepare_launch_text(data['launch'],
+    # the launch file of a rapp from an index archive is only written to disk now
+    launch_text = _prepare_launch_text(tarball_resources.materialize(data['launch']),
                                        data['launch_args'],
                                        public_parameters,
                                        application_namespace,
@@ -194,8 +197,8 @@ def apply_remapping_rules_from_start_app_request(launch_spec, data, remappings,
 
       :param launch_spec: rapp launch specification
       :type launch_spec: roslaunch.parent.ROSLaunchParent
-      :param data: rapp data
-      :type data: dict
+      :param data: rapp data, including the public_interface_table compiled when it was loaded
+      :type data: rocon_app_utilities.rapp_loader.RappSpecData
       :param remapping: rules for the app flips.
       :type remapping: list of rocon_std_msgs.msg.Remapping values.
       :param application_namespace: unique name granted indirectly via the gateways, we namespace everything under this
@@ -204,55 +207,46 @@ def apply_remapping_rules_from_start_app_request(launch_spec, data, remappings,
       :returns: Remapped public_interface dictionary
       :rtype: { connection_type: Remapping topic list}
     '''
-    connections = {}
+    connections = dict((connection_type, []) for connection_type in CONNECTION_TYPES)
     published_interfaces = []
 
-    # Prefix with robot name by default (later pass in remap argument)
-    remap_from_list = [remapping.remap_from for remapping in remappings]
-    remap_to_list = [remapping.remap_to for remapping in remappings]
-
-    for connection_type in ['publishers', 'subscribers', 'services', 'action_clients', 'action_servers']:
-        connections[connection_type] = []
-        for t in data['public_interface'][connection_type]:
-            if not type(t) is dict:
-                rospy.logwarn("Rapp Manager : Public interface has deprecated format. Please update %s includes name and type" % t)
-                interface_name = t
-                interface_type = 'unknown'
-            else:
-                interface_name = t['name']
-                interface_type = t['type']
-            # this is ugly
-            published_interface = rapp_manager_msgs.PublishedInterface(
-                    interface=rapp_manager_msgs.PublicInterface(plurality_converter[connection_type], interface_type, interface_name),
-                    name=''
-            )
-            remapped_name = None
+    # Prefix with robot name by default (later pass in remap argument). The first rule of a name applies.
+    remap_to = {}
+    for remapping in remappings:
+        remap_to.setdefault(remapping.remap_from, remapping.remap_to)
+
+    # normalised once when the rapp specification was loaded
+    for connection in data['public_interface_table']:
+        interface_name = connection.name
+        published_interface = rapp_manager_msgs.PublishedInterface(
+                interface=rapp_manager_msgs.PublicInterface(plurality_converter[connection.connection_type], connection.msg_type or 'unknown', interface_name),
+                name=''
+        )
+        if interface_name in remap_to:
             # Now we push the rapp launcher down into the prefixed
             # namespace, so just use it directly
-            indices = [i for i, x in enumerate(remap_from_list) if x == interface_name]
-            if indices:
-                if roslib.names.is_global(remap_to_list[indices[0]]):
-                    remapped_name = remap_to_list[indices[0]]
-                else:
-                    remapped_name = '/' + application_namespace.strip("/") + "/" + remap_to_list[indices[0]]
-                remapped_name = "/" + remapped_name.lstrip("/")  # ensure only one leading slash
-                for N in launch_spec.config.nodes:
-                    N.remap_args.append((interface_name, remapped_name))
-                connections[connection_type].append(remapped_name)
-                published_interface.name = remapped_name
+            if roslib.names.is_global(remap_to[interface_name]):
+                remapped_name = remap_to[interface_name]
             else:
-                # don't pass these in as remapping rules - they should map fine for the node as is
-                # just by getting pushed down the namespace.
-                #     https://github.com/robotics-in-concert/rocon_app_platform/issues/61
-                # we still need to pass them back to register for flipping though.
-                if roslib.names.is_global(interface_name):
-                    flipped_name = interface_name
-                else:
-                    flipped_name = application_namespace + '/' + interface_name
-                flipped_name = "/" + flipped_name.lstrip("/")  # ensure only one leading slash
-                connections[connection_type].append(flipped_name)
-                published_interface.name = flipped_name
-            published_interfaces.append(published_interface)
+                remapped_name = '/' + application_namespace.strip("/") + "/" + remap_to[interface_name]
+            remapped_name = "/" + remapped_name.lstrip("/")  # ensure only one leading slash
+            for N in launch_spec.config.nodes:
+                N.remap_args.append((interface_name, remapped_name))
+            connections[connection.connection_type].append(remapped_name)
+            published_interface.name = remapped_name
+        else:
+            # don't pass these in as remapping rules - they should map fine for the node as is
+            # just by getting pushed down the namespace.
+            #     https://github.com/robotics-in-concert/rocon_app_platform/issues/61
+            # we still need to pass them back to register for flipping though.
+            if connection.is_global:
+                flipped_name = interface_name
+            else:
+                flipped_name = application_namespace + '/' + interface_name
+            flipped_name = "/" + flipped_name.lstrip("/")  # ensure only one leading slash
+            connections[connection.connection_type].append(flipped_name)
+            published_interface.name = flipped_name
+        published_interfaces.append(published_interface)
     return connections, published_interfaces
 
 
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+#################################################################################
+
+from __future__ import division, print_function
+
+#################################################################################
+# Capability Index
+#################################################################################
+
+
+def required_capability_names(required_capabilities):
+    '''
+      Names of the capabilities a rapp requires.
+
+      :param required_capabilities: 'required_capabilities' of a rapp, dicts with at least a 'name'
+      :type required_capabilities: list
+
+      :rtype: frozenset
+    '''
+    return frozenset(c['name'] if isinstance(c, dict) else c for c in required_capabilities or [])
+
+
+class CapabilityIndex(object):
+    '''
+      Inverted index of the capabilities required by rapps. The rapps runnable with a set of available
+      capabilities are all rapps minus the buckets of the unavailable capabilities, so a check is a few set
+      operations per capability rather than a loop over the requirements of every rapp.
+    '''
+
+    __slots__ = ['required', '_by_capability']
+
+    def __init__(self):
+        self.required = {}  # resource_name : frozenset of required capability names
+        self._by_capability = {}  # capability name : set of resource names
+
+    def add(self, resource_name, required_capabilities):
+        '''
+          Adds a rapp.
+
+          :param resource_name: rapp name
+          :type resource_name: str
+          :param required_capabilities: its 'required_capabilities'
+          :type required_capabilities: list
+        '''
+        self.remove(resource_name)
+        required = required_capability_names(required_capabilities)
+        self.required[resource_name] = required
+        for capability in required:
+            self._by_capability.setdefault(capability, set([])).add(resource_name)
+
+    def remove(self, resource_name):
+        for capability in self.required.pop(resource_name, ()):
+            bucket = self._by_capability[capability]
+            bucket.discard(resource_name)
+            if not bucket:
+                del self._by_capability[capability]
+
+    @property
+    def capabilities(self):
+        '''
+          names of all capabilities required by any rapp
+
+          :rtype: set
+        '''
+        return set(self._by_capability)
+
+    def requiring(self, capabilities):
+        '''
+          returns the rapps requiring any of the given capabilities, i.e. the ones to re-check when
+          these capabilities appear or disappear
+
+          :param capabilities: capability names
+          :type capabilities: iterable
+
+          :rtype: set
+        '''
+        rapps = set([])
+        for capability in capabilities:
+            rapps.update(self._by_capability.get(capability, ()))
+        return rapps
+
+    def unrunnable(self, available):
+        '''
+          returns the rapps requiring a capability which is not available
+
+          :param available: names of the available capabilities
+          :type available: set
+
+          :rtype: set
+        '''
+        return self.requiring(c for c in self._by_capability if c not in available)
+
+    def runnable(self, available):
+        '''
+          returns the rapps whose required capabilities are all available
+
+          :param available: names of the available capabilities
+          :type available: set
+
+          :rtype: set
+        '''
+        return set(self.required) - self.unrunnable(available)
+
+    def missing(self, resource_name, available):
+        '''
+          returns the required capabilities of a rapp which are not available
+
+          :raises: KeyError: the rapp is not indexed
+        '''
+        return self.required[resource_name] - frozenset(available)
+
+    def unlocked_by(self, capability, available):
+        '''
+          returns the rapps which are not runnable with the available capabilities, but would be if the
+          given capability was available too
+
+          :param capability: capability name
+          :type capability: str
+          :param available: names of the available capabilities
+          :type available: set
+
+          :rtype: set
+        '''
+        if capability in available:
+            return set([])
+        unlocked = set([])
+        for resource_name in self._by_capability.get(capability, ()):
+            if all(c == capability or c in available for c in self.required[resource_name]):
+                unlocked.add(resource_name)
+        return unlocked
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+#################################################################################
+'''
+ Interning of the strings and nested structures of loaded rapps, so that large
+ indices hold every distinct name, path and public interface only once.
+'''
+#################################################################################
+
+from __future__ import division, print_function
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+try:
+    from sys import intern as _intern_str
+except ImportError:
+    _intern_str = intern  # python2 builtin, str only
+import weakref
+
+from .yaml_cache import FrozenDict, FrozenList
+
+
+class InternedDict(FrozenDict):
+    '''
+      read-only dict pooled by an InternTable, released with the last rapp holding it
+    '''
+    __slots__ = ['__weakref__']
+
+
+class InternedList(FrozenList):
+    '''
+      read-only list pooled by an InternTable, see InternedDict
+    '''
+    __slots__ = ['__weakref__']
+
+
+class InternTable(object):
+    '''
+      Pool of strings and of the nested dicts and lists of rapp data (e.g. public interfaces and parameters).
+      Equal structures are replaced with the one pooled first, a read-only InternedDict or InternedList shared
+      by every rapp holding an equal value, as inherited values already are (see :class:`.rapp.LayeredRappData`).
+
+      The table only references the pooled structures weakly, so they are released together with the index of
+      the rapps holding them, e.g. when the rapp manager re-indexes. Strings are interned by python, which
+      releases them as well. Unicode strings of python 2 can not be referenced weakly and are not pooled.
+    '''
+    __slots__ = ['_structures']
+
+    def __init__(self):
+        self._structures = weakref.WeakValueDictionary()  # content key : pooled InternedDict or InternedList
+
+    def __len__(self):
+        return len(self._structures)
+
+    def clear(self):
+        self._structures = weakref.WeakValueDictionary()
+
+    def intern_string(self, value):
+        '''
+          returns the pooled string equal to the given one
+
+          :param value: a string, anything else is returned as is
+          :type value: str
+        '''
+        if type(value) is str:
+            return _intern_str(value)
+        return value
+
+    def intern(self, value):
+        '''
+          returns the pooled value equal to the given one. Strings, dicts and lists are pooled, including the
+          ones nested in dicts and lists, anything else is returned as is. Pooled dicts and lists are read-only.
+        '''
+        return self._intern(value)[0]
+
+    def intern_data(self, data):
+        '''
+          returns a new dict with interned keys and values. The dict itself is not pooled, so it stays private
+          to the caller, e.g. the raw data of a single rapp.
+
+          :param data: rapp data, e.g. as loaded from a rapp file
+          :type data: dict
+
+          :rtype: dict
+        '''
+        return dict((self.intern_string(k), self.intern(v)) for k, v in data.items())
+
+    def intern_overlay(self, data, base):
+        '''
+          Interns data which mostly equals a base dict with the same keys, e.g. the yaml data of a rapp whose raw
+          data only differs in the loaded resources. Only the differing values are held next to the base.
+
+          :param data: the data
+          :type data: dict
+          :param base: interned dict the data is compared to, shared and not copied
+          :type base: dict
+
+          :returns: read-only overlay, or an interned dict if the keys differ
+          :rtype: Mapping
+        '''
+        if len(data) != len(base) or any(k not in base for k in data):
+            return self.intern_data(data)
+        return OverlayData(base, tuple((self.intern_string(k), self.intern(v)) for k, v in data.items() if base[k] != v))
+
+    def _intern(self, value):
+        '''
+          returns the pooled value and its content key, None if the value can not be pooled. Dicts and lists which
+          can not be pooled, e.g. because they hold a set, are returned as private copies.
+        '''
+        if isinstance(value, str):
+            value = self.intern_string(value)
+            return value, (str, value)
+        if isinstance(value, dict):
+            items = [(self._intern(k), self._intern(v)) for k, v in value.items()]
+            contents = [(k[0], v[0]) for k, v in items]
+            if any(k[1] is None or v[1] is None for k, v in items):
+                return dict(contents), None
+            key = (dict, frozenset((k[1], v[1]) for k, v in items))
+            cls = InternedDict
+        elif isinstance(value, list):
+            items = [self._intern(v) for v in value]
+            contents = [v[0] for v in items]
+            if any(v[1] is None for v in items):
+                return contents, None
+            key = (list, tuple(v[1] for v in items))
+            cls = InternedList
+        else:
+            try:
+                hash(value)
+            except TypeError:  # unhashable, e.g. a set
+                return value, None
+            return value, (type(value), value)
+        pooled = self._structures.get(key)
+        if pooled is None:
+            pooled = self._structures[key] = cls(contents)
+        return pooled, key
+
+
+class OverlayData(Mapping):
+    '''
+      Read-only mapping holding only the values which differ from a base mapping with the same keys.
+    '''
+    __slots__ = ['_base', '_overrides']
+
+    def __init__(self, base, overrides):
+        '''
+          :param base: the base mapping
+          :type base: Mapping
+          :param overrides: differing values as (key, value) pairs, few of them as they are searched linearly
+          :type overrides: tuple
+        '''
+        self._base = base
+        self._overrides = overrides
+
+    def __getitem__(self, key):
+        for k, v in self._overrides:
+            if k == key:
+                return v
+        return self._base[key]
+
+    def __contains__(self, key):
+        return key in self._base
+
+    def __iter__(self):
+        return iter(self._base)
+
+    def __len__(self):
+        return len(self._base)
+
+    def __setitem__(self, key, value):
+        raise TypeError('interned rapp data is read-only, use copy() to get a writable dict')
+
+    __delitem__ = __setitem__
+
+    def __repr__(self):
+        return repr(self.copy())
+
+    def copy(self):
+        '''
+          returns the data as a new dict
+
+          :rtype: dict
+        '''
+        return dict((k, self[k]) for k in self._base)
+
+    def __reduce__(self):
+        return (dict, (self.copy(),))
+
+
+RAPP_STRINGS = InternTable()  # shared by all rapps loaded in this process, holds no rapp data alive
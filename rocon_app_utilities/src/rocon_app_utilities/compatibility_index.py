@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+#################################################################################
+
+from __future__ import division, print_function
+
+import rocon_uri
+
+#################################################################################
+# Compatibility Index
+#################################################################################
+
+URI_FIELDS = ['hardware_platform', 'name', 'application_framework', 'operating_system']
+
+
+def parse_compatibility(uri):
+    '''
+      Parses a rocon uri into the per field value sets the compatibility check works on.
+
+      :param uri: rocon uri string
+      :type uri: str
+
+      :returns: one frozenset of values per field in URI_FIELDS, None for a wildcard field
+      :rtype: tuple
+
+      :raises: rocon_uri.exceptions.RoconURIValueError: invalid rocon uri
+    '''
+    parsed = rocon_uri.parse(uri)
+    fields = []
+    for field_name in URI_FIELDS:
+        field = getattr(parsed, field_name)
+        values = frozenset(field.list)
+        fields.append(None if field.string == '*' or '*' in values else values)
+    return tuple(fields)
+
+
+def is_compatible_parsed(a, b):
+    '''
+      Same semantics as rocon_uri.is_compatible, on uris parsed by parse_compatibility.
+    '''
+    for values_a, values_b in zip(a, b):
+        if values_a is not None and values_b is not None and values_a.isdisjoint(values_b):
+            return False
+    return True
+
+
+class CompatibilityIndex(object):
+    '''
+      Buckets rapps by the values of each field of their compatibility rocon uri. A query only unions the
+      buckets of the queried values with the wildcard bucket per field and intersects the fields, so neither
+      the rapp uris nor the query are parsed more than once.
+    '''
+
+    __slots__ = ['parsed', 'invalid', '_buckets', '_wildcards', '_all', '_uri_cache']
+
+    def __init__(self):
+        self.parsed = {}  # resource_name : parsed compatibility
+        self.invalid = {}  # resource_name : reason why the compatibility cannot be parsed
+        self._buckets = [{} for unused_field in URI_FIELDS]  # per field, value : set of resource names
+        self._wildcards = [set([]) for unused_field in URI_FIELDS]  # per field, resource names matching anything
+        self._all = set([])
+        self._uri_cache = {}  # uri string : parsed uri or RoconURIValueError, shared by all rapps
+
+    def parse(self, uri):
+        '''
+          Memoised parse_compatibility.
+
+          :raises: rocon_uri.exceptions.RoconURIValueError: invalid rocon uri
+        '''
+        try:
+            parsed = self._uri_cache[uri]
+        except KeyError:
+            try:
+                parsed = parse_compatibility(uri)
+            except rocon_uri.exceptions.RoconURIValueError as e:
+                parsed = e
+            self._uri_cache[uri] = parsed
+        if isinstance(parsed, Exception):
+            raise parsed
+        return parsed
+
+    def add(self, resource_name, compatibility):
+        '''
+          Adds a rapp. A rapp without compatibility is compatible with anything.
+
+          :param resource_name: rapp name
+          :type resource_name: str
+          :param compatibility: its compatibility rocon uri
+          :type compatibility: str
+        '''
+        self.remove(resource_name)
+        if compatibility:
+            try:
+                parsed = self.parse(compatibility)
+            except rocon_uri.exceptions.RoconURIValueError as e:
+                self.invalid[resource_name] = str(e)
+                return
+        else:
+            parsed = (None,) * len(URI_FIELDS)
+        self.parsed[resource_name] = parsed
+        self._all.add(resource_name)
+        for buckets, wildcards, values in zip(self._buckets, self._wildcards, parsed):
+            if values is None:
+                wildcards.add(resource_name)
+            else:
+                for value in values:
+                    buckets.setdefault(value, set([])).add(resource_name)
+
+    def remove(self, resource_name):
+        '''
+          Removes a rapp if it is indexed.
+
+          :param resource_name: rapp name
+          :type resource_name: str
+        '''
+        self.invalid.pop(resource_name, None)
+        parsed = self.parsed.pop(resource_name, None)
+        if parsed is None:
+            return
+        self._all.discard(resource_name)
+        for buckets, wildcards, values in zip(self._buckets, self._wildcards, parsed):
+            if values is None:
+                wildcards.discard(resource_name)
+            else:
+                for value in values:
+                    bucket = buckets[value]
+                    bucket.discard(resource_name)
+                    if not bucket:
+                        del buckets[value]
+
+    def query(self, uri):
+        '''
+          Splits the indexed rapps by their compatibility with the given uri.
+
+          :param uri: rocon uri
+          :type uri: str
+
+          :returns: compatible rapp names, incompatible rapp names, {rapp name: reason} of invalid rapps
+          :rtype: set, set, dict
+        '''
+        try:
+            parsed = self.parse(uri)
+        except rocon_uri.exceptions.RoconURIValueError as e:
+            # same as checking every rapp against an invalid uri
+            invalid = dict((resource_name, str(e)) for resource_name in self._all)
+            invalid.update(self.invalid)
+            return set([]), set([]), invalid
+
+        compatible = None
+        for buckets, wildcards, values in zip(self._buckets, self._wildcards, parsed):
+            if values is None:
+                continue
+            candidates = set(wildcards)
+            for value in values:
+                candidates.update(buckets.get(value, ()))
+            compatible = candidates if compatible is None else compatible & candidates
+            if not compatible:
+                break
+        if compatible is None:
+            compatible = set(self._all)
+        return compatible, self._all - compatible, dict(self.invalid)
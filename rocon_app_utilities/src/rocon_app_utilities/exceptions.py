@@ -50,7 +50,7 @@ class RappCyclicChainException(RappException):
     def __init__(self, stack):
         self.stack = stack
 
-    def __strc__(self):
+    def __str__(self):
         return str(self.stack)
 
 
@@ -87,6 +87,13 @@ class RappMalformedException(RappException):
     '''
 
 
+class UnsupportedArchiveCodecException(RappException):
+    '''
+      If an index archive is of a codec whose module is not installed (e.g. lzma for xz).
+    '''
+    pass
+
+
 class UnsupportedPlatformException(Exception):
     '''
       If running on a platform not supported by rosdep.
@@ -105,3 +112,24 @@ class XmlParseException(Exception):
       Error with the XML syntax (e.g. invalid attribute/value combinations)
     '''
     pass
+
+
+class InvalidSnapshotException(Exception):
+    '''
+      If an index snapshot is truncated, corrupted or of another version.
+    '''
+    pass
+
+
+class InvalidDeltaException(Exception):
+    '''
+      If an index delta is corrupted or does not apply to the given index archive.
+    '''
+    pass
+
+
+class InvalidIndexShardsException(Exception):
+    '''
+      If the manifest of a sharded index is corrupted or of another version.
+    '''
+    pass
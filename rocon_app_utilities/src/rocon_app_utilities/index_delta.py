@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+#################################################################################
+'''
+ Deltas between two versions of an index archive.
+
+ A delta is a tarball holding the members which were added or changed in the new
+ archive and a manifest (DELTA_MANIFEST) listing the removed members, the rapps
+ affected by the change and the digests (see tarball_resources.members_digest)
+ of both versions. Applying it to the old archive yields an archive with exactly
+ the members of the new one.
+'''
+#################################################################################
+
+from __future__ import division, print_function
+
+import os
+import yaml
+
+from . import tarball_resources
+from .exceptions import InvalidDeltaException
+from .indexer import read_tarball
+
+import logging
+import sys
+logger = logging.getLogger('index_delta')
+logger.addHandler(logging.StreamHandler(sys.stderr))
+#logger.setLevel(logging.DEBUG)
+
+DELTA_MANIFEST = 'index.delta.yaml'
+# Bump whenever the layout of the manifest changes
+DELTA_VERSION = 1
+
+# Suffix of the delta archives by codec
+DELTA_EXTENSIONS = dict((codec, extension.replace('.index.', '.delta.')) for codec, extension in tarball_resources.ARCHIVE_EXTENSIONS.items())
+
+
+def is_delta(url_or_uri):
+    '''
+      :returns: true, if URI or URL ends with '.delta.tar.gz', '.delta.tar.xz' or '.delta.tar'
+      :rtype: bool
+    '''
+    return any(url_or_uri.endswith(extension) for extension in DELTA_EXTENSIONS.values())
+
+
+def delta_url_for_index(index_url):
+    '''
+      Returns where the delta to the given index archive is published by convention,
+      i.e. next to it as '<name>.delta.tar.gz' for '<name>.index.tar.gz'.
+    '''
+    for codec, extension in tarball_resources.ARCHIVE_EXTENSIONS.items():
+        if index_url.endswith(extension):
+            return index_url[:-len(extension)] + DELTA_EXTENSIONS[codec]
+    return None
+
+
+def _rapp_members(index_filename):
+    '''
+      :returns: per rapp, the names of the members its definition depends on
+      :rtype: {resource_name: set}
+    '''
+    RESOURCE_KEYS = ['icon', 'public_interface', 'public_parameters', 'launch']
+
+    index = read_tarball(name=index_filename)
+    resources = tarball_resources.TarballResources.from_tarball(name=index_filename)
+    rapp_members = {}
+    for resource_name, (path, unused_package) in index.raw_data_path.items():
+        # the package.xml is shared by all rapps of a package, changes of it are listed as resources only
+        paths = [path]
+        rapp = index.raw_data.get(resource_name)
+        if rapp is not None:
+            # relative to the rapp file as written, resource names of other packages are not members
+            paths.extend(os.path.normpath(os.path.join(os.path.dirname(path), v)) for k, v in rapp.yaml_data.items() if k in RESOURCE_KEYS and v)
+        rapp_members[resource_name] = set(os.path.relpath(p, resources.root) for p in paths if resources.exists(p))
+    return rapp_members
+
+
+def diff_archives(old_filename, new_filename, delta_filename, codec='gz'):
+    '''
+      Writes the delta which turns the old index archive into the new one.
+
+      :param old_filename: path of the old index archive
+      :type old_filename: str
+      :param new_filename: path of the new index archive
+      :type new_filename: str
+      :param delta_filename: path of the delta to write
+      :type delta_filename: str
+      :param codec: compression of the delta, one of tarball_resources.ARCHIVE_EXTENSIONS
+      :type codec: str
+
+      :returns: the manifest of the delta
+      :rtype: dict
+    '''
+    old_members = tarball_resources.TarballResources.from_tarball(name=old_filename).members()
+    new_members = tarball_resources.TarballResources.from_tarball(name=new_filename).members()
+    changed_members = set(name for name, data in new_members.items() if old_members.get(name) != data)
+    removed_members = set(old_members) - set(new_members)
+
+    old_rapps = _rapp_members(old_filename)
+    new_rapps = _rapp_members(new_filename)
+    touched = changed_members | removed_members
+    manifest = {'version': DELTA_VERSION,
+                'base': tarball_resources.members_digest(old_members),
+                'target': tarball_resources.members_digest(new_members),
+                'removed': sorted(removed_members),
+                'resources': {'added': sorted(changed_members - set(old_members)),
+                              'changed': sorted(changed_members & set(old_members)),
+                              'removed': sorted(removed_members)},
+                'rapps': {'added': sorted(set(new_rapps) - set(old_rapps)),
+                          'changed': sorted(name for name in set(new_rapps) & set(old_rapps) if new_rapps[name] != old_rapps[name] or new_rapps[name] & touched),
+                          'removed': sorted(set(old_rapps) - set(new_rapps))}}
+
+    members = [(name, new_members[name]) for name in changed_members]
+    members.append((DELTA_MANIFEST, yaml.safe_dump(manifest, default_flow_style=False).encode('utf-8')))
+    tarball_resources.write_archive(delta_filename, members, codec)
+    logger.debug("diff_archives() %d changed and %d removed members to '%s'" % (len(changed_members), len(removed_members), delta_filename))
+    return manifest
+
+
+def read_delta(name=None, fileobj=None):
+    '''
+      Reads a delta.
+
+      :param name: the pathname of the delta
+      :type name: str
+      :param fileobj: alternative to a file object opened for name
+      :type fileobj: file
+
+      :returns: the manifest and the contents of the added or changed members
+      :rtype: dict, {str: bytes}
+
+      :raises: InvalidDeltaException: it is no delta of a supported version
+    '''
+    members = dict(tarball_resources.TarballResources.from_tarball(name=name, fileobj=fileobj).members())
+    try:
+        manifest = yaml.safe_load(members.pop(DELTA_MANIFEST))
+    except KeyError:
+        raise InvalidDeltaException('%s is missing' % DELTA_MANIFEST)
+    if not isinstance(manifest, dict) or manifest.get('version') != DELTA_VERSION:
+        raise InvalidDeltaException('unsupported delta version')
+    return manifest, members
+
+
+def apply_delta(index_filename, manifest, delta_members, filename=None, codec='gz'):
+    '''
+      Applies a delta to an index archive.
+
+      :param index_filename: path of the index archive the delta was taken from
+      :type index_filename: str
+      :param manifest: manifest of the delta, see read_delta
+      :type manifest: dict
+      :param delta_members: contents of the members of the delta, see read_delta
+      :type delta_members: {str: bytes}
+      :param filename: path of the resulting archive, defaults to index_filename
+      :type filename: str
+      :param codec: compression of the resulting archive
+      :type codec: str
+
+      :raises: InvalidDeltaException: the delta was taken from a different version of the archive or
+               does not yield the expected version
+    '''
+    # archives are reproducible, so the members fully determine the result
+    members = dict(tarball_resources.TarballResources.from_tarball(name=index_filename).members())
+    digest = tarball_resources.members_digest(members)
+    if digest == manifest['target'] and not filename:
+        return  # applied already
+    if digest != manifest['base']:
+        raise InvalidDeltaException("delta does not apply to '%s'" % index_filename)
+    for name in manifest['removed']:
+        members.pop(name, None)
+    members.update(delta_members)
+    if tarball_resources.members_digest(members) != manifest['target']:
+        raise InvalidDeltaException("applying the delta to '%s' does not yield the expected index" % index_filename)
+    tarball_resources.write_archive(filename or index_filename, members.items(), codec)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+#################################################################################
+'''
+ Layered view of the indices of several rapp repositories.
+'''
+#################################################################################
+
+from __future__ import division, print_function
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+class IndexLayers(Mapping):
+    '''
+      Read-only, priority ordered stack of the per source mappings of a combined index, e.g. the raw rapps of
+      every rapp repository. Layers are referenced, not copied, and must not change once pushed. A key is taken
+      from the topmost layer holding it and shadows that key in the layers below.
+
+      The topmost layer of every key is indexed on the first lookup, so pushing a layer is constant time and
+      lookups are too. Pushing onto an already indexed stack only indexes the keys of the new layer.
+    '''
+    __slots__ = ['_layers', '_owner']
+
+    def __init__(self, layers=None):
+        '''
+          :param layers: sources and their mappings, lowest priority first
+          :type layers: [(str, Mapping)]
+        '''
+        self._layers = []
+        self._owner = None  # key : position of the topmost layer holding it, None until first lookup
+        for source, mapping in layers or []:
+            self.push(mapping, source)
+
+    def push(self, mapping, source=None):
+        '''
+          Puts a layer on top of the others.
+
+          :param mapping: the layer
+          :type mapping: Mapping
+          :param source: where the layer comes from, e.g. the uri of a rapp repository
+          :type source: str
+        '''
+        self._layers.append((source, mapping))
+        if self._owner is not None:
+            self._owner.update(dict.fromkeys(mapping, len(self._layers) - 1))
+
+    def _owners(self):
+        if self._owner is None:
+            owner = {}
+            for position, (unused_source, mapping) in enumerate(self._layers):
+                owner.update(dict.fromkeys(mapping, position))
+            self._owner = owner
+        return self._owner
+
+    def __getitem__(self, key):
+        return self._layers[self._owners()[key]][1][key]
+
+    def __contains__(self, key):
+        return key in self._owners()
+
+    def __iter__(self):
+        return iter(self._owners())
+
+    def __len__(self):
+        return len(self._owners())
+
+    def __setitem__(self, key, value):
+        raise TypeError('layered index is read-only, push a layer instead')
+
+    __delitem__ = __setitem__
+
+    def __repr__(self):
+        return repr(self.copy())
+
+    def copy(self):
+        '''
+          returns the merged layers as a new dict
+
+          :rtype: dict
+        '''
+        return dict((k, self[k]) for k in self._owners())
+
+    @property
+    def sources(self):
+        '''
+          sources of the layers, topmost first
+
+          :rtype: [str]
+        '''
+        return [source for source, unused_mapping in reversed(self._layers)]
+
+    def layer_of(self, key):
+        '''
+          returns the mapping of the layer the key is taken from
+
+          :raises: KeyError: no layer holds the key
+        '''
+        return self._layers[self._owners()[key]][1]
+
+    def source_of(self, key):
+        '''
+          returns the source of the layer the key is taken from
+
+          :raises: KeyError: no layer holds the key
+        '''
+        return self._layers[self._owners()[key]][0]
+
+    def shadowed(self, key):
+        '''
+          returns the sources of the lower layers which also hold the key, topmost first
+
+          :rtype: [str]
+        '''
+        position = self._owners().get(key)
+        if position is None:
+            return []
+        return [source for source, mapping in reversed(self._layers[:position]) if key in mapping]
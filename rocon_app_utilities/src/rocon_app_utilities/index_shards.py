@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+#################################################################################
+'''
+ Indices sharded per package.
+
+ A sharded index is a small manifest ('<name>.index.yaml') listing the packages
+ of a rapp tree, and one index archive per package next to it
+ ('<name>.shards/<package>.index.tar.gz'). Loading it with a package whitelist or
+ blacklist only fetches and parses the archives of the selected packages.
+'''
+#################################################################################
+
+from __future__ import division, print_function
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import BytesIO as StringIO
+import os
+import tempfile
+import yaml
+from rosdistro.loader import load_url
+
+from . import tarball_resources
+from .exceptions import InvalidIndexShardsException
+from .indexer import RappIndexer, read_tarball
+
+import logging
+import sys
+logger = logging.getLogger('index_shards')
+logger.addHandler(logging.StreamHandler(sys.stderr))
+#logger.setLevel(logging.DEBUG)
+
+SHARDS_MANIFEST_EXTENSION = '.index.yaml'
+SHARDS_DIRECTORY_EXTENSION = '.shards'
+# Bump whenever the layout of the manifest changes
+SHARDS_VERSION = 1
+
+
+def is_sharded_index(url_or_uri):
+    '''
+      :returns: true, if URI or URL ends with '.index.yaml'
+      :rtype: bool
+    '''
+    return url_or_uri.endswith(SHARDS_MANIFEST_EXTENSION)
+
+
+def shard_url(manifest_url, archive):
+    '''
+      Returns where an archive listed in a manifest is published, i.e. '<name>.shards/<archive>' next to
+      '<name>.index.yaml'.
+    '''
+    return manifest_url[:-len(SHARDS_MANIFEST_EXTENSION)] + SHARDS_DIRECTORY_EXTENSION + '/' + archive
+
+
+def write_shards(index, filename_prefix, codec='gz'):
+    '''
+      Writes an index as a manifest and one index archive per package. The archives are as reproducible as
+      the ones of write_tarball, so unchanged packages keep their digest.
+
+      :param index: the index
+      :type index: rocon_app_utilities.RappIndexer
+      :param filename_prefix: the pathname of the manifest without the suffix '.index.yaml'
+      :type filename_prefix: str
+      :param codec: compression of the archives, one of tarball_resources.ARCHIVE_EXTENSIONS
+      :type codec: str
+
+      :returns: the pathname of the manifest
+      :rtype: str
+    '''
+    packages = {}
+    for resource_name, rapp in index.raw_data.items():
+        packages.setdefault(rapp.package.name, {})[resource_name] = rapp
+
+    shards_path = filename_prefix + SHARDS_DIRECTORY_EXTENSION
+    if not os.path.exists(shards_path):
+        os.makedirs(shards_path)
+    manifest = {'version': SHARDS_VERSION, 'packages': {}}
+    for package_name, rapps in packages.items():
+        filename = RappIndexer(raw_data=rapps).write_tarball(os.path.join(shards_path, package_name), codec)
+        members = tarball_resources.TarballResources.from_tarball(name=filename).members()
+        manifest['packages'][package_name] = {'archive': os.path.basename(filename),
+                                              'digest': tarball_resources.members_digest(members),
+                                              'rapps': sorted(rapps)}
+    for name in os.listdir(shards_path):
+        if name not in [p['archive'] for p in manifest['packages'].values()]:
+            os.remove(os.path.join(shards_path, name))  # packages which are gone
+
+    filename = filename_prefix + SHARDS_MANIFEST_EXTENSION
+    with open(filename, 'w') as f:
+        yaml.safe_dump(manifest, f, default_flow_style=False)
+    logger.debug("write_shards() %d packages to '%s'" % (len(packages), filename))
+    return filename
+
+
+def read_manifest(data):
+    '''
+      Parses the manifest of a sharded index.
+
+      :param data: contents of the manifest
+      :type data: str
+
+      :rtype: dict
+
+      :raises: InvalidIndexShardsException: the manifest is invalid or of another version
+    '''
+    try:
+        manifest = yaml.safe_load(data)
+    except yaml.YAMLError as e:
+        raise InvalidIndexShardsException('invalid index manifest [%s]' % str(e))
+    if not isinstance(manifest, dict) or manifest.get('version') != SHARDS_VERSION or not isinstance(manifest.get('packages'), dict):
+        raise InvalidIndexShardsException('unsupported index manifest, expected version %d' % SHARDS_VERSION)
+    return manifest
+
+
+def select_packages(manifest, package_whitelist=None, package_blacklist=[]):
+    '''
+      Returns the packages of the manifest to load, with the semantics the index uses for package exports.
+
+      :rtype: [str]
+    '''
+    packages = sorted(manifest['packages'])
+    if package_whitelist:
+        return [p for p in packages if p in package_whitelist]
+    return [p for p in packages if p not in package_blacklist]
+
+
+def load_sharded_index(manifest_url, package_whitelist=None, package_blacklist=[]):
+    '''
+      Loads the index of the selected packages of a sharded index. The archives of other packages are not fetched.
+
+      :param manifest_url: the URL of the manifest
+      :type manifest_url: str
+      :param package_whitelist: list of target package list
+      :type package_whitelist: [str]
+      :param package_blacklist: list of blacklisted package
+      :type package_blacklist: [str]
+
+      :returns: the index
+      :rtype: rocon_app_utilities.RappIndexer
+
+      :raises: InvalidIndexShardsException: the manifest is invalid or of another version, or an archive does not
+                                            match its digest
+    '''
+    manifest = read_manifest(load_url(manifest_url, skip_decode=True))
+    index = RappIndexer(raw_data={}, package_whitelist=package_whitelist, package_blacklist=package_blacklist)
+    for package_name in select_packages(manifest, package_whitelist, package_blacklist):
+        url = shard_url(manifest_url, manifest['packages'][package_name]['archive'])
+        logger.debug("load_sharded_index() load '%s'" % url)
+        shard = read_tarball(fileobj=StringIO(load_url(url, skip_decode=True)), package_whitelist=package_whitelist, package_blacklist=package_blacklist)
+        _check_digest(url, manifest['packages'][package_name], shard.archives[-1].members())
+        shard.source = url
+        index.merge(shard)
+    index.source = manifest_url
+    return index
+
+
+def update_shards(manifest_url, manifest_path):
+    '''
+      Mirrors a remote sharded index. Only the archives whose digest changed are downloaded, the ones of
+      removed packages are deleted.
+
+      :param manifest_url: the URL of the remote manifest
+      :type manifest_url: str
+      :param manifest_path: the path of the local copy of the manifest
+      :type manifest_path: str
+
+      :returns: names of the packages whose archive was downloaded
+      :rtype: [str]
+
+      :raises: InvalidIndexShardsException: the manifest is invalid or of another version, or a downloaded archive
+                                            does not match its digest
+    '''
+    data = load_url(manifest_url, skip_decode=True)
+    manifest = read_manifest(data)
+    local_manifest = {'packages': {}}
+    if os.path.isfile(manifest_path):
+        try:
+            with open(manifest_path) as f:
+                local_manifest = read_manifest(f.read())
+        except InvalidIndexShardsException as e:
+            logger.debug("update_shards() ignoring local manifest '%s' [%s]" % (manifest_path, str(e)))
+
+    shards_path = manifest_path[:-len(SHARDS_MANIFEST_EXTENSION)] + SHARDS_DIRECTORY_EXTENSION
+    if not os.path.exists(shards_path):
+        os.makedirs(shards_path)
+    downloaded = []
+    for package_name, shard in sorted(manifest['packages'].items()):
+        local_shard = local_manifest['packages'].get(package_name)
+        if local_shard == shard and os.path.isfile(os.path.join(shards_path, shard['archive'])):
+            continue
+        url = shard_url(manifest_url, shard['archive'])
+        archive = load_url(url, skip_decode=True)
+        _check_digest(url, shard, tarball_resources.TarballResources.from_tarball(fileobj=StringIO(archive)).members())
+        _write_atomically(os.path.join(shards_path, shard['archive']), archive)
+        downloaded.append(package_name)
+    archives = set(shard['archive'] for shard in manifest['packages'].values())
+    for name in os.listdir(shards_path):
+        if name not in archives:
+            os.remove(os.path.join(shards_path, name))
+    # written last, so that an interrupted update is resumed by the next one
+    _write_atomically(manifest_path, data)
+    logger.debug("update_shards() downloaded %s of '%s'" % (downloaded, manifest_url))
+    return downloaded
+
+
+def _check_digest(url, shard, members):
+    '''
+      :param url: where the archive was fetched from
+      :type url: str
+      :param shard: entry of the package in the manifest
+      :type shard: dict
+      :param members: contents of the members of the fetched archive
+      :type members: {str: bytes}
+
+      :raises: InvalidIndexShardsException: the members do not match the digest listed in the manifest
+    '''
+    if tarball_resources.members_digest(members) != shard.get('digest'):
+        raise InvalidIndexShardsException("index archive '%s' does not match the digest of the manifest" % url)
+
+
+def _write_atomically(filename, data):
+    fd, tmp_filename = tempfile.mkstemp(prefix='.rapp_index_', dir=os.path.dirname(filename))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.rename(tmp_filename, filename)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+#################################################################################
+'''
+ Watches the files an index was built from, so that a running rapp manager can
+ refresh its index when rapps are added, edited or removed.
+
+ Changes are reported by inotify (pyinotify) where available, otherwise the files
+ are polled. Either way they are debounced: the callback runs once no further
+ change happened for a while, e.g. after an editor saved all files.
+'''
+#################################################################################
+
+from __future__ import division, print_function
+
+import os
+import threading
+import time
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+import logging
+import sys
+logger = logging.getLogger('index_watcher')
+logger.addHandler(logging.StreamHandler(sys.stderr))
+#logger.setLevel(logging.DEBUG)
+
+RESOURCE_KEYS = ['icon', 'public_interface', 'public_parameters', 'launch']
+
+
+def index_dependencies(index):
+    '''
+      Returns the files the rapps of an index were read from: rapp files, their resources and the
+      package.xml files exporting them.
+
+      :param index: the index
+      :type index: rocon_app_utilities.RappIndexer
+
+      :rtype: set
+    '''
+    paths = set([])
+    for resource_name in index.raw_data_path:
+        paths.update(rapp_dependencies(index, resource_name))
+    return paths
+
+
+def rapp_dependencies(index, resource_name):
+    '''
+      Returns the files a rapp of an index was read from, see index_dependencies.
+
+      :param index: the index
+      :type index: rocon_app_utilities.RappIndexer
+      :param resource_name: name of the rapp
+      :type resource_name: str
+
+      :rtype: set
+    '''
+    path, package = index.raw_data_path[resource_name]
+    paths = [path]
+    if package is not None and package.filename:
+        paths.append(package.filename)
+    rapp = index.raw_data.get(resource_name)
+    if rapp is not None:
+        paths.extend(v for k, v in rapp.yaml_data.items() if k in RESOURCE_KEYS and v)
+    # normalised like the paths reported by inotify
+    return set(os.path.normpath(path) for path in paths)
+
+
+def find_rapps_reading(index, paths):
+    '''
+      Maps changed files back to the rapps of an index read from them, e.g. the rapps whose launch
+      file was edited.
+
+      :param index: the index
+      :type index: rocon_app_utilities.RappIndexer
+      :param paths: changed files
+      :type paths: set
+
+      :returns: names of the rapps
+      :rtype: set
+    '''
+    paths = set(os.path.normpath(path) for path in paths)
+    return set(name for name in index.raw_data_path if not paths.isdisjoint(rapp_dependencies(index, name)))
+
+
+class _PollingBackend(object):
+    '''
+      Compares the modification time and size of the watched files and directories.
+    '''
+    __slots__ = ['period', '_signatures', '_next_poll']
+
+    def __init__(self, period):
+        self.period = period
+        self._signatures = {}
+        self._next_poll = 0
+
+    def watch(self, paths):
+        # the signatures of the files watched before are kept, so that a change made while the
+        # callback re-indexed them is noticed by the next poll
+        self._signatures = dict((path, self._signatures[path] if path in self._signatures else _signature(path)) for path in paths)
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+        if time.time() < self._next_poll:
+            return set([])
+        self._next_poll = time.time() + self.period
+        changed = set([])
+        for path, signature in self._signatures.items():
+            current = _signature(path)
+            if current != signature:
+                self._signatures[path] = current
+                changed.add(path)
+        return changed
+
+    def close(self):
+        pass
+
+
+class _InotifyBackend(object):
+    '''
+      Watches the directories holding the watched files with inotify.
+    '''
+    __slots__ = ['_manager', '_notifier', '_paths', '_changed']
+
+    MASK = (pyinotify.IN_CLOSE_WRITE | pyinotify.IN_CREATE | pyinotify.IN_DELETE | pyinotify.IN_MOVED_FROM | pyinotify.IN_MOVED_TO) if pyinotify else 0
+
+    def __init__(self):
+        self._manager = pyinotify.WatchManager()
+        self._notifier = pyinotify.Notifier(self._manager, default_proc_fun=self._process_event)
+        self._paths = set([])
+        self._changed = set([])
+
+    def _process_event(self, event):
+        if event.pathname in self._paths or os.path.dirname(event.pathname) in self._paths:
+            self._changed.add(event.pathname)
+
+    def watch(self, paths):
+        self._paths = set(paths)
+        watched = set(watch.path for watch in self._manager.watches.values())
+        directories = set(path if os.path.isdir(path) else os.path.dirname(path) for path in self._paths)
+        for directory in directories - watched:
+            if os.path.isdir(directory):
+                self._manager.add_watch(directory, self.MASK, quiet=True)
+        for directory in watched - directories:
+            self._manager.rm_watch(self._manager.get_wd(directory), quiet=True)
+
+    def wait(self, timeout):
+        if self._notifier.check_events(int(timeout * 1000)):
+            self._notifier.read_events()
+            self._notifier.process_events()
+        changed, self._changed = self._changed, set([])
+        return changed
+
+    def close(self):
+        self._notifier.stop()
+
+
+class IndexWatcher(object):
+    '''
+      Calls back from a background thread with the paths which changed, once they settled.
+    '''
+    __slots__ = ['callback', 'debounce', '_backend', '_paths', '_thread', '_stopped', '_lock']
+
+    def __init__(self, callback, debounce=1.0, poll_period=2.0, use_inotify=True):
+        '''
+          :param callback: called with the set of changed paths, the watched paths can be updated from it
+          :type callback: func
+          :param debounce: seconds without further changes before the callback runs
+          :type debounce: float
+          :param poll_period: seconds between two checks when polling
+          :type poll_period: float
+          :param use_inotify: use inotify if pyinotify is installed, poll otherwise
+          :type use_inotify: bool
+        '''
+        self.callback = callback
+        self.debounce = debounce
+        self._backend = _InotifyBackend() if use_inotify and pyinotify is not None else _PollingBackend(poll_period)
+        self._paths = None  # to be watched by the backend next
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        logger.debug('IndexWatcher() using %s' % type(self._backend).__name__)
+
+    def watch(self, paths):
+        '''
+          Sets the files and directories to watch. Directories are watched for added or removed entries,
+          e.g. new packages below a package path.
+
+          :param paths: absolute paths
+          :type paths: set
+        '''
+        with self._lock:
+            self._paths = set(p for p in paths if p and os.path.isabs(p))
+
+    def start(self):
+        with self._lock:
+            paths, self._paths = self._paths, None
+        if paths is not None:
+            self._backend.watch(paths)  # before returning, so that no change after start() is missed
+        self._thread = threading.Thread(target=self._run, name='index_watcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._backend.close()
+
+    def _run(self):
+        pending = set([])
+        last_change = None
+        while not self._stopped.is_set():
+            with self._lock:
+                paths, self._paths = self._paths, None
+            if paths is not None:
+                self._backend.watch(paths)
+            changed = self._backend.wait(self.debounce / 2.0)
+            if changed:
+                pending.update(changed)
+                last_change = time.time()
+            elif pending and time.time() - last_change >= self.debounce:
+                logger.debug('IndexWatcher changed %s' % sorted(pending))
+                try:
+                    self.callback(pending)
+                except Exception as e:
+                    logger.error('IndexWatcher callback failed [%s]' % str(e))
+                pending = set([])
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
@@ -6,17 +6,25 @@
 #################################################################################
 
 from __future__ import division, print_function
-import copy
+import collections
+import multiprocessing
 import os
-import tarfile
-import tempfile
+import yaml
 
 import rocon_python_utils
 import rocon_uri
 import rospkg
 
+from . import resource_cache, tarball_resources
+from .capability_index import CapabilityIndex
+from .compatibility_index import CompatibilityIndex
 from .exceptions import *
+from .index_layers import IndexLayers
+from .interface_index import InterfaceIndex
+from .parse_cache import RappParseCache, file_signature
 from .rapp import Rapp
+from .rapp_loader import load_rapp_yaml_from_file
+from .search_index import SearchIndex, searchable_fields
 
 import logging
 import sys
@@ -24,20 +32,37 @@ logger = logging.getLogger('indexer')
 logger.addHandler(logging.StreamHandler(sys.stderr))
 #logger.setLevel(logging.DEBUG)
 
+# Fields of a rapp file referencing a resource file
+_RESOURCE_KEYS = ['icon', 'public_interface', 'public_parameters', 'launch']
+
 
 class RappIndexer(object):
 
-    __slots__ = ['raw_data_path', 'raw_data', 'invalid_data', 'package_whitelist', 'package_blacklist', 'rospack', 'packages_path', 'source']
+    __slots__ = ['raw_data_path', 'raw_data', 'invalid_data', 'archives', 'package_whitelist', 'package_blacklist', 'rospack', 'packages_path', 'source', 'use_cache', 'workers', '_chains', '_resolved', '_chain_errors', '_chains_dirty', '_compatibility', '_compatibility_pending', '_capabilities', '_interfaces', '_interfaces_pending', '_search', '_search_pending']
 
-    def __init__(self, raw_data=None, package_whitelist=None, package_blacklist=[], packages_path=None, source=None):
+    def __init__(self, raw_data=None, package_whitelist=None, package_blacklist=[], packages_path=None, source=None, use_cache=True, workers=1):
         self.packages_path = packages_path
+        self.use_cache = use_cache
+        self.workers = workers
         self.raw_data_path = {}
         self.raw_data = {}
         self.invalid_data = {}
+        self.archives = []  # registered index archives the rapps are read from, see tarball_resources.register
         self.package_whitelist = package_whitelist
         self.package_blacklist = package_blacklist
         self.source = source
         self.rospack = rospkg.RosPack()
+        self._chains = {}  # resource_name : names of the rapps in its chain, see _update_chains
+        self._resolved = {}  # resource_name : (resolved rapp, names of the rapps in its chain), resolved on first use
+        self._chain_errors = {}  # resource_name : exception raised when resolving it
+        self._chains_dirty = True
+        self._compatibility = CompatibilityIndex()
+        self._compatibility_pending = None  # names of rapps to re-index, None for all
+        self._capabilities = CapabilityIndex()  # re-indexed along with the compatibility index
+        self._interfaces = InterfaceIndex()
+        self._interfaces_pending = None  # names of rapps whose resolved interface to re-index, None for all
+        self._search = SearchIndex()
+        self._search_pending = None  # names of rapps whose resolved texts to re-index, None for all
 
         if raw_data is not None:
             self.raw_data = raw_data
@@ -58,20 +83,56 @@ class RappIndexer(object):
     def update_index(self, package_whitelist=None, package_blacklist=[]):
         '''
           Crawls rocon apps from ROS_PACKAGE_PATH and generates raw_data dictionary.
+          Unless use_cache is disabled, only rapp files which changed since the last
+          indexing are parsed again (see :class:`.RappParseCache`). With more than one
+          worker the remaining rapp files are parsed in a process pool.
 
           :param package_whitelist: list of target package list
           :type package_whitelist: [str]
           :param package_blacklist: list of blacklisted package
           :type package_blacklist: [str]
         '''
-        self.raw_data_path, _invalid_path = rocon_python_utils.ros.resource_index_from_package_exports('rocon_app', self.packages_path, package_whitelist, package_blacklist)
+        raw_data_path, _invalid_path = rocon_python_utils.ros.resource_index_from_package_exports('rocon_app', self.packages_path, package_whitelist, package_blacklist)
+        self._index_rapp_files(raw_data_path, package_whitelist, package_blacklist)
+
+    def _index_rapp_files(self, raw_data_path, package_whitelist=None, package_blacklist=[]):
+        '''
+          Generates the raw_data dictionary from the given rapp files.
+
+          :param raw_data_path: rapp files and their packages by resource name
+          :type raw_data_path: {resource_name: (str, catkin_pkg.package.Package)}
+        '''
+        self.raw_data_path = raw_data_path
         raw_data = {}
         invalid_data = {}
-
-        for resource_name, (path, catkin_package) in self.raw_data_path.items():
+        parse_cache = RappParseCache() if self.use_cache else None
+        resources = sorted(self.raw_data_path.items())  # deterministic regardless of the number of workers
+
+        parsed = {}
+        unparsed = []
+        for resource_name, (path, unused_catkin_package) in resources:
+            cached = parse_cache.lookup(path) if parse_cache else None
+            if cached:
+                parsed[resource_name] = cached
+            else:
+                unparsed.append((resource_name, path))
+
+        with resource_cache.listing_cache():  # one listing per rapp directory instead of a stat per resource
+            results = self._parse_rapp_files(unparsed, parse_cache.use_hash if parse_cache else False)
+        for (resource_name, path), result in zip(unparsed, results):
+            yaml_data, rapp_data, reason, signatures = result
+            if parse_cache and signatures:
+                parse_cache.store(path, signatures, yaml_data, rapp_data, reason)
+            parsed[resource_name] = (yaml_data, rapp_data, reason)
+
+        for resource_name, (path, catkin_package) in resources:
+            yaml_data, rapp_data, reason = parsed[resource_name]
+            if reason:
+                invalid_data[resource_name] = reason
+                continue
             try:
                 r = Rapp(resource_name, self.rospack)
-                r.load_rapp_yaml_from_file(path)
+                r.load_rapp_yaml(path, yaml_data, rapp_data)
                 r.package = catkin_package
                 raw_data[resource_name] = r
             except InvalidRappFieldException as irfe:
@@ -80,11 +141,41 @@ class RappIndexer(object):
                 invalid_data[resource_name] = str(ire)
             except RappResourceNotExistException as e:
                 invalid_data[resource_name] = str(e)
+        if parse_cache:
+            parse_cache.save()
+            logger.debug('update_index() parse cache hits %d, misses %d' % (parse_cache.hits, parse_cache.misses))
+        self._invalidate(_changed_rapps(self.raw_data, raw_data))
         self.raw_data = raw_data
         self.invalid_data = invalid_data
+        self._chain_errors = {}
         self.package_whitelist = package_whitelist
         self.package_blacklist = package_blacklist
 
+    def _parse_rapp_files(self, rapps, use_hash=False):
+        '''
+          Parses the given rapp files, in a process pool if more than one worker is configured.
+
+          :param rapps: resource names and paths of the rapp files
+          :type rapps: [(str, str)]
+          :param use_hash: include the md5 of the contents in the signatures of the files read
+          :type use_hash: bool
+
+          :returns: results of _parse_rapp_file in the order of the given rapps
+          :rtype: [tuple]
+        '''
+        workers = min(self.workers or 1, len(rapps))
+        if workers <= 1:
+            return [_parse_rapp_file(resource_name, path, use_hash) for resource_name, path in rapps]
+
+        logger.debug('_parse_rapp_files() parse %d rapps with %d workers' % (len(rapps), workers))
+        pool = multiprocessing.Pool(workers)
+        try:
+            chunksize = max(1, len(rapps) // (workers * 4))
+            return pool.map(_parse_rapp_file_worker, [(resource_name, path, use_hash) for resource_name, path in rapps], chunksize)
+        finally:
+            pool.close()
+            pool.join()
+
     def get_package_whitelist_blacklist(self):
         return self.package_whitelist, self.package_blacklist
 
@@ -125,124 +216,528 @@ class RappIndexer(object):
 
         return rapp
 
-    def get_compatible_rapps(self, uri=rocon_uri.default_uri_string, ancestor_share_check=False):
+    def get_compatible_rapps(self, uri=rocon_uri.default_uri_string, ancestor_share_check=False, lazy_specs=False):
         '''
           returns all rapps which are compatible with given URI
 
           :param uri: Rocon URI
           :type uri: str
+          :param lazy_specs: do not parse the launch files up front. Rapps with an invalid launch file are then
+                             not reported as invalid; accessing their launch_args raises RappMalformedException instead
+          :type lazy_specs: bool
 
           :returns: a dict of compatible rapps, a dict of incompatible rapps, a dict of invalid rapps
           :rtype: {resource_name:rocon_app_utilities.Rapp}, {resource_name:rocon_app_utilities.Rapp}, {resource_name:str}
         '''
-        compatible_rapps = {}
-        incompatible_rapps = {}
-        invalid_rapps = {}
+        return self.get_compatible_rapps_for_uris([uri], ancestor_share_check, lazy_specs)[uri]
 
-        for resource_name, rapp in self.raw_data.items():
-            if not rapp.is_implementation:
-                continue
-            try:
-                if rapp.is_compatible(uri):
-                    compatible_rapps[resource_name] = rapp
-                else:
-                    incompatible_rapps[resource_name] = rapp
-            except rocon_uri.exceptions.RoconURIValueError as e:
-                invalid_rapps[resource_name] = str(e)
-
-        resolved_compatible_rapps, invalid_compatible = self._resolve_rapplist(compatible_rapps, ancestor_share_check)
-        resolved_incompatible_rapps, invalid_incompatible = self._resolve_rapplist(incompatible_rapps, ancestor_share_check)
-        invalid_rapps.update(invalid_compatible)
-        invalid_rapps.update(invalid_incompatible)
-
-        for resource_name, rapp in resolved_compatible_rapps.items():
-            try:
-                rapp.load_rapp_specs_from_file()
-            except RappResourceNotExistException as e:
-                invalid_rapps[resource_name] = str(e)
-            except RappMalformedException as e:
-                invalid_rapps[resource_name] = str(e)
+    def get_compatible_rapps_for_uris(self, uris, ancestor_share_check=False, lazy_specs=False):
+        '''
+          returns the rapps which are compatible with each of the given URIs, e.g. for every robot of a fleet.
+          Every rapp is resolved and has its specification loaded at most once, regardless of the number of
+          URIs it is compatible with, and the rapps of one URI are picked by set operations on the compatibility index.
 
-        for resource_name in invalid_rapps:
-            if resource_name in resolved_compatible_rapps:
-                del resolved_compatible_rapps[resource_name]
+          :param uris: Rocon URIs
+          :type uris: [str]
+          :param lazy_specs: do not parse the launch files up front, see get_compatible_rapps
+          :type lazy_specs: bool
+
+          :returns: per URI, the dicts of compatible, incompatible and invalid rapps as returned by get_compatible_rapps
+          :rtype: {uri: ({resource_name:rocon_app_utilities.Rapp}, {resource_name:rocon_app_utilities.Rapp}, {resource_name:str})}
+        '''
+        self._update_compatibility()
+
+        resolved = {}  # resource_name : resolved rapp, shared by all URIs
+        errors = {}  # resource_name : reason why it cannot be resolved or its specification cannot be loaded
+        specs_loaded = set([])
+
+        matrix = {}
+        for uri in set(uris):
+            compatible_names, incompatible_names, invalid_rapps = self._compatibility.query(uri)
+
+            resolved_compatible_rapps, invalid_compatible = self._resolve_rapplist(compatible_names, ancestor_share_check, resolved, errors)
+            resolved_incompatible_rapps, invalid_incompatible = self._resolve_rapplist(incompatible_names, ancestor_share_check, resolved, errors)
+            invalid_rapps.update(invalid_compatible)
+            invalid_rapps.update(invalid_incompatible)
+
+            for resource_name, rapp in resolved_compatible_rapps.items():
+                if resource_name not in specs_loaded:
+                    specs_loaded.add(resource_name)
+                    try:
+                        rapp.load_rapp_specs_from_file(lazy=lazy_specs)
+                    except RappResourceNotExistException as e:
+                        errors[resource_name] = str(e)
+                    except RappMalformedException as e:
+                        errors[resource_name] = str(e)
+                if resource_name in errors:
+                    invalid_rapps[resource_name] = errors[resource_name]
+
+            for resource_name in invalid_rapps:
+                if resource_name in resolved_compatible_rapps:
+                    del resolved_compatible_rapps[resource_name]
 
-        if hasattr(self, 'invalid_data'):
             invalid_rapps.update(self.invalid_data)
+            matrix[uri] = (resolved_compatible_rapps, resolved_incompatible_rapps, invalid_rapps)
+        return matrix
+
+    def iter_rapps(self, packages=None, ancestor=None, types=None, uri=None, predicate=None, resolve=True, load_specs=False):
+        '''
+          yields rapps one by one in the order of their names, so that callers only pay for resolving and loading
+          the rapps they consume, e.g. the first compatible implementation of an ancestor or a page of rapps. Each
+          rapp is resolved on demand along its own parent chain (see _resolve_chain). The filters are applied
+          cheapest first: the compatibility through the compatibility index, which is brought up to date with all
+          raw rapps first, then the package and type of the raw rapp, the ancestor of the resolved rapp, and the
+          predicate last on the yielded rapp.
+
+          :param packages: names of the packages to yield rapps of, None for any
+          :type packages: [str]
+          :param ancestor: name of the ancestor to yield the rapps of, None for any
+          :type ancestor: str
+          :param types: raw types (e.g. 'Implementation Child') to yield, None for any
+          :type types: [str]
+          :param uri: Rocon URI the rapps must be compatible with, None for any. Only implementations are compatible
+          :type uri: str
+          :param predicate: called with each rapp which passed the other filters, it is yielded if it returns true
+          :type predicate: callable
+          :param resolve: yield resolved, runnable rapps (rapps which cannot be resolved are skipped, see
+                          invalid_data) instead of raw rapps
+          :type resolve: bool
+          :param load_specs: also load the specification of the resolved rapps. Launch files are parsed on access
+                             of launch_args, see get_compatible_rapps with lazy_specs. Rapps whose specification
+                             cannot be loaded are skipped
+          :type load_specs: bool
+
+          :returns: generator of rapps
+          :rtype: generator of rocon_app_utilities.Rapp
+        '''
+        if uri is not None:
+            self._update_compatibility()
+            names = sorted(self._compatibility.query(uri)[0])
+        else:
+            names = sorted(self.raw_data)
+        packages = frozenset(packages) if packages is not None else None
+        types = frozenset(types) if types is not None else None
+
+        for resource_name in names:
+            rapp = self.raw_data.get(resource_name)
+            if rapp is None:
+                continue
+            if packages is not None and resource_name.split('/', 1)[0] not in packages:
+                continue
+            if types is not None and rapp.type not in types:
+                continue
+            if ancestor is not None or resolve:
+                try:
+                    resolved = self._resolve_chain(resource_name)[0]
+                except RappException:  # recorded in invalid_data by _update_chains
+                    continue
+                if ancestor is not None and resolved.ancestor_name != ancestor:
+                    continue
+            if resolve:
+                if not (resolved.is_ancestor and resolved.is_implementation):
+                    continue
+                rapp = resolved.view()
+                if load_specs:
+                    try:
+                        rapp.load_rapp_specs_from_file(lazy=True)
+                    except (RappResourceNotExistException, RappMalformedException):
+                        continue
+            if predicate is None or predicate(rapp):
+                yield rapp
+
+    def find_interface(self, connection_type=None, name=None, msg_type=None):
+        '''
+          returns the rapps having a public connection of the given name and/or message type, including the
+          connections inherited from their parents
+
+          :param connection_type: 'publishers', 'subscribers', 'services', 'action_clients' or 'action_servers', None for any
+          :type connection_type: str
+          :param name: connection name, e.g. '/teleop/cmd_vel'
+          :type name: str
+          :param msg_type: message type, e.g. 'geometry_msgs/Twist'
+          :type msg_type: str
+
+          :returns: the matching connections of each rapp as (connection type, name, message type) tuples
+          :rtype: {resource_name: [(str, str, str)]}
+
+          :raises: ValueError: neither name nor msg_type is given
+        '''
+        self._update_interfaces()
+        matches = {}
+        for resource_name in self._interfaces.query(connection_type, name, msg_type):
+            matches[resource_name] = [c for c in self._interfaces.connections[resource_name]
+                                      if (connection_type is None or c[0] == connection_type) and
+                                         (name is None or c[1] == name) and
+                                         (msg_type is None or c[2] == msg_type)]
+        return matches
+
+    def search(self, text, limit=None):
+        '''
+          returns the rapps whose display name, description, name or package contain every word of the given
+          text, exactly or as a prefix. Display names and descriptions include the ones inherited from parents.
+
+          :param text: keywords, e.g. 'turtle tele'
+          :type text: str
+          :param limit: maximum number of results, None for all
+          :type limit: int
 
-        return resolved_compatible_rapps, resolved_incompatible_rapps, invalid_rapps
+          :returns: names and scores of the matching rapps, best first
+          :rtype: [(str, float)]
+        '''
+        self._update_search()
+        return self._search.query(text, limit)
+
+    def get_capability_requirements(self, rapp_names=None):
+        '''
+          returns the names of the capabilities required by implementation rapps
+
+          :param rapp_names: names of the rapps, None for all implementation rapps
+          :type rapp_names: [str]
+
+          :rtype: {resource_name: frozenset}
+        '''
+        self._update_compatibility()
+        required = self._capabilities.required
+        if rapp_names is None:
+            return dict(required)
+        return dict((n, required[n]) for n in rapp_names if n in required)
+
+    def filter_capabilities(self, available_capabilities, rapp_names=None):
+        '''
+          Splits implementation rapps into the ones runnable with the available capabilities and the ones
+          which are not.
+
+          :param available_capabilities: names of the available capabilities
+          :type available_capabilities: set
+          :param rapp_names: names of the rapps to check, None for all implementation rapps
+          :type rapp_names: [str]
 
-    def _resolve_rapplist(self, rapps, ancestor_share_check):
+          :returns: names of the runnable rapps and, per unrunnable rapp, the names of its missing capabilities
+          :rtype: (set, {resource_name: frozenset})
         '''
-          resolve full spec of given dict of rapps
+        self._update_compatibility()
+        available = frozenset(available_capabilities)
+        unrunnable = self._capabilities.unrunnable(available)
+        names = set(self._capabilities.required) if rapp_names is None else set(rapp_names).intersection(self._capabilities.required)
+        missing = dict((n, self._capabilities.missing(n, available)) for n in names & unrunnable)
+        return names - unrunnable, missing
+
+    def find_rapps_requiring(self, capabilities):
+        '''
+          returns the implementation rapps requiring any of the given capabilities, e.g. the ones to re-check
+          when these capabilities appear or disappear
+
+          :param capabilities: capability names
+          :type capabilities: iterable
 
-          :param rapps: list of rapps
-          :type dict
+          :rtype: set
+        '''
+        self._update_compatibility()
+        return self._capabilities.requiring(capabilities)
+
+    def find_rapps_unlocked_by(self, capability, available_capabilities):
+        '''
+          returns the implementation rapps which would become runnable if the given capability was available
+          in addition to the available capabilities
+
+          :param capability: capability name
+          :type capability: str
+          :param available_capabilities: names of the available capabilities
+          :type available_capabilities: set
+
+          :rtype: set
+        '''
+        self._update_compatibility()
+        return self._capabilities.unlocked_by(capability, frozenset(available_capabilities))
+
+    def _resolve_rapplist(self, rapp_names, ancestor_share_check, resolved=None, errors=None):
+        '''
+          resolve full spec of given rapps
+
+          :param rapp_names: names of rapps
+          :type rapp_names: set
+          :param resolved: memo of already resolved rapps, filled by this call
+          :type resolved: {resource_name: rocon_app_utilities.Rapp}
+          :param errors: memo of rapps which cannot be resolved, filled by this call
+          :type errors: {resource_name: str}
 
           :returns: resolved rapps, invalid rapps
           :rtypes: {}, {}
         '''
-        resolved = {}
+        resolved = {} if resolved is None else resolved
+        errors = {} if errors is None else errors
+        resolved_rapps = {}
         used_ancestors = {}
         invalid = {}
-        for resource_name, unused_rapp in rapps.items():
-            try:
-                resolved_rapp = self._resolve(resource_name)
-                ancestor_name = resolved_rapp.ancestor_name
-                if ancestor_share_check and ancestor_name in used_ancestors:
-                    invalid[resource_name] = "Ancestor has already been taken by other rapp"
-                else:
-                    resolved[resource_name] = resolved_rapp
-                used_ancestors[ancestor_name] = resource_name
-            except ParentRappNotFoundException as e:
-                invalid[resource_name] = str('Invalid parent_name [%s] in resource [%s]' % (str(e.parent_name), str(e.resource_name)))
-            except RappInvalidChainException as e:
-                invalid[resource_name] = str(e)
-        return resolved, invalid
+        for resource_name in sorted(rapp_names):
+            if resource_name not in resolved and resource_name not in errors:
+                try:
+                    resolved[resource_name] = self._resolve(resource_name)
+                except RappException as e:
+                    errors[resource_name] = _chain_error_to_str(e)
+            if resource_name not in resolved:
+                invalid[resource_name] = errors[resource_name]
+                continue
+            resolved_rapp = resolved[resource_name]
+            ancestor_name = resolved_rapp.ancestor_name
+            if ancestor_share_check and ancestor_name in used_ancestors:
+                invalid[resource_name] = "Ancestor has already been taken by other rapp"
+            else:
+                resolved_rapps[resource_name] = resolved_rapp
+            used_ancestors[ancestor_name] = resource_name
+        return resolved_rapps, invalid
 
     def _resolve(self, rapp_name):
         '''
-          resolve the rapp instance with its parent specification and return a runnable rapp
+          resolve the rapp instance with its parent specification and return a runnable rapp.
+          It is resolved on first use along its chain (see _resolve_chain), callers get views sharing the
+          resolved data, copied on write.
 
           :param rapp name: Rapp name
           :type rapp_name: str
 
           :returns: fully resolved rapp
           :rtype: rocon_app_utilities.Rapp
+
+          :raises: RappInvalidChainException: Rapp does not resolve to an implementation
+          :raises: ParentRappNotFoundException: One of its parents does not exist
+          :raises: RappCyclicChainException: Its chain is cyclic
+          :raises: RappException: It cannot be merged onto its parent, see Rapp.resolve
         '''
-        rapp = copy.deepcopy(self.raw_data[rapp_name])  # Not to currupt original data
-        parent_name = rapp.parent_name
-        stack = []
-        stack.append(rapp.resource_name)
-        rapp, ancestor_name = self._resolve_recursive(rapp, parent_name, stack)
-        rapp.ancestor_name = ancestor_name
+        rapp = self._resolve_chain(rapp_name)[0]
+        if not (rapp.is_ancestor and rapp.is_implementation):
+            raise RappInvalidChainException('Invalid Rapp Chain from [' + str(rapp) + ']')
+        return rapp.view()
 
-        return rapp
+    def _resolve_chain(self, resource_name):
+        '''
+          Resolves a single rapp, walking only its own parent chain and reusing the parents resolved before.
+          A rapp which cannot be merged onto its parent is recorded in invalid_data along with the rapps of the
+          walked chain inheriting from it.
+
+          :param resource_name: rapp name
+          :type resource_name: str
 
-    def _resolve_recursive(self, rapp, parent_name, stack):
+          :returns: the resolved rapp and the names of the rapps in its chain, as held in _resolved
+          :rtype: (rocon_app_utilities.Rapp, frozenset)
+
+          :raises: ParentRappNotFoundException: One of its parents does not exist
+          :raises: RappCyclicChainException: Its chain is cyclic
+          :raises: RappException: It or one of its parents cannot be merged onto its parent, see Rapp.resolve
         '''
-            Internal method of _resolve
+        self._update_chains()
+        if resource_name in self._chain_errors:
+            raise self._chain_errors[resource_name]
+        resolved = self._resolved.get(resource_name)
+        if resolved is not None:
+            return resolved
+        stack = [resource_name]
+        parent_name = self._summary(resource_name).parent_name
+        while parent_name and parent_name not in self._resolved:
+            if parent_name in self._chain_errors:
+                self._record_chain_error(stack, self._chain_errors[parent_name])
+            stack.append(parent_name)
+            parent_name = self._summary(parent_name).parent_name
+        parent = self._resolved[parent_name] if parent_name else None
+        for position in range(len(stack) - 1, -1, -1):
+            name = stack[position]
+            try:
+                resolved = self.raw_data[name].resolve(parent[0] if parent else None)
+            except RappException as e:
+                self._record_chain_error(stack[:position + 1], e)
+            parent = self._resolved[name] = (resolved, self._chains[name])
+        return parent
 
-            :raises: RappInvalidChainException: Rapp is implmentation child but does not have parent
-            :raises: ParentRappNotFoundException: Its parent does not exist
+    def _record_chain_error(self, rapp_names, e):
         '''
-        if rapp.is_ancestor and rapp.is_implementation:
-            return rapp, stack.pop()
+          Records the rapps which cannot be resolved, e.g. a rapp and the ones inheriting from it, and raises the error.
+        '''
+        for resource_name in rapp_names:
+            self._chain_errors[resource_name] = e
+            self.invalid_data[resource_name] = _chain_error_to_str(e)
+        raise e
 
-        if not parent_name:
-            raise RappInvalidChainException('Invalid Rapp Chain from [' + str(rapp) + ']')
+    def _resolve_all(self):
+        '''
+          Resolves every rapp, so that all the rapps which cannot be resolved are recorded in invalid_data.
+        '''
+        self._update_chains()
+        for resource_name in sorted(self._chains):
+            try:
+                self._resolve_chain(resource_name)
+            except RappException:
+                pass
+
+    def _summary(self, resource_name):
+        '''
+          returns the summary of a raw rapp (see Rapp.summary), without loading the rapp from layers which keep
+          the summaries of their rapps, e.g. snapshots (see :class:`.snapshot.SnapshotRapps`)
 
-        if not parent_name in self.raw_data:
-            raise ParentRappNotFoundException(rapp.resource_name, parent_name)
+          :rtype: rocon_app_utilities.rapp.RappSummary
+        '''
+        raw_data = self.raw_data.layer_of(resource_name) if isinstance(self.raw_data, IndexLayers) else self.raw_data
+        if hasattr(raw_data, 'summary'):
+            return raw_data.summary(resource_name)
+        return raw_data[resource_name].summary()
 
-        if parent_name in stack:
-            raise RappCyclicChainException(stack)
+    def _update_chains(self):
+        '''
+          Builds the parent -> children graph from the summaries of the raw rapps and derives the chain of every
+          rapp in a single topological pass from the ancestors downwards, without loading or resolving any rapp.
+          Rapps which cannot be reached from an ancestor (missing parent or cyclic chain) are recorded in
+          invalid_data. Rapps which cannot be merged onto their parent are only found when they are resolved.
+        '''
+        if not self._chains_dirty:
+            return
+
+        parents = dict((resource_name, self._summary(resource_name).parent_name) for resource_name in self.raw_data)
+        children = {}
+        ancestors = []
+        for resource_name, parent_name in parents.items():
+            if parent_name:
+                children.setdefault(parent_name, []).append(resource_name)
+            else:
+                ancestors.append(resource_name)
+
+        chains = {}
+        queue = collections.deque((resource_name, frozenset()) for resource_name in ancestors)
+        while queue:
+            resource_name, parent_chain = queue.popleft()
+            chain = chains[resource_name] = parent_chain.union([resource_name])
+            queue.extend((child_name, chain) for child_name in children.get(resource_name, []))
+
+        # whatever has not been reached hangs off a missing parent or a cycle
+        chain_errors = {}
+        for resource_name in parents:
+            if resource_name in chains or resource_name in chain_errors:
+                continue
+            stack = [resource_name]
+            visited = set(stack)
+            parent_name = parents[resource_name]
+            while True:
+                if parent_name in chain_errors:
+                    chain_errors[resource_name] = chain_errors[parent_name]
+                    break
+                if not parent_name in parents:
+                    chain_errors[resource_name] = ParentRappNotFoundException(resource_name, parent_name)
+                    break
+                if parent_name in visited:
+                    chain_errors[resource_name] = RappCyclicChainException(stack)
+                    break
+                stack.append(parent_name)
+                visited.add(parent_name)
+                parent_name = parents[parent_name]
+        self._set_chains(chains, chain_errors)
+
+    def _set_chains(self, chains, chain_errors):
+        '''
+          Takes the chains and chain errors of the raw rapps, see _update_chains.
 
-        parent = self.raw_data[parent_name]
-        rapp.inherit(parent)
-        stack.append(parent.resource_name)
+          :param chains: names of the rapps in its chain by rapp
+          :type chains: {resource_name: frozenset}
+          :param chain_errors: error by rapp which cannot be reached from an ancestor
+          :type chain_errors: {resource_name: RappException}
+        '''
+        for resource_name in self._chain_errors:
+            self.invalid_data.pop(resource_name, None)
+        for resource_name, e in chain_errors.items():
+            self.invalid_data[resource_name] = _chain_error_to_str(e)
+        self._chains = chains
+        self._chain_errors = dict(chain_errors)
+        self._chains_dirty = False
+
+    def _update_compatibility(self):
+        '''
+          Brings the compatibility and capability indices of the implementation rapps up to date with raw_data.
+          They are built from the summaries of the raw rapps, see _summary.
+        '''
+        if self._compatibility_pending is None:
+            rapp_names = set(self.raw_data).union(self._compatibility.parsed, self._compatibility.invalid, self._capabilities.required)
+        else:
+            rapp_names = self._compatibility_pending
+        for resource_name in rapp_names:
+            summary = self._summary(resource_name) if resource_name in self.raw_data else None
+            if summary is not None and summary.is_implementation:
+                self._compatibility.add(resource_name, summary.compatibility)
+                self._capabilities.add(resource_name, summary.required_capabilities)
+            else:
+                self._compatibility.remove(resource_name)
+                self._capabilities.remove(resource_name)
+        self._compatibility_pending = set([])
+
+    def _update_interfaces(self):
+        '''
+          Brings the interface index of the resolved rapps up to date with raw_data.
+        '''
+        self._update_chains()
+        if self._interfaces_pending is None:
+            rapp_names = set(self.raw_data).union(self._interfaces.connections)
+        else:
+            rapp_names = self._interfaces_pending
+        for resource_name in rapp_names:
+            resolved = self._resolve_if_valid(resource_name)
+            if resolved is not None:
+                self._interfaces.add(resource_name, resolved.raw_data.get('public_interface'))
+            else:
+                self._interfaces.remove(resource_name)
+        self._interfaces_pending = set([])
+
+    def _update_search(self):
+        '''
+          Brings the search index of the resolved rapps up to date with raw_data.
+        '''
+        self._update_chains()
+        if self._search_pending is None:
+            rapp_names = set(self.raw_data).union(self._search.tokens)
+        else:
+            rapp_names = self._search_pending
+        for resource_name in rapp_names:
+            resolved = self._resolve_if_valid(resource_name)
+            if resolved is not None:
+                self._search.add(resource_name, searchable_fields(resource_name, resolved.raw_data))
+            else:
+                self._search.remove(resource_name)
+        self._search_pending = set([])
+
+    def _resolve_if_valid(self, resource_name):
+        '''
+          :returns: the resolved rapp, None if it does not exist or cannot be resolved
+          :rtype: rocon_app_utilities.Rapp
+        '''
+        if resource_name not in self.raw_data:
+            return None
+        try:
+            return self._resolve_chain(resource_name)[0]
+        except RappException:
+            return None
+
+    def _invalidate(self, rapp_names):
+        '''
+          Drops the resolved rapps whose chain includes any of the given rapps and
+          schedules the given rapps for re-indexing their compatibility and the dropped ones
+          for re-indexing their interfaces and texts.
 
-        return self._resolve_recursive(rapp, parent.parent_name, stack)
+          :param rapp_names: names of added, changed or removed rapps
+          :type rapp_names: set
+
+          :returns: names of the dropped resolved rapps
+          :rtype: set
+        '''
+        self._chains_dirty = True
+        dropped = set([])
+        if not rapp_names:
+            return dropped
+        if self._compatibility_pending is not None:
+            self._compatibility_pending.update(rapp_names)
+        for resource_name, (unused_rapp, chain) in list(self._resolved.items()):
+            if not chain.isdisjoint(rapp_names):
+                del self._resolved[resource_name]
+                dropped.add(resource_name)
+        for pending in [self._interfaces_pending, self._search_pending]:
+            if pending is not None:
+                pending.update(rapp_names)
+                pending.update(dropped)
+        return dropped
 
     def to_dot(self):
         '''
@@ -254,60 +749,220 @@ class RappIndexer(object):
 
     def merge(self, other_indexer):
         '''
-          Updates this index with the rapps from the other_indexer.
+          Layers the rapps of the other_indexer on top of the rapps of this index. Nothing is copied, the rapps
+          of the other_indexer shadow the ones of this index with the same name (see :class:`.IndexLayers`).
 
           :param other_indexer: the other inder
           :type other_indexer: rocon_app_utilities.RappIndexer
         '''
-        self.raw_data.update(other_indexer.raw_data)
-        self.raw_data_path.update(other_indexer.raw_data_path)
+        if not isinstance(self.raw_data, IndexLayers):
+            self.raw_data = IndexLayers([(self.source, self.raw_data)] if self.raw_data else [])
+            self.raw_data_path = IndexLayers([(self.source, self.raw_data_path)] if self.raw_data_path else [])
+        self.raw_data.push(other_indexer.raw_data, other_indexer.source)
+        self.raw_data_path.push(other_indexer.raw_data_path, other_indexer.source)
+        self.archives.extend(a for a in other_indexer.archives if a not in self.archives)
+        if self._resolved or self._compatibility_pending is not None or self._interfaces_pending is not None or self._search_pending is not None:
+            self._invalidate(set(other_indexer.raw_data))
+        else:
+            self._chains_dirty = True  # nothing resolved or indexed yet
 
-        # Cleanup 'invalid' invalid data before merge
-        self.invalid_data = {k: v for k, v in self.invalid_data.items() if k not in self.raw_data}
-        self.invalid_data.update(other_indexer.invalid_data)
+        # Cleanup 'invalid' invalid data before merge. Chain errors are recomputed for the merged chains.
+        for resource_name in self._chain_errors:
+            self.invalid_data.pop(resource_name, None)
+        for resource_name in [k for k in self.invalid_data if k in other_indexer.raw_data]:
+            del self.invalid_data[resource_name]
+        self.invalid_data.update((k, v) for k, v in other_indexer.invalid_data.items() if k not in other_indexer._chain_errors)
+        self._chain_errors = {}
 
-    def write_tarball(self, filename_prefix):
+    def refresh(self, other_indexer, changed=None):
         '''
-          Writes the index to a gzipped tarball.
+          Takes the rapps of the other_indexer, a newly built index of the same sources. Resolved rapps and
+          compatibility entries of the rapps which did not change are kept.
 
-          :param filename_prefix: the pathname of the archive with out the suffix '.index.tar.gz'
-          :type filename_prefix: str
+          :param other_indexer: the new index
+          :type other_indexer: rocon_app_utilities.RappIndexer
+          :param changed: names of rapps to resolve again although their raw data is the same, e.g. because
+                          their launch file was edited (see index_watcher.find_rapps_reading)
+          :type changed: set
+
+          :returns: names of the rapps which were added, changed or removed, including the ones inheriting from them
+          :rtype: set
+        '''
+        changed = _changed_rapps(self.raw_data, other_indexer.raw_data) | set(changed or [])
+        affected = changed | self._invalidate(changed)
+        self.raw_data = other_indexer.raw_data
+        self.raw_data_path = other_indexer.raw_data_path
+        self.archives = list(other_indexer.archives)
+        self.invalid_data = dict((k, v) for k, v in other_indexer.invalid_data.items() if k not in other_indexer._chain_errors)
+        self._chain_errors = {}
+        self._update_chains()
+        affected.update(name for name, chain in self._chains.items() if not chain.isdisjoint(changed))
+        return affected
+
+    def get_rapp_sources(self, rapp_name):
+        '''
+          returns the source the rapp is taken from, followed by the sources of the merged indices whose rapps of
+          the same name it shadows
+
+          :param rapp_name: rapp name
+          :type rapp_name: str
+
+          :returns: sources, e.g. rapp repository uris
+          :rtype: [str]
+
+          :raises: RappNotExistException: the given rapp name does not exist
+        '''
+        if not rapp_name in self.raw_data:
+            raise RappNotExistException(str(rapp_name) + ' does not exist')
+        if isinstance(self.raw_data, IndexLayers):
+            return [self.raw_data.source_of(rapp_name)] + self.raw_data.shadowed(rapp_name)
+        return [self.source]
+
+    def write_tarball(self, filename_prefix, codec='gz'):
         '''
+          Writes the index to a tarball. The archive is reproducible: its members are sorted and carry no
+          timestamps or owners, and files with identical contents are stored once and hard linked.
+
+          :param filename_prefix: the pathname of the archive with out the suffix, e.g. '.index.tar.gz'
+          :type filename_prefix: str
+          :param codec: compression, one of tarball_resources.ARCHIVE_EXTENSIONS ('gz', 'xz' or 'none')
+          :type codec: str
 
-        RESOURCE_KEYS = ['icon', 'public_interface', 'public_parameters', 'launch']
+          :returns: the pathname of the archive
+          :rtype: str
 
+          :raises: ValueError: the codec is unknown
+          :raises: UnsupportedArchiveCodecException: the codec is xz and lzma is not installed
+        '''
+        if codec not in tarball_resources.ARCHIVE_EXTENSIONS:
+            raise ValueError("unknown index archive codec '%s', use one of %s" % (codec, list(tarball_resources.ARCHIVE_EXTENSIONS.keys())))
         logger.debug("write_tarball() to '%s...'" % filename_prefix)
         added = set([])
-        with tarfile.open('%s.index.tar.gz' % filename_prefix, 'w:gz') as tar:
+        with resource_cache.listing_cache():  # resources of a package mostly share a few directories
             for rapp in self.raw_data.values():
                 # add package.xml file
-                rapp_package_filename = os.path.normpath(rapp.package.filename)
-                if rapp_package_filename not in added:
-                    logger.debug("write_tarball() add package.xml '%s" % rapp_package_filename)
-                    tar.add(rapp_package_filename)
-                    added.add(rapp_package_filename)
+                added.add(os.path.normpath(rapp.package.filename))
                 # add .rapp file
                 rapp_filename = os.path.normpath(rapp.filename)
                 if rapp_filename not in added:
-                    logger.debug("write_tarball() add .rapp file '%s" % rapp_filename)
-                    tar.add(rapp_filename)
                     added.add(rapp_filename)
 
-                    for value in [v for k, v in rapp.yaml_data.items() if k in RESOURCE_KEYS]:
+                    for value in [v for k, v in rapp.yaml_data.items() if k in _RESOURCE_KEYS]:
                         logger.debug("write_index() value: %s" % str(value))
 
-                        if value and os.path.exists(value):
+                        if value and resource_cache.exists(value):
                             normed_path = os.path.normpath(value)
                             logger.debug("write_index() add resource '%s" % str(normed_path))
-                            tar.add(normed_path)
                             added.add(normed_path)
                         else:
                             logger.debug("write_index() path does not exist %s" % str(value))
 
+        filename = filename_prefix + tarball_resources.ARCHIVE_EXTENSIONS[codec]
+        tarball_resources.write_archive(filename, [(_archive_name(path), tarball_resources.read(path)) for path in added], codec)
+        return filename
+
+
+def _archive_name(path):
+    '''
+      Returns the member name of a file in an archive. Members of a loaded index archive keep their original name.
+    '''
+    resources = tarball_resources.find(path)
+    if resources is not None:
+        return os.path.relpath(path, resources.root)
+    return path.lstrip(os.sep)
+
+
+def _chain_error_to_str(e):
+    '''
+      Formats an exception raised while resolving a rapp chain for invalid data.
+    '''
+    if isinstance(e, ParentRappNotFoundException):
+        return str('Invalid parent_name [%s] in resource [%s]' % (str(e.parent_name), str(e.resource_name)))
+    return str(e)
+
+
+def _changed_rapps(old_raw_data, new_raw_data):
+    '''
+      Compares two generations of raw rapps.
+
+      :returns: names of the rapps which have been added, removed or changed
+      :rtype: set
+    '''
+    changed = set(old_raw_data).symmetric_difference(new_raw_data)
+    for resource_name, rapp in new_raw_data.items():
+        old_rapp = old_raw_data.get(resource_name)
+        if old_rapp is not None and (old_rapp.filename != rapp.filename or old_rapp.raw_data != rapp.raw_data):
+            changed.add(resource_name)
+    return changed
+
+
+def _parse_rapp_file(resource_name, path, use_hash=False):
+    '''
+      Parses a rapp file including its resources. The signatures of the files are taken before they are read,
+      so a file changing while it is parsed makes the result miss the parse cache on the next lookup.
+
+      :param resource_name: rapp resource name
+      :type resource_name: str
+      :param path: absolute path to the rapp definition
+      :type path: str
+      :param use_hash: include the md5 of the contents in the signatures, see parse_cache.file_signature
+      :type use_hash: bool
+
+      :returns: raw yaml info, dict of loaded rapp, reason why it is invalid and the signatures of the files the
+                result depends on. The signatures are None if the result must not be cached.
+      :rtype: dict, dict, str, [(str, tuple)]
+    '''
+    signatures = _sign_rapp_file(path, use_hash)
+    try:
+        yaml_data, raw_data = load_rapp_yaml_from_file(path)
+    except RappResourceNotExistException as e:
+        # a missing resource may show up at any time without touching the rapp file itself
+        return None, None, str(resource_name) + ' : ' + str(e), None
+    except InvalidRappException as e:
+        return None, None, str(e), [(path, signatures[path])]
+    dependencies = [path] + [yaml_data[k] for k in _RESOURCE_KEYS if yaml_data.get(k)]
+    # a resource missing from the signatures was only added to the rapp file after it was signed,
+    # whose outdated signature invalidates the entry anyway
+    return yaml_data, raw_data, None, [(p, signatures[p] if p in signatures else file_signature(p, use_hash)) for p in dependencies]
+
+
+def _sign_rapp_file(path, use_hash):
+    '''
+      Takes the signatures of a rapp file and of the resources it references before the rapp loader reads them.
+
+      :returns: signature by path
+      :rtype: {str: tuple}
+    '''
+    signatures = {path: file_signature(path, use_hash)}
+    try:
+        with open(path) as f:
+            document = yaml.safe_load(f)  # a few lines, the resources are signed before the loader reads them
+    except (IOError, yaml.YAMLError):
+        return signatures
+    if isinstance(document, dict):
+        base_path = os.path.dirname(path)
+        for k in _RESOURCE_KEYS:
+            resource = document.get(k)
+            if resource and isinstance(resource, (str, type(u''))):
+                resource_path = os.path.normpath(os.path.join(base_path, resource))
+                signatures[resource_path] = file_signature(resource_path, use_hash)
+    return signatures
+
+
+def _parse_rapp_file_worker(rapp):
+    '''
+      Process pool entry point of _parse_rapp_file.
+
+      :param rapp: resource name, path and whether to hash the contents
+      :type rapp: (str, str, bool)
+    '''
+    return _parse_rapp_file(*rapp)
+
 
 def read_tarball(name=None, fileobj=None, package_whitelist=None, package_blacklist=[]):
     '''
-      Reads an index from a gzipped tarball.
+      Reads an index from a gzip, xz or uncompressed tarball. The archive is not extracted, its
+      files are read from memory (see :mod:`.tarball_resources`).
 
       :param name: the pathname of the archive
       :type name: str
@@ -320,16 +975,13 @@ def read_tarball(name=None, fileobj=None, package_whitelist=None, package_blackl
 
       :returns: the index
       :rtype: rocon_app_utilities.RappIndexer
+
+      :raises: UnsupportedArchiveCodecException: the archive is xz compressed and lzma is not installed
     '''
-    # TODO avoid unpacking
     logger.debug('read_tarball(name=%s, fileobj=%s)' % (name, fileobj))
-    tempdir = tempfile.mkdtemp(suffix='_unpacked', prefix='rapp_index_')
-    try:
-        logger.debug("read_tarball() unpack to '%s'" % tempdir)
-        with tarfile.open(name=name, fileobj=fileobj, mode='r:gz') as tar:
-            tar.extractall(tempdir)
-        index = RappIndexer(packages_path=tempdir, package_whitelist=package_whitelist, package_blacklist=package_blacklist)
-    finally:
-        #shutil.rmtree(tempdir)
-        pass
+    resources = tarball_resources.register(tarball_resources.TarballResources.from_tarball(name=name, fileobj=fileobj))
+    raw_data_path, unused_invalid_path = resources.resource_index_from_package_exports('rocon_app', package_whitelist, package_blacklist)
+    index = RappIndexer(raw_data={}, package_whitelist=package_whitelist, package_blacklist=package_blacklist, use_cache=False)
+    index.archives.append(resources)  # registered as long as the index is referenced
+    index._index_rapp_files(raw_data_path, package_whitelist, package_blacklist)
     return index
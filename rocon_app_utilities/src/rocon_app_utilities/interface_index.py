@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+#################################################################################
+
+from __future__ import division, print_function
+import collections
+
+#################################################################################
+# Interface Index
+#################################################################################
+
+CONNECTION_TYPES = ['publishers', 'subscribers', 'services', 'action_clients', 'action_servers']
+
+
+def iter_connections(public_interface):
+    '''
+      Flattens a public interface.
+
+      :param public_interface: connections by connection type, as loaded from an interface file
+      :type public_interface: dict
+
+      :returns: connection type, name and message type of every connection. The message type is None if the
+                connection gives none.
+      :rtype: iter((str, str, str))
+    '''
+    for connection_type in CONNECTION_TYPES:
+        for connection in (public_interface or {}).get(connection_type) or []:
+            if isinstance(connection, dict):
+                yield connection_type, connection.get('name'), connection.get('type')
+            else:
+                yield connection_type, connection, None
+
+
+PublicConnection = collections.namedtuple('PublicConnection', ['connection_type', 'name', 'msg_type', 'is_global'])
+
+
+def compile_public_interface(public_interface):
+    '''
+      Normalises a public interface into an immutable table, so that starting a rapp does not have to
+      inspect the raw connections again.
+
+      :param public_interface: connections by connection type, as loaded from an interface file
+      :type public_interface: dict
+
+      :returns: the connections in the order of CONNECTION_TYPES. The message type is None for connections
+                of the deprecated format giving the name only.
+      :rtype: (PublicConnection)
+    '''
+    return tuple(PublicConnection(connection_type, name, msg_type, bool(name) and name.startswith('/'))
+                 for connection_type, name, msg_type in iter_connections(public_interface))
+
+
+class InterfaceIndex(object):
+    '''
+      Inverted index of the public interfaces of rapps, keyed on (connection type, name) and on
+      (connection type, message type). A query only intersects the buckets of the requested keys.
+    '''
+
+    __slots__ = ['connections', '_by_name', '_by_type']
+
+    def __init__(self):
+        self.connections = {}  # resource_name : (connection type, name, message type) tuples
+        self._by_name = {}  # (connection type, name) : set of resource names
+        self._by_type = {}  # (connection type, message type) : set of resource names
+
+    def add(self, resource_name, public_interface):
+        '''
+          Adds a rapp.
+
+          :param resource_name: rapp name
+          :type resource_name: str
+          :param public_interface: its resolved public interface, i.e. including the inherited one
+          :type public_interface: dict
+        '''
+        self.remove(resource_name)
+        connections = tuple(iter_connections(public_interface))
+        self.connections[resource_name] = connections
+        for connection_type, name, msg_type in connections:
+            if name is not None:
+                self._by_name.setdefault((connection_type, name), set([])).add(resource_name)
+            if msg_type is not None:
+                self._by_type.setdefault((connection_type, msg_type), set([])).add(resource_name)
+
+    def remove(self, resource_name):
+        connections = self.connections.pop(resource_name, ())
+        for connection_type, name, msg_type in connections:
+            for buckets, key in [(self._by_name, (connection_type, name)), (self._by_type, (connection_type, msg_type))]:
+                bucket = buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(resource_name)
+                    if not bucket:
+                        del buckets[key]
+
+    def query(self, connection_type=None, name=None, msg_type=None):
+        '''
+          Finds the rapps with a connection of the given name and/or message type.
+
+          :param connection_type: one of CONNECTION_TYPES, None for any
+          :type connection_type: str
+          :param name: connection name, e.g. '/teleop/cmd_vel'
+          :type name: str
+          :param msg_type: message type, e.g. 'geometry_msgs/Twist'
+          :type msg_type: str
+
+          :returns: names of the matching rapps
+          :rtype: set
+
+          :raises: ValueError: neither name nor msg_type is given
+        '''
+        if name is None and msg_type is None:
+            raise ValueError('a connection name or message type is required')
+        matches = set([])
+        for t in [connection_type] if connection_type else CONNECTION_TYPES:
+            candidates = None
+            if name is not None:
+                candidates = self._by_name.get((t, name), set([]))
+            if msg_type is not None:
+                by_type = self._by_type.get((t, msg_type), set([]))
+                candidates = by_type if candidates is None else candidates & by_type
+            matches.update(candidates)
+        return matches
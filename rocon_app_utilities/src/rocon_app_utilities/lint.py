@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+#################################################################################
+'''
+ Validation of every rapp of a rapp tree backing 'rocon_app lint'. Unlike
+ indexing, which stops at the first problem of a rapp, all problems are
+ collected: fields, launch file, public interface and parameters files,
+ resource existence and chains (missing parents, cycles, invalid children).
+'''
+#################################################################################
+
+from __future__ import division, print_function
+import multiprocessing
+import os
+import time
+import yaml
+
+import rocon_python_utils
+
+from . import resource_cache
+from .exceptions import *
+from .indexer import RappIndexer, _chain_error_to_str
+from .rapp import Rapp
+from .rapp_loader import RAPP_ATTRIBUTES, _find_resource, get_launch_args
+from .rapp_validation import classify_rapp_type
+from .yaml_cache import load_yaml
+
+import logging
+import sys
+logger = logging.getLogger('lint')
+logger.addHandler(logging.StreamHandler(sys.stderr))
+#logger.setLevel(logging.DEBUG)
+
+# Categories of the problems in a report
+LINT_CHECKS = ['yaml', 'fields', 'resource', 'launch', 'interface', 'parameters', 'chain', 'internal']
+
+INTERFACE_KEYS = ['subscribers', 'publishers', 'services', 'action_clients', 'action_servers']
+
+
+def lint_path(packages_path, workers=1):
+    '''
+      Validates every rapp exported by the packages of a rapp tree. Rapp files are checked in a process pool if
+      more than one worker is configured, chains are checked afterwards on the rapps whose fields are valid.
+
+      :param packages_path: path to a rapp tree
+      :type packages_path: str
+      :param workers: number of processes checking rapp files
+      :type workers: int
+
+      :returns: the report, it only holds builtin types so that it can be dumped as json. 'rapps' maps every
+                resource name to its 'file', 'package', 'type', 'problems' and checking 'time'. Every problem
+                has a 'check' (see LINT_CHECKS) and a 'message'.
+      :rtype: dict
+    '''
+    start = time.time()
+    raw_data_path, invalid_path = rocon_python_utils.ros.resource_index_from_package_exports('rocon_app', [packages_path])
+    discovered = time.time()
+
+    rapps = sorted((resource_name, path) for resource_name, (path, unused_package) in raw_data_path.items())
+    with resource_cache.listing_cache():
+        results = _map(_lint_rapp_file_worker, rapps, workers)
+    checked = time.time()
+
+    report = {}
+    for (resource_name, path), (document, problems, elapsed) in zip(rapps, results):
+        report[resource_name] = {'file': path,
+                                 'package': raw_data_path[resource_name][1].name,
+                                 'type': None,
+                                 'problems': problems,
+                                 'time': elapsed}
+    for resource_name, (path, package) in invalid_path.items():
+        report[resource_name] = {'file': path,
+                                 'package': package.name,
+                                 'type': None,
+                                 'problems': [_problem('resource', 'exported rapp file does not exist')],
+                                 'time': 0.0}
+
+    # chains of the rapps whose own fields are valid, a rapp with invalid fields is missing as a parent
+    raw_data = {}
+    for (resource_name, path), (document, problems, elapsed) in zip(rapps, results):
+        if document is not None and not [p for p in problems if p['check'] in ['yaml', 'fields']]:
+            rapp = Rapp(resource_name)
+            rapp.load_rapp_yaml(path, document, document)
+            raw_data[resource_name] = rapp
+    index = RappIndexer(raw_data=raw_data, use_cache=False)
+    index._resolve_all()
+    for resource_name in raw_data:
+        if resource_name in index._chain_errors:
+            report[resource_name]['problems'].append(_problem('chain', _chain_error_to_str(index._chain_errors[resource_name])))
+        else:
+            report[resource_name]['type'] = index._resolved[resource_name][0].type
+    resolved = time.time()
+
+    invalid = [name for name, rapp in report.items() if rapp['problems']]
+    return {'path': packages_path,
+            'rapps': report,
+            'summary': {'rapps': len(report),
+                        'invalid': len(invalid),
+                        'problems': sum(len(rapp['problems']) for rapp in report.values()),
+                        'workers': workers},
+            'timings': {'discover': discovered - start,
+                        'check': checked - discovered,
+                        'chains': resolved - checked,
+                        'total': resolved - start}}
+
+
+def lint_rapp_file(path):
+    '''
+      Checks a single rapp file on its own, i.e. everything but its chain.
+
+      :param path: absolute path to the rapp definition
+      :type path: str
+
+      :returns: the parsed rapp file or None if it can not be parsed, problems
+      :rtype: dict, [dict]
+    '''
+    problems = []
+    try:
+        document = load_yaml(path) or {}
+    except (IOError, yaml.YAMLError) as e:
+        return None, [_problem('yaml', str(e))]
+    if not isinstance(document, dict):
+        return None, [_problem('yaml', 'expected a mapping of fields, got [%s]' % str(document))]
+    document = dict(document)
+
+    for field in sorted(document):
+        if field not in RAPP_ATTRIBUTES:
+            problems.append(_problem('fields', 'invalid field [%s]' % str(field)))
+    try:
+        classify_rapp_type(document)
+    except InvalidRappFieldException as e:
+        problems.append(_problem('fields', str(e)))
+    except InvalidRappException as e:
+        problems.append(_problem('fields', str(e)))
+
+    base_path = os.path.dirname(path)
+    for field, check in [('launch', _lint_launch), ('icon', None), ('public_interface', _lint_interface), ('public_parameters', _lint_parameters)]:
+        if not document.get(field):
+            continue
+        try:
+            resource_path = _find_resource(base_path, document[field])
+        except RappResourceNotExistException as e:
+            problems.append(_problem('resource', '%s: %s' % (field, str(e))))
+            continue
+        if check is not None:
+            problems.extend(check(resource_path))
+    return document, problems
+
+
+def _lint_launch(path):
+    try:
+        get_launch_args(path)
+    except RappMalformedException as e:
+        return [_problem('launch', str(e))]
+    return []
+
+
+def _lint_interface(path):
+    try:
+        interface = load_yaml(path) or {}
+    except (IOError, yaml.YAMLError) as e:
+        return [_problem('interface', str(e))]
+    if not isinstance(interface, dict):
+        return [_problem('interface', 'expected a mapping of connection types, got [%s]' % str(interface))]
+    problems = []
+    for key, connections in sorted(interface.items()):
+        if key not in INTERFACE_KEYS:
+            problems.append(_problem('interface', 'invalid connection type [%s]' % str(key)))
+        elif not isinstance(connections, list):
+            problems.append(_problem('interface', '[%s] is not a list' % str(key)))
+    return problems
+
+
+def _lint_parameters(path):
+    try:
+        parameters = load_yaml(path) or {}
+    except (IOError, yaml.YAMLError) as e:
+        return [_problem('parameters', str(e))]
+    if not isinstance(parameters, dict):
+        return [_problem('parameters', 'expected a mapping of parameters, got [%s]' % str(parameters))]
+    return []
+
+
+def _problem(check, message):
+    return {'check': check, 'message': message}
+
+
+def _lint_rapp_file_worker(rapp):
+    '''
+      Process pool entry point of lint_rapp_file.
+
+      :param rapp: resource name and path
+      :type rapp: (str, str)
+
+      :returns: parsed rapp file, problems, seconds spent
+      :rtype: dict, [dict], float
+    '''
+    start = time.time()
+    try:
+        document, problems = lint_rapp_file(rapp[1])
+    except Exception as e:  # report it rather than losing the whole run
+        logger.debug("lint_rapp_file() failed on '%s' [%s]" % (rapp[1], str(e)))
+        document, problems = None, [_problem('internal', 'unexpected error [%s]' % str(e))]
+    return document, problems, time.time() - start
+
+
+def _map(func, items, workers):
+    workers = min(workers or 1, len(items))
+    if workers <= 1:
+        return [func(item) for item in items]
+    pool = multiprocessing.Pool(workers)
+    try:
+        return pool.map(func, items, max(1, len(items) // (workers * 4)))
+    finally:
+        pool.close()
+        pool.join()
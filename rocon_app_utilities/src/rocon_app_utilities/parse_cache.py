@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+#################################################################################
+
+from __future__ import division, print_function
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+import hashlib
+import os
+import tempfile
+
+import rospkg
+
+import logging
+import sys
+logger = logging.getLogger('parse_cache')
+logger.addHandler(logging.StreamHandler(sys.stderr))
+#logger.setLevel(logging.DEBUG)
+
+_parse_cache_file = os.path.join(rospkg.get_ros_home(), 'rocon', 'rapp', 'rapp_parse.cache')
+
+# Bump whenever the layout of the cached entries or the rapp loader output changes
+PARSE_CACHE_VERSION = 1
+
+
+class RappParseCache(object):
+    '''
+      Persistent cache of parsed .rapp files.
+
+      Every entry is keyed by the absolute path of the .rapp file and remembers the
+      signature (mtime, size and optionally a content hash) of each file which was
+      read while parsing it, i.e. the .rapp file itself and its launch, icon,
+      interface and parameters resources. An entry is only reused while all of
+      these signatures are unchanged.
+    '''
+
+    __slots__ = ['filename', 'use_hash', 'entries', 'hits', 'misses', '_dirty', '_seen']
+
+    def __init__(self, filename=None, use_hash=False):
+        '''
+          :param filename: path to the cache file, defaults to ~/.ros/rocon/rapp/rapp_parse.cache
+          :type filename: str
+          :param use_hash: also compare the md5 of the file contents, not only mtime and size
+          :type use_hash: bool
+        '''
+        self.filename = filename if filename else _parse_cache_file
+        self.use_hash = use_hash
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._seen = set([])
+        self.load()
+
+    def load(self):
+        '''
+          Loads the entries from the cache file. A missing, corrupted or outdated cache file results in an empty cache.
+        '''
+        self.entries = {}
+        try:
+            with open(self.filename, 'rb') as f:
+                version, entries = pickle.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError) as e:
+            logger.debug("load() no usable parse cache at '%s' [%s]" % (self.filename, str(e)))
+            return
+        if version != PARSE_CACHE_VERSION or not isinstance(entries, dict):
+            logger.debug("load() discard parse cache of version %s" % str(version))
+            return
+        self.entries = entries
+
+    def save(self):
+        '''
+          Writes the cache file if any entry has changed. Entries of rapp files which were not looked up
+          during this session and do not exist any longer are dropped.
+        '''
+        if not self._dirty:
+            return
+        for path in [p for p in self.entries if p not in self._seen]:
+            if not os.path.exists(path):
+                del self.entries[path]
+
+        base_path = os.path.dirname(self.filename)
+        try:
+            if not os.path.exists(base_path):
+                os.makedirs(base_path)
+            # write to a temporary file first so that concurrent readers never see a partial cache
+            fd, tmp_filename = tempfile.mkstemp(prefix='.rapp_parse_', dir=base_path)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((PARSE_CACHE_VERSION, self.entries), f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_filename, self.filename)
+            self._dirty = False
+        except (IOError, OSError) as e:
+            logger.debug("save() failed to write parse cache to '%s' [%s]" % (self.filename, str(e)))
+
+    def clear(self):
+        '''
+          Drops all entries.
+        '''
+        self.entries = {}
+        self._dirty = True
+
+    def signature(self, path):
+        '''
+          Returns the signature of the given file, see file_signature.
+        '''
+        return file_signature(path, self.use_hash)
+
+    def lookup(self, path):
+        '''
+          Returns the cached parse result of the given rapp file if none of the files it depends on has changed.
+
+          :param path: absolute path of the .rapp file
+          :type path: str
+
+          :returns: (yaml_data, raw_data, reason) or None on a cache miss. reason is None for a parsable rapp.
+          :rtype: (dict, dict, str)
+        '''
+        self._seen.add(path)
+        entry = self.entries.get(path)
+        if entry is not None:
+            signatures, result = entry
+            if all(self.signature(p) == sig for p, sig in signatures):
+                self.hits += 1
+                return result
+        self.misses += 1
+        return None
+
+    def store(self, path, signatures, yaml_data, raw_data, reason=None):
+        '''
+          Stores the parse result of the given rapp file.
+
+          :param path: absolute path of the .rapp file
+          :type path: str
+          :param signatures: all files which were read while parsing, including path itself, with the signature
+                             (see file_signature) each of them had before it was read. Taking them afterwards
+                             would pair the contents of a file changed meanwhile with its new signature.
+          :type signatures: [(str, tuple)]
+          :param yaml_data: raw yaml info as returned by the rapp loader
+          :type yaml_data: dict
+          :param raw_data: dict of the loaded rapp
+          :type raw_data: dict
+          :param reason: why the rapp is invalid, None if it is parsable
+          :type reason: str
+        '''
+        if any(sig is None for unused_p, sig in signatures):
+            return  # vanished in the meantime, do not cache
+        self._seen.add(path)
+        self.entries[path] = (tuple(signatures), (yaml_data, raw_data, reason))
+        self._dirty = True
+
+
+def file_signature(path, use_hash=False):
+    '''
+      Returns the signature of the given file.
+
+      :param path: absolute path of the file
+      :type path: str
+      :param use_hash: include the md5 of the file contents
+      :type use_hash: bool
+
+      :returns: (mtime, size[, md5]) or None if the file does not exist
+      :rtype: tuple
+    '''
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not use_hash:
+        return (st.st_mtime, st.st_size)
+    try:
+        with open(path, 'rb') as f:
+            digest = hashlib.md5(f.read()).hexdigest()
+    except IOError:
+        return None
+    return (st.st_mtime, st.st_size, digest)
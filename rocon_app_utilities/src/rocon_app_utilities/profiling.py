@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+#################################################################################
+'''
+ Synthetic rapp trees and timing helpers backing 'rocon_app profile'.
+'''
+#################################################################################
+
+from __future__ import division, print_function
+import sys
+import time
+
+from . import tarball_resources
+from . import yaml_cache
+from .indexer import RappIndexer
+from .rapp import Rapp
+
+#################################################################################
+# Synthetic Index
+#################################################################################
+
+SYNTHETIC_COMPATIBILITIES = ['rocon:/', 'rocon:/kobuki', 'rocon:/turtlebot2', 'rocon:/pr2', 'rocon:/turtlebot2|kobuki/*/hydro|indigo']
+
+
+def synthetic_index(num_rapps, depth=1):
+    '''
+      Generates an index of in-memory rapps without touching the filesystem. Rapps are grouped into chains of
+      the given depth, each headed by a virtual ancestor followed by implementation children.
+
+      :param num_rapps: total number of rapps
+      :type num_rapps: int
+      :param depth: number of rapps per chain including its virtual ancestor
+      :type depth: int
+
+      :returns: the index
+      :rtype: rocon_app_utilities.RappIndexer
+    '''
+    depth = max(2, depth)
+    raw_data = {}
+    for i in range(num_rapps):
+        chain, level = divmod(i, depth)
+        resource_name = 'synthetic_%d/rapp_%d' % (chain, level)
+        if level == 0:
+            data = {'display': 'Synthetic %d' % chain,
+                    'description': 'Synthetic virtual ancestor %d' % chain,
+                    'public_interface': {'publishers': [{'name': 'chatter_%d' % chain, 'type': 'std_msgs/String'}],
+                                         'subscribers': [], 'services': [], 'action_clients': [], 'action_servers': []},
+                    'public_parameters': {'rate': chain}
+                    }
+        else:
+            data = {'compatibility': SYNTHETIC_COMPATIBILITIES[chain % len(SYNTHETIC_COMPATIBILITIES)],
+                    'launch': '/synthetic_%d/rapp_%d.launch' % (chain, level),
+                    'parent_name': 'synthetic_%d/rapp_%d' % (chain, level - 1)
+                    }
+        r = Rapp(resource_name)
+        r.load_rapp_yaml('/synthetic_%d/rapp_%d.rapp' % (chain, level), dict(data), data)
+        raw_data[resource_name] = r
+    return RappIndexer(raw_data=raw_data)
+
+
+
+def synthetic_parsed_rapps(num_rapps, num_packages=100, num_interfaces=20):
+    '''
+      Generates the data of implementation rapps as the rapp parser returns it: no string or structure is
+      shared between two rapps, even if their values are equal. Rapps are spread over packages and use one of
+      a few public interfaces, like the rapps of a large repository.
+
+      :param num_rapps: number of rapps
+      :type num_rapps: int
+      :param num_packages: number of packages holding them
+      :type num_packages: int
+      :param num_interfaces: number of distinct public interfaces
+      :type num_interfaces: int
+
+      :returns: resource name, rapp filename, yaml data and raw data of every rapp
+      :rtype: [(str, str, dict, dict)]
+    '''
+    parsed = []
+    for i in range(num_rapps):
+        package = 'synthetic_%d' % (i % num_packages)
+        interface = i % num_interfaces
+        path = '/opt/ros/share/%s/apps/rapp_%d' % (package, i)
+        public_interface = {'publishers': [{'name': '/%s/chatter_%d' % ('synthetic', interface), 'type': '%s/String' % 'std_msgs'}],
+                            'subscribers': [{'name': '/%s/cmd_vel' % 'synthetic', 'type': '%s/Twist' % 'geometry_msgs'}],
+                            'services': [], 'action_clients': [], 'action_servers': []}
+        raw_data = {'display': 'Synthetic %d' % i,
+                    'description': 'Synthetic rapp %d' % i,
+                    'compatibility': '%s' % SYNTHETIC_COMPATIBILITIES[i % len(SYNTHETIC_COMPATIBILITIES)],
+                    'launch': '%s/rapp_%d.launch' % (path, i),
+                    'public_interface': public_interface,
+                    'public_parameters': {'rate': '%d' % 10, 'frame_id': '%s_link' % 'base'},
+                    'required_capabilities': [{'name': '%s/DifferentialMobileBase' % 'std_capabilities'}]}
+        yaml_data = dict(raw_data, public_interface='%s/rapp.interface' % path, public_parameters='%s/rapp.parameters' % path,
+                         launch='%s/rapp_%d.launch' % (path, i))
+        parsed.append(('%s/rapp_%d' % (package, i), '%s/rapp_%d.rapp' % (path, i), yaml_data, raw_data))
+    return parsed
+
+
+#################################################################################
+# Memory
+#################################################################################
+
+
+def deep_sizeof(objects, excluded_types=()):
+    '''
+      Sums the sizes of the given objects and of everything they reference through containers and slots,
+      counting every object once, however often it is referenced.
+
+      :param objects: root objects
+      :type objects: iterable
+      :param excluded_types: types of objects neither counted nor followed, e.g. shared helpers
+      :type excluded_types: tuple
+
+      :returns: bytes
+      :rtype: int
+    '''
+    seen = set([])
+    size = 0
+    stack = list(objects)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, excluded_types) or isinstance(obj, type):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        else:
+            for cls in type(obj).__mro__:
+                for slot in getattr(cls, '__slots__', ()):
+                    if hasattr(obj, slot):
+                        stack.append(getattr(obj, slot))
+            if hasattr(obj, '__dict__'):
+                stack.append(obj.__dict__)
+    return size
+
+
+def profile_memory(num_rapps):
+    '''
+      Compares the memory held by the parsed data of synthetic rapps with the one held by the rapps of an
+      index loaded from it, whose strings and structures are interned.
+
+      :param num_rapps: number of rapps
+      :type num_rapps: int
+
+      :returns: (label, bytes per rapp) pairs
+      :rtype: [(str, int)]
+    '''
+    import rospkg
+    parsed = synthetic_parsed_rapps(num_rapps)
+    parsed_size = deep_sizeof([parsed])
+    index = RappIndexer(raw_data={})
+    for resource_name, filename, yaml_data, raw_data in parsed:
+        r = Rapp(resource_name, index.rospack)
+        r.load_rapp_yaml(filename, yaml_data, raw_data)
+        index.raw_data[resource_name] = r
+    del parsed
+    index_size = deep_sizeof([index.raw_data], excluded_types=(rospkg.RosPack,))
+    return [('parsed bytes per rapp', parsed_size // max(1, num_rapps)), ('indexed bytes per rapp', index_size // max(1, num_rapps))]
+
+#################################################################################
+# Timing
+#################################################################################
+
+
+def timeit(func, repeat=1):
+    '''
+      Runs the given callable and returns the best wall clock time and the result of the last run.
+
+      :param func: callable without arguments
+      :type func: callable
+      :param repeat: number of runs
+      :type repeat: int
+
+      :returns: seconds, result
+      :rtype: float, object
+    '''
+    best = None
+    result = None
+    for unused_i in range(max(1, repeat)):
+        start = time.time()
+        result = func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def profile_resolution(index):
+    '''
+      Measures the resolution of every implementation in the index, first with an empty resolution cache,
+      then after touching a single ancestor and finally fully cached.
+
+      :param index: the index
+      :type index: rocon_app_utilities.RappIndexer
+
+      :returns: (label, seconds) pairs
+      :rtype: [(str, float)]
+    '''
+    def resolve_all():
+        resolved = 0
+        for resource_name, rapp in index.raw_data.items():
+            if rapp.is_implementation:
+                try:
+                    index._resolve(resource_name)
+                    resolved += 1
+                except Exception:
+                    pass
+        return resolved
+
+    index._invalidate(set(index.raw_data))
+    cold, unused_resolved = timeit(resolve_all)
+    ancestors = sorted(name for name, rapp in index.raw_data.items() if not rapp.parent_name)
+    if ancestors:
+        index.merge(RappIndexer(raw_data={ancestors[0]: index.raw_data[ancestors[0]]}))
+    touched, unused_resolved = timeit(resolve_all)
+    warm, unused_resolved = timeit(resolve_all, 3)
+    return [('cold resolve', cold), ('one ancestor touched', touched), ('warm resolve', warm)]
+
+
+def profile_compatibility(index, uri):
+    '''
+      Compares checking every implementation against the uri with a query on the compatibility index.
+
+      :param index: the index
+      :type index: rocon_app_utilities.RappIndexer
+      :param uri: rocon uri to query
+      :type uri: str
+
+      :returns: (label, seconds) pairs
+      :rtype: [(str, float)]
+    '''
+    def scan():
+        return [name for name, rapp in index.raw_data.items() if rapp.is_implementation and rapp.is_compatible(uri)]
+
+    def query():
+        index._update_compatibility()
+        return index._compatibility.query(uri)[0]
+
+    scanned, unused_compatible = timeit(scan)
+    index._compatibility_pending = None
+    built, unused_compatible = timeit(query)
+    queried, unused_compatible = timeit(query, 3)
+    return [('compatibility scan', scanned), ('compatibility index build', built), ('compatibility query', queried)]
+
+
+def profile_yaml(index, repeat=1):
+    '''
+      Compares parsing the yaml files of the rapps in the index (rapp, interface and parameter files) once per
+      referencing rapp with the pure python loader, as rapps used to be loaded, with loading them through the
+      yaml cache.
+
+      :param index: the index
+      :type index: rocon_app_utilities.RappIndexer
+      :param repeat: number of runs per measurement
+      :type repeat: int
+
+      :returns: (label, seconds) pairs
+      :rtype: [(str, float)]
+    '''
+    import yaml
+    paths = []
+    for rapp in index.raw_data.values():
+        paths.append(rapp.filename)
+        paths.extend(rapp.yaml_data[k] for k in ['public_interface', 'public_parameters'] if rapp.yaml_data.get(k))
+
+    def python_loader():
+        return [yaml.load(tarball_resources.read(path), Loader=yaml.SafeLoader) for path in paths]
+
+    def cold_cache():
+        yaml_cache.clear_yaml_cache()
+        return [yaml_cache.load_yaml(path) for path in paths]
+
+    def warm_cache():
+        return [yaml_cache.load_yaml(path) for path in paths]
+
+    python, unused_documents = timeit(python_loader, repeat)
+    cold, unused_documents = timeit(cold_cache, repeat)
+    warm, unused_documents = timeit(warm_cache, repeat)
+    loader = 'libyaml' if yaml_cache.SafeLoader is not yaml.SafeLoader else 'python'
+    return [('pure python yaml', python), ('yaml cache, cold (%s)' % loader, cold), ('yaml cache, warm', warm)]
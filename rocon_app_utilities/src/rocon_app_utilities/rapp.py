@@ -6,7 +6,13 @@
 #################################################################################
 
 from __future__ import division, print_function
+import collections
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
 import yaml
+from .compact import RAPP_STRINGS
 from .exceptions import *
 import rocon_uri
 from .rapp_validation import classify_rapp_type 
@@ -17,6 +23,107 @@ import rospkg
 # Rapp Class 
 #################################################################################
 
+INHERITABLE_ATTRIBUTES = ['display', 'description', 'icon', 'public_interface', 'public_parameters', 'parent_name']
+
+# what indexing the chains, compatibility and capabilities needs to know of a raw rapp, see Rapp.summary
+RappSummary = collections.namedtuple('RappSummary', ['parent_name', 'is_implementation', 'compatibility', 'required_capabilities'])
+
+
+
+class LayeredRappData(MutableMapping):
+    '''
+        View of the raw data of a resolved rapp. Keys of the rapp itself are looked up in its own layer,
+        inheritable ones it does not define in the layers of its resolved parent. Nothing is copied: inherited
+        values such as public_interface are the very objects loaded for the ancestor. The first write copies the
+        resolved data into a private dict, which later reads and writes go to, so the layers shared with the
+        parent, the siblings and other views stay untouched.
+    '''
+    __slots__ = ['_own', '_parent', '_keys', '_private']
+
+    def __init__(self, own, parent=None):
+        '''
+          :param own: raw data of the rapp itself, including its parent_name
+          :type own: dict
+          :param parent: resolved raw data of its parent
+          :type parent: LayeredRappData
+        '''
+        self._own = own
+        self._parent = parent
+        self._keys = None
+        self._private = False  # whether _own was materialised by a write and is no longer shared
+
+    def __getitem__(self, key):
+        if key != 'parent_name' and key in self._own:
+            return self._own[key]
+        if self._parent is not None and key in INHERITABLE_ATTRIBUTES:
+            return self._parent[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if key != 'parent_name' and key in self._own:
+            return True
+        return self._parent is not None and key in INHERITABLE_ATTRIBUTES and key in self._parent
+
+    def _key_set(self):
+        if self._keys is None:
+            keys = set(self._own)
+            keys.discard('parent_name')
+            if self._parent is not None:
+                keys.update(k for k in INHERITABLE_ATTRIBUTES if k in self._parent)
+            self._keys = frozenset(keys)
+        return self._keys
+
+    def __iter__(self):
+        return iter(self._key_set())
+
+    def __len__(self):
+        return len(self._key_set())
+
+    def __setitem__(self, key, value):
+        self._materialise()[key] = value
+        self._keys = None
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        del self._materialise()[key]
+        self._keys = None
+
+    def _materialise(self):
+        '''
+          returns the private dict holding the resolved data, copied from the layers on the first write
+        '''
+        if not self._private:
+            self._own, self._parent, self._private = self.copy(), None, True
+        return self._own
+
+    def view(self):
+        '''
+          returns another view of the same layers, whose writes are private to it as well
+
+          :rtype: LayeredRappData
+        '''
+        if self._private:
+            return LayeredRappData(dict(self._own))
+        view = LayeredRappData(self._own, self._parent)
+        view._keys = self._keys
+        return view
+
+    def __repr__(self):
+        return repr(self.copy())
+
+    def copy(self):
+        '''
+          returns the resolved data as a new dict. Its values are still shared with the rapp layers.
+
+          :rtype: dict
+        '''
+        return dict((k, self[k]) for k in self._key_set())
+
+    def __reduce__(self):
+        return (dict, (self.copy(),))
+
+
 
 class Rapp(object):
     '''
@@ -25,7 +132,7 @@ class Rapp(object):
     __slots__ = ['resource_name', 'yaml_data', 'raw_data', 'data', 'type', 'is_implementation', 'is_ancestor', 'ancestor_name', 'parent_name', 'rospack', 'package', 'filename']
 
     def __init__(self, name, rospack=rospkg.RosPack(), filename=None):
-        self.resource_name = name
+        self.resource_name = RAPP_STRINGS.intern_string(name)
         self.yaml_data = {}
         self.raw_data = {}
         self.data = {}
@@ -44,6 +151,51 @@ class Rapp(object):
     def __str__(self):
         return str(self.resource_name + ' - ' + self.type)
 
+    def view(self):
+        '''
+          returns a shallow copy which shares the loaded yaml and raw data with this rapp but holds its own
+          specification data (see load_rapp_specs_from_file). Writes to the raw data of a resolved rapp stay
+          private to the view.
+
+          :returns: rapp
+          :rtype: rocon_app_utilities.Rapp
+        '''
+        rapp = Rapp(self.resource_name, self.rospack)
+        for attribute in ['yaml_data', 'raw_data', 'type', 'is_implementation', 'is_ancestor', 'ancestor_name', 'parent_name', 'package', 'filename']:
+            if hasattr(self, attribute):
+                setattr(rapp, attribute, getattr(self, attribute))
+        if isinstance(self.raw_data, LayeredRappData):
+            rapp.raw_data = self.raw_data.view()  # copied on write, see LayeredRappData
+        return rapp
+
+    def resolve(self, parent=None):
+        '''
+          returns a view of this rapp which includes the attributes inherited along its whole chain.
+          Its raw_data is layered over the one of its parent, so inherited values are shared, not copied.
+
+          :param parent: resolved view of its parent. None if it is an ancestor
+          :type parent: rocon_app_utilities.Rapp
+
+          :returns: resolved rapp whose raw_data is copied on write
+          :rtype: rocon_app_utilities.Rapp
+
+          :raises: InvalidRappException: It is virtual child rapp after inheriting
+          :raises: InvalidRappFieldException: Rapp contains invalid field after inheriting
+        '''
+        rapp = self.view()
+        rapp.raw_data = LayeredRappData(self.raw_data, parent.raw_data if parent is not None else None)
+        rapp.ancestor_name = parent.ancestor_name if parent is not None else self.resource_name
+        rapp.classify()
+        return rapp
+
+    def summary(self):
+        '''
+          returns the fields of the raw rapp its chain, compatibility and capabilities are indexed by
+
+          :rtype: RappSummary
+        '''
+        return RappSummary(self.parent_name, self.is_implementation, self.raw_data.get('compatibility'), self.raw_data.get('required_capabilities'))
+
     def is_compatible(self, uri):
         '''
           it compares its compatibility with given uri. and returns true if it is compatible.
@@ -83,17 +235,41 @@ class Rapp(object):
         '''
 
         try:
-            self.yaml_data, self.raw_data = load_rapp_yaml_from_file(filename)
-            self.filename = filename
-            self.classify()
+            yaml_data, raw_data = load_rapp_yaml_from_file(filename)
         except RappResourceNotExistException as e:
             raise InvalidRappException(str(self.resource_name) + ' : ' + str(e))
+        self.load_rapp_yaml(filename, yaml_data, raw_data)
+
+    def load_rapp_yaml(self, filename, yaml_data, raw_data):
+        '''
+          sets already parsed rapp data (e.g. from the parse cache). and classifies itself.
+          Strings, public interfaces and other nested values are interned (see :class:`.compact.InternTable`),
+          so they are shared with other rapps and read-only. yaml_data becomes a read-only overlay of raw_data.
+
+          :param filename: absolute path to rapp definition
+          :type filename: str
+          :param yaml_data: raw yaml info
+          :type yaml_data: dict
+          :param raw_data: dict of loaded rapp
+          :type raw_data: dict
+        '''
+        self.raw_data = RAPP_STRINGS.intern_data(raw_data)
+        self.yaml_data = RAPP_STRINGS.intern_overlay(yaml_data, self.raw_data)
+        self.filename = RAPP_STRINGS.intern_string(filename)
+        self.classify()
 
-    def load_rapp_specs_from_file(self):
+    def load_rapp_specs_from_file(self, lazy=False):
         '''
            Specification consists of resource which is file pointer. This function loads those files in memeory
+
+           :param lazy: defer parsing the launch file until launch_args is accessed
+           :type lazy: bool
+
+           :raises: RappMalformedException: launch file is invalid (only if not lazy)
         '''
         self.data = load_rapp_specs_from_file(self)
+        if not lazy:
+            self.data.load()
 
     def inherit(self, rapp):
         '''
@@ -102,9 +278,9 @@ class Rapp(object):
           :param rapp: rapp to inherit
           :type rapp: rocon_app_utilities.Rapp
         '''
-        INHERITABLE_ATTRIBUTES = ['display', 'description', 'icon', 'public_interface', 'public_parameters', 'parent_name']
-
         # Once it inherits, it removes parent_specification field. If it is inherits from another child, it obtains parent_specification anyway
+        self.yaml_data = dict(self.yaml_data)  # detach it from the raw data modified below
+        self.raw_data = dict(self.raw_data)  # may be shared with views, e.g. the layers of resolved data
         del self.raw_data['parent_name']
 
         for attribute in INHERITABLE_ATTRIBUTES:
@@ -11,10 +11,19 @@ import sys
 import os
 import traceback
 import argparse
+import json
+import multiprocessing
 import rocon_console.console as console
 
+from . import profiling
 from .dependencies import DependencyChecker
-from .rapp_repositories import build_index, get_combined_index, get_index, get_index_dest_prefix_for_base_paths, is_index, load_uris, sanitize_uri, save_uris, uri2url
+from .index_delta import DELTA_EXTENSIONS, diff_archives
+from .index_shards import write_shards
+from .interface_index import CONNECTION_TYPES
+from .lint import lint_path
+from .rapp_repositories import build_index, get_combined_index, get_index, get_index_dest_prefix_for_base_paths, get_ros_package_paths, is_index, load_uris, sanitize_uri, save_uris, update_remote_index, uri2url
+from .snapshot import read_archive, write_snapshot
+from .tarball_resources import ARCHIVE_EXTENSIONS
 
 #################################################################################
 # Global variables
@@ -53,7 +62,7 @@ def _rapp_cmd_list(argv):
         uri = sanitize_uri(parsed_args.uri)
         index = get_index(uri)
 
-    compatible_rapps, unused_incompatible_rapps, invalid_rapps = index.get_compatible_rapps(uri=parsed_args.compatibility, ancestor_share_check=False)
+    compatible_rapps, unused_incompatible_rapps, invalid_rapps = index.get_compatible_rapps(uri=parsed_args.compatibility, ancestor_share_check=False, lazy_specs=True)
 
     _print_banner("Available Rapp List")
     for n in compatible_rapps.values():
@@ -69,6 +78,52 @@ def _rapp_cmd_list(argv):
             print(console.green + k + console.white + ' : ' + console.red + str(v) + console.reset)
 
 
+def _rapp_cmd_find_interface(argv):
+    #  Parse command arguments
+    args = argv[2:]
+    parser = argparse.ArgumentParser(description='Displays the rapps with a public connection of the given name and/or message type')
+    parser.add_argument('-n', '--name', help='Connection name, e.g. /teleop/cmd_vel')
+    parser.add_argument('-t', '--type', help='Message type, e.g. geometry_msgs/Twist')
+    parser.add_argument('-c', '--connection', choices=CONNECTION_TYPES, help='Connection type (default: any)')
+    parser.add_argument('-u', '--uri', nargs='?', help='Optional narrow down list from specific Rapp repository')
+
+    parsed_args = parser.parse_args(args)
+    if parsed_args.name is None and parsed_args.type is None:
+        parser.error('a connection name or message type is required')
+
+    if not parsed_args.uri:
+        index = get_combined_index()
+    else:
+        uri = sanitize_uri(parsed_args.uri)
+        index = get_index(uri)
+
+    matches = index.find_interface(parsed_args.connection, parsed_args.name, parsed_args.type)
+    for resource_name in sorted(matches):
+        print(console.green + resource_name + console.reset)
+        for connection_type, name, msg_type in matches[resource_name]:
+            print(console.cyan + '  %-15s: ' % connection_type + console.yellow + '%s [%s]' % (name, msg_type) + console.reset)
+
+
+def _rapp_cmd_search(argv):
+    #  Parse command arguments
+    args = argv[2:]
+    parser = argparse.ArgumentParser(description='Displays the rapps whose display name, description, name or package match the given keywords')
+    parser.add_argument('keywords', type=str, nargs='+', help='Keywords, each matches whole words or their beginning, e.g. turtle tele')
+    parser.add_argument('-l', '--limit', type=int, help='Maximum number of rapps to display')
+    parser.add_argument('-u', '--uri', nargs='?', help='Optional narrow down list from specific Rapp repository')
+
+    parsed_args = parser.parse_args(args)
+
+    if not parsed_args.uri:
+        index = get_combined_index()
+    else:
+        uri = sanitize_uri(parsed_args.uri)
+        index = get_index(uri)
+
+    for resource_name, score in index.search(' '.join(parsed_args.keywords), parsed_args.limit):
+        print(console.green + resource_name + console.cyan + ' [%.1f]' % score + console.reset)
+
+
 def _rapp_cmd_raw_info(argv):
     #  Parse command arguments
     args = argv[2:]
@@ -104,6 +159,10 @@ def _rapp_cmd_info(argv):
         print(console.green + resource_name + console.reset)
         if rapp.ancestor_name is not None:
             print(console.cyan + "  ancestor          : " + console.yellow + rapp.ancestor_name + console.reset)
+        sources = index.get_rapp_sources(resource_name)
+        print(console.cyan + "  source            : " + console.yellow + str(sources[0]) + console.reset)
+        if sources[1:]:
+            print(console.cyan + "  shadows           : " + console.yellow + ', '.join(str(s) for s in sources[1:]) + console.reset)
         #for k, v in rapp.raw_data.items():
         #    print(console.cyan + '  %s : ' % str(k) + console.yellow + '%s' % str(v) + console.reset)
         # instead, pretty printing the dictionary (could be smarter about this).
@@ -128,18 +187,93 @@ def _rapp_cmd_depends_on(argv):
     pass
 
 
-#def _rapp_cmd_profile(argv):
-#    indexer = RappIndexer()
-#    pass
+def _rapp_cmd_profile(argv):
+    #  Parse command arguments
+    args = argv[2:]
+    parser = argparse.ArgumentParser(description='Profile indexing of a Rapp tree')
+    parser.add_argument('packages_path', type=str, nargs='?', help='Path to a Rapp tree (default: ROS_PACKAGE_PATH)')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Number of runs per measurement')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of processes parsing rapp files')
+    parser.add_argument('-s', '--synthetic', type=int, metavar='N', help='Profile a generated index of N in-memory rapps instead')
+    parser.add_argument('-d', '--depth', type=int, default=4, help='Chain depth of the generated rapps')
+    parser.add_argument('-c', '--compatibility', default='rocon:/kobuki', help='Rocon URI queried on the generated rapps')
+    parser.add_argument('-m', '--memory', action='store_true', help='Report the memory held per generated rapp (default: 10000 rapps)')
+    parser.add_argument('-y', '--yaml', action='store_true', help='Compare loading the yaml files of the rapps with and without the yaml cache')
+
+    parsed_args = parser.parse_args(args)
+
+    if parsed_args.memory:
+        num_rapps = parsed_args.synthetic or 10000
+        _print_banner("Memory Profile")
+        _print_profile([('rapps', num_rapps)] + [(k, '%d bytes' % v) for k, v in profiling.profile_memory(num_rapps)], [])
+        return
+
+    if parsed_args.synthetic:
+        index = profiling.synthetic_index(parsed_args.synthetic, parsed_args.depth)
+        results = profiling.profile_resolution(index) + profiling.profile_compatibility(index, parsed_args.compatibility)
+        _print_banner("Resolution Profile")
+        _print_profile([('rapps', len(index.raw_data)), ('chain depth', max(2, parsed_args.depth)), ('compatibility', parsed_args.compatibility)], results)
+        return
+
+    base_paths = [os.path.abspath(parsed_args.packages_path)] if parsed_args.packages_path else get_ros_package_paths()
+
+    cold, index = profiling.timeit(lambda: build_index(base_paths, use_cache=False, workers=parsed_args.jobs), parsed_args.repeat)
+    build_index(base_paths)  # make sure the parse cache is populated
+    warm, unused_index = profiling.timeit(lambda: build_index(base_paths, workers=parsed_args.jobs), parsed_args.repeat)
+
+    index._resolve_all()  # chain errors are only found when the rapps are resolved
+
+    _print_banner("Index Profile")
+    _print_profile([('base paths', ':'.join(base_paths)),
+                    ('rapps', len(index.raw_data)),
+                    ('invalid rapps', len(index.invalid_data)),
+                    ('jobs', parsed_args.jobs)],
+                   [('cold index', cold), ('warm index', warm)] + (profiling.profile_yaml(index, parsed_args.repeat) if parsed_args.yaml else []))
+
+
+def _rapp_cmd_lint(argv):
+    #  Parse command arguments
+    args = argv[2:]
+    parser = argparse.ArgumentParser(description='Validate every rapp of a Rapp tree and report all problems as json')
+    parser.add_argument('packages_path', type=str, help='Path to a Rapp tree')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), help='Number of processes checking rapp files (default: number of cpus)')
+    parser.add_argument('-o', '--outfile', help='Write the report to this file instead of stdout')
+
+    parsed_args = parser.parse_args(args)
+    report = lint_path(os.path.abspath(parsed_args.packages_path), parsed_args.jobs)
+    if parsed_args.outfile:
+        with open(parsed_args.outfile, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        for resource_name, rapp in sorted(report['rapps'].items()):
+            for problem in rapp['problems']:
+                print(console.red + resource_name + console.reset + ' [' + problem['check'] + '] ' + problem['message'])
+        _print_profile([(k, report['summary'][k]) for k in ['rapps', 'invalid', 'problems']], [('lint', report['timings']['total'])])
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    if report['summary']['invalid']:
+        sys.exit(1)
+
+
+def _print_profile(info, timings):
+    for k, v in info:
+        print(console.cyan + "  %-26s: " % k + console.yellow + str(v) + console.reset)
+    for k, v in timings:
+        print(console.cyan + "  %-26s: " % k + console.yellow + "%.4f sec" % v + console.reset)
 
 
 def _rapp_cmd_compat(argv):
     #  Parse command arguments
     args = argv[2:]
     parser = argparse.ArgumentParser(description='Displays list of compatible rapps')
-    parser.add_argument('compatibility', type=str, help='Rocon URI')
+    parser.add_argument('compatibility', type=str, nargs='?', help='Rocon URI')
+    parser.add_argument('--uris-file', type=str, help='File with one Rocon URI per line, e.g. one per robot of a fleet')
 
     parsed_args = parser.parse_args(args)
+    if parsed_args.uris_file:
+        _rapp_cmd_compat_matrix(_read_uris_file(parsed_args.uris_file))
+        return
+    if not parsed_args.compatibility:
+        parser.error('either a Rocon URI or --uris-file is required')
     compatibility = parsed_args.compatibility
 
     index = get_combined_index()
@@ -160,6 +294,37 @@ def _rapp_cmd_compat(argv):
         print(console.cyan + '  ' + k + ' : ' + console.yellow + str(v) + console.reset)
 
 
+def _read_uris_file(filename):
+    '''
+      Reads one rocon uri per line, skipping blank lines and '#' comments.
+    '''
+    uris = []
+    with open(filename, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and line not in uris:
+                uris.append(line)
+    return uris
+
+
+def _rapp_cmd_compat_matrix(uris):
+    index = get_combined_index()
+    matrix = index.get_compatible_rapps_for_uris(uris)
+
+    _print_banner("Compatibility Matrix")
+    invalid_rapps = {}
+    for uri in uris:
+        compatible_rapps, unused_incompatible_rapps, invalid = matrix[uri]
+        invalid_rapps.update(invalid)
+        print(console.green + uri + console.reset)
+        for resource_name in sorted(compatible_rapps):
+            print(console.cyan + '  ' + resource_name + console.reset)
+
+    _print_banner("Invalid Rapp List")
+    for k, v in invalid_rapps.items():
+        print(console.cyan + '  ' + k + ' : ' + console.yellow + str(v) + console.reset)
+
+
 def _rapp_cmd_install(argv):
     #  Parse command arguments
     args = argv[2:]
@@ -199,22 +364,58 @@ def _rapp_cmd_index(argv):
     #  Parse command arguments
     args = argv[2:]
     parser = argparse.ArgumentParser(description='Generate an index for a Rapp tree')
-    parser.add_argument('packages_path', type=str, help='Path to a Rapp tree')
+    parser.add_argument('packages_path', type=str, nargs='?', help='Path to a Rapp tree')
     parser.add_argument('-o', '--outfile', help='Output file name')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of processes parsing rapp files')
+    parser.add_argument('-c', '--codec', default='gz', choices=list(ARCHIVE_EXTENSIONS.keys()), help='Compression of the index archive')
+    parser.add_argument('--diff', nargs=2, metavar=('OLD', 'NEW'), help='Generate the delta between two index archives instead')
+    parser.add_argument('--shards', action='store_true', help='Write a manifest and one index archive per package instead of a single archive')
 
     parsed_args = parser.parse_args(args)
     packages_path = parsed_args.packages_path
     outfile_name = parsed_args.outfile
 
-    index_path(packages_path, outfile_name)
-
-
-def index_path(packages_path, outfile_name):
-    index = build_index([packages_path])
+    if parsed_args.diff:
+        old_filename, new_filename = parsed_args.diff
+        manifest = diff_index_archives(old_filename, new_filename, outfile_name, parsed_args.codec)
+        for kind in ['rapps', 'resources']:
+            for change in ['added', 'changed', 'removed']:
+                for name in manifest[kind][change]:
+                    print('%s %s %s' % (change, kind[:-1], name))
+        return
+    if not packages_path:
+        parser.error('a path to a Rapp tree or --diff is required')
+    index_path(packages_path, outfile_name, parsed_args.jobs, parsed_args.codec, parsed_args.shards)
+
+
+def index_path(packages_path, outfile_name, jobs=1, codec='gz', shards=False):
+    index = build_index([packages_path], workers=jobs)
     base_path = os.path.dirname(packages_path)
     filename_prefix = outfile_name if outfile_name else os.path.basename(packages_path)
     dest_prefix = os.path.join(base_path, filename_prefix)
-    index.write_tarball(dest_prefix)
+    if shards:
+        write_shards(index, dest_prefix, codec)
+    else:
+        index.write_tarball(dest_prefix, codec)
+
+
+def diff_index_archives(old_filename, new_filename, outfile_name=None, codec='gz'):
+    '''
+      Writes the delta between two index archives, by default next to the new one.
+
+      :returns: the manifest of the delta
+      :rtype: dict
+    '''
+    if outfile_name:
+        delta_filename = outfile_name
+    else:
+        delta_prefix = new_filename
+        for extension in ARCHIVE_EXTENSIONS.values():
+            if new_filename.endswith(extension):
+                delta_prefix = new_filename[:-len(extension)]
+                break
+        delta_filename = delta_prefix + DELTA_EXTENSIONS[codec]
+    return diff_archives(old_filename, new_filename, delta_filename, codec)
 
 
 def _rapp_cmd_add_repository(argv):
@@ -279,13 +480,17 @@ def _rapp_cmd_update_repository_indices(argv):
 def update_indices():
     uris = load_uris()
     for uri in uris:
-        # existing indices must not be updated
         if is_index(uri):
+            # local index archives must not be updated, local copies of remote ones are
+            if not os.path.isabs(uri):
+                update_remote_index(uri)
             continue
         url = uri2url(uri)
         index = build_index(url)
         dest_prefix = get_index_dest_prefix_for_base_paths(url)
-        index.write_tarball(dest_prefix)
+        filename = index.write_tarball(dest_prefix)
+        unused_data, archive = read_archive(filename)
+        write_snapshot(index, '%s.index.snapshot' % dest_prefix, archive)
 
 
 def _fullusage():
@@ -295,13 +500,17 @@ Commands:
 \trocon_app list\t\tdisplay a list of cached rapps
 \trocon_app info\t\tdisplay rapp information
 \trocon_app rawinfo\tdisplay rapp raw information
-\trocon_app compat\tdisplay a list of rapps that are compatible with the given rocon uri
+\trocon_app search\tdisplay the rapps matching the given keywords, best first
+\trocon_app find-interface\tdisplay the rapps with a public connection of the given name or message type
+\trocon_app compat\tdisplay a list of rapps that are compatible with the given rocon uri (or each uri of --uris-file)
 \trocon_app install\tinstall a list of rapps
 \trocon_app add-repo\tadd a rapp repository
 \trocon_app remove-repo\tremove a rapp repository
 \trocon_app list-repos\tlist the rapp repositories
 \trocon_app update\tupdate the indices for the rapp repositories
-\trocon_app index\t\tgenerate an index file of a Rapp tree
+\trocon_app index\t\tgenerate an index file of a Rapp tree (or the delta between two with --diff)
+\trocon_app profile\tmeasure the indexing time of a Rapp tree
+\trocon_app lint\t\tvalidate every rapp of a Rapp tree and report all problems as json
 \trocon_app help\t\tUsage
 
 Type rocon_app <command> -h for more detailed usage, e.g. 'rocon_app info -h'
@@ -312,7 +521,6 @@ Type rocon_app <command> -h for more detailed usage, e.g. 'rocon_app info -h'
 # Future TODO
 #\trocon_app depends\tdisplay a rapp dependency list
 #\trocon_app depends-on\tdisplay a list of rapps that depend on the given rapp
-#\trocon_app profile\tupdate cache
 
 
 #################################################################################
@@ -339,6 +547,12 @@ def main():
             _rapp_cmd_depends_on(argv)
         elif command == 'profile':
             _rapp_cmd_profile(argv)
+        elif command == 'lint':
+            _rapp_cmd_lint(argv)
+        elif command == 'search':
+            _rapp_cmd_search(argv)
+        elif command == 'find-interface':
+            _rapp_cmd_find_interface(argv)
         elif command == 'compat':
             _rapp_cmd_compat(argv)
         elif command == 'install':
@@ -5,15 +5,20 @@
 #
 #################################################################################
 from .exceptions import InvalidRappException, RappResourceNotExistException, RappMalformedException, XmlParseException
-import copy
 import os
-import yaml
 import rospkg
-from xml.dom.minidom import parse
-from xml.dom import Node as DomNode
+from xml.parsers import expat
 import rocon_python_utils
 from rocon_console import console
 
+from . import resource_cache, tarball_resources
+from .interface_index import compile_public_interface
+from .yaml_cache import load_yaml
+
+RAPP_ATTRIBUTES = ['display', 'description', 'icon', 'public_interface', 'public_parameters', 'compatibility', 'launch', 'parent_name', 'pairing_clients', 'required_capabilities']
+
+_launch_args_cache = {}  # launch file : (signature, standard args)
+
 def load_rapp_yaml_from_file(filename):
     '''
       Load rapp specs yaml from the given file
@@ -26,30 +31,69 @@ def load_rapp_yaml_from_file(filename):
 
       :raises: InvalidRappException: Rapp includes invalid filed
     '''
-    RAPP_ATTRIBUTES = ['display', 'description', 'icon', 'public_interface', 'public_parameters', 'compatibility', 'launch', 'parent_name', 'pairing_clients', 'required_capabilities']
     base_path = os.path.dirname(filename)
 
-    with open(filename, 'r') as f:
-        yaml_data = yaml.load(f.read())
-        app_data = copy.deepcopy(yaml_data)
-
-        for d in app_data:
-            if d not in RAPP_ATTRIBUTES:
-                raise InvalidRappException('Invalid Field : [' + str(d) + '] Valid Fields : [' + str(RAPP_ATTRIBUTES) + ']')
-
-        if 'launch' in app_data:
-            app_data['launch'] = _find_resource(base_path, app_data['launch'])
-            yaml_data['launch'] = app_data['launch']
-        if 'public_interface' in app_data:
-            yaml_data['public_interface'], app_data['public_interface']  = _load_public_interface(base_path, app_data['public_interface'])
-        if 'public_parameters' in app_data:
-            yaml_data['public_parameters'], app_data['public_parameters']  = _load_public_parameters(base_path, app_data['public_parameters'])
-        if 'icon' in app_data:
-            app_data['icon'] = _find_resource(base_path, app_data['icon'])
-            yaml_data['icon'] = app_data['icon']
+    document = load_yaml(filename) or {}
+    if not isinstance(document, dict):
+        raise InvalidRappException('Invalid rapp file : expected a mapping of fields, got [' + str(document) + ']')
+    yaml_data = dict(document)
+    app_data = dict(yaml_data)  # nested values are read-only, only the top level is modified below
+
+    for d in app_data:
+        if d not in RAPP_ATTRIBUTES:
+            raise InvalidRappException('Invalid Field : [' + str(d) + '] Valid Fields : [' + str(RAPP_ATTRIBUTES) + ']')
+
+    if 'launch' in app_data:
+        app_data['launch'] = _find_resource(base_path, app_data['launch'])
+        yaml_data['launch'] = app_data['launch']
+    if 'public_interface' in app_data:
+        yaml_data['public_interface'], app_data['public_interface']  = _load_public_interface(base_path, app_data['public_interface'])
+    if 'public_parameters' in app_data:
+        yaml_data['public_parameters'], app_data['public_parameters']  = _load_public_parameters(base_path, app_data['public_parameters'])
+    if 'icon' in app_data:
+        app_data['icon'] = _find_resource(base_path, app_data['icon'])
+        yaml_data['icon'] = app_data['icon']
     return yaml_data, app_data
 
 
+class RappSpecData(dict):
+    '''
+      Rapp specification data whose expensive fields are only loaded when they are accessed for the first
+      time and kept afterwards. Loading errors (e.g. RappMalformedException for an invalid launch file) are
+      raised on that access.
+    '''
+    LAZY_FIELDS = {'launch_args': 'launch', 'public_interface_table': 'public_interface'}  # field : field it is loaded from
+
+    def __missing__(self, key):
+        if key == 'launch_args':
+            value = get_launch_args(self['launch'])
+        elif key == 'public_interface_table':
+            value = compile_public_interface(self['public_interface'])
+            deprecated = [c.name for c in value if c.msg_type is None]
+            if deprecated:
+                console.logwarn('Rapp Indexer : [%s] public interface has deprecated format. Please update %s includes name and type' % (self.get('name'), deprecated))
+        else:
+            raise KeyError(key)
+        self[key] = value
+        return value
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or (key in self.LAZY_FIELDS and dict.__contains__(self, self.LAZY_FIELDS[key]))
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def load(self):
+        '''
+          Loads all lazy fields.
+
+          :raises: RappMalformedException: launch file is invalid
+        '''
+        for key in self.LAZY_FIELDS:
+            if key in self:
+                self[key]
+
+
 def load_rapp_specs_from_file(specification):
     '''
       Specification consists of resource which is file pointer. This function loads those files in memeory
@@ -57,20 +101,18 @@ def load_rapp_specs_from_file(specification):
       :param specification: Rapp Specification
       :type Specification: rocon_app_utilities.Rapp
 
-      :returns Fully loaded rapp data dictionary
-      :rtype: dict
+      :returns Fully loaded rapp data dictionary. launch_args is parsed from the launch file on first access
+      :rtype: RappSpecData
     '''
-    base_path = os.path.dirname(specification.filename)
     rapp_data = specification.raw_data
 
-    data = {}
+    data = RappSpecData()
     data['name'] = specification.resource_name
     data['ancestor_name'] = specification.ancestor_name
     data['display_name']      = rapp_data.get('display', data['name'])
     data['description']       = rapp_data.get('description', '')
     data['compatibility']     = rapp_data['compatibility']
     data['launch']            = rapp_data['launch']
-    data['launch_args']       = _get_standard_args(data['launch'])
     data['public_interface']  = rapp_data.get('public_interface', _default_public_interface())
     data['public_parameters'] = rapp_data.get('public_parameters', {})
     data['icon']              = rapp_data.get('icon', None)
@@ -98,14 +140,18 @@ def _find_resource(base_path, resource):
       :raises: :exc:`.exceptions.RappResourceNotExistException` if the resource is not found
     '''
     path = os.path.join(base_path, resource)
-    if os.path.exists(path):
+    if resource_cache.exists(path):
         return os.path.normpath(path)
-    else:
+    # crawling the package path only tells which message to raise, so it is done once per resource
+    reason = resource_cache.lookup_missing_resource(resource)
+    if reason is None:
         try:
             found = rocon_python_utils.ros.find_resource_from_string(resource)
+            reason = "invalid rapp - %s is 'tuple based rapp resource'. It is deprecated attribute. Please fix it as relative path to .rapp file" % (resource)
         except rospkg.ResourceNotFound:
-            raise RappResourceNotExistException("invalid rapp - %s does not exist" % (resource))
-        raise RappResourceNotExistException("invalid rapp - %s is 'tuple based rapp resource'. It is deprecated attribute. Please fix it as relative path to .rapp file" % (resource))
+            reason = "invalid rapp - %s does not exist" % (resource)
+        resource_cache.store_missing_resource(resource, reason)
+    raise RappResourceNotExistException(reason)
 
 
 def _default_public_interface():
@@ -142,22 +188,21 @@ def _load_public_interface(base_path, public_interface_resource):
         return None, d
 
     public_interface_file_path = _find_resource(base_path, public_interface_resource)
-    with open(public_interface_file_path, 'r') as f:
-        y = yaml.load(f.read())
-        y = y or {}
-        try:
-            for k in keys:
-                raw_data = y.get(k, [])
-
-                new_data = []
-                for r in raw_data:
-                    #if r[0] == '/':  # originally removed these, but we really do need to reference such sometimes
-                    #    r = r[1:len(r)]
-                    new_data.append(r)
-                d[k] = new_data
-
-        except KeyError:
-            raise RappMalformedException("Invalid interface, missing keys")
+    y = load_yaml(public_interface_file_path)
+    y = y or {}
+    try:
+        for k in keys:
+            raw_data = y.get(k, [])
+
+            new_data = []
+            for r in raw_data:
+                #if r[0] == '/':  # originally removed these, but we really do need to reference such sometimes
+                #    r = r[1:len(r)]
+                new_data.append(r)
+            d[k] = new_data
+
+    except KeyError:
+        raise RappMalformedException("Invalid interface, missing keys")
     return public_interface_file_path, d
 
 
@@ -177,13 +222,59 @@ def _load_public_parameters(base_path, public_parameters_resource):
         return None, {}
 
     public_parameters_file_path = _find_resource(base_path, public_parameters_resource)
-    with open(public_parameters_file_path, 'r') as f:
-        y = yaml.load(f.read())
-        y = y or {}
-        
+    y = load_yaml(public_parameters_file_path)
+    y = y or {}
+
     return public_parameters_file_path, y
 
 
+def launch_file_signature(roslaunch_file):
+    '''
+      :returns: (mtime, size) of the launch file, see tarball_resources.signature. None if it does not exist
+      :rtype: tuple
+    '''
+    return tarball_resources.signature(roslaunch_file)
+
+
+def get_launch_args(roslaunch_file):
+    '''
+      Memoised _get_standard_args. The standard args of a launch file are parsed again once its signature,
+      i.e. its mtime and size, changes.
+
+      :param roslaunch_file: rapp launch file
+      :type roslaunch_file: str
+
+      :returns: list of top-level arguments that match standard arguments
+      :rtype: [str]
+
+      :raises RappMalformedException: if launch file format is invalid
+    '''
+    signature = launch_file_signature(roslaunch_file)
+    cached = _launch_args_cache.get(roslaunch_file)
+    if cached is not None and signature is not None and cached[0] == signature:
+        return list(cached[1])
+    args = _get_standard_args(roslaunch_file)
+    if signature is not None:
+        _launch_args_cache[roslaunch_file] = (signature, tuple(args))
+    return args
+
+
+def get_cached_launch_args(roslaunch_file):
+    '''
+      :returns: (signature, standard args) memoised by get_launch_args or None
+      :rtype: (tuple, (str))
+    '''
+    return _launch_args_cache.get(roslaunch_file)
+
+
+def seed_launch_args(roslaunch_file, signature, args):
+    '''
+      Memoises the standard args of a launch file parsed earlier, e.g. restored from an index snapshot.
+      They are only used as long as the launch file still has the given signature.
+    '''
+    _launch_args_cache[roslaunch_file] = (signature, tuple(args))
+
+
 def _get_standard_args(roslaunch_file):
     '''
       Given the Rapp launch file, this function parses the top-level args
@@ -212,33 +303,66 @@ def _get_standard_args(roslaunch_file):
 
 def _get_available_args(filename):
     '''
-      Load XML from file to extract top-level args and returns available_args
+      Extracts the names of the top-level args of a launch file. The file is parsed as a stream, without
+      building a document, and elements below the top level are skipped. Parsing stops at the end of the
+      root <launch> tag.
 
       :param filename: rapp launch file we are parsing for arguements
       :type filename: str
 
-      :returns: list of available args 
+      :returns: list of available args
       :rtype: [str]
-    '''
-    xml = _parse_launch(filename)
-    available_args = [node.attributes['name'].value.strip() for node in xml.childNodes if node.nodeType == DomNode.ELEMENT_NODE and node.tagName == 'arg']
-    return available_args 
-
-def _parse_launch(filename):
-    '''
-      Parse launch from file
-
-      :param filename: rapp launch file we are parsing for arguements
-      :type filename: str
-      :returns: launch XML
-      :ortype: XML
 
       :raises XmlParseException: if xml is invalid format
     '''
+    handler = _TopLevelArgsHandler()
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = handler.start_element
+    parser.EndElementHandler = handler.end_element
     try:
-        root = parse(filename).getElementsByTagName('launch')
+        resources = tarball_resources.find(filename)
+        if resources is not None:
+            parser.Parse(resources.read(filename), True)
+        else:
+            with open(filename, 'rb') as f:
+                parser.ParseFile(f)
+    except _RootClosed:
+        pass
+    except XmlParseException:
+        raise
     except Exception as e:
-        raise XmlParseException('Invalid roslaunch XML syntax: %s'%e)
-    if len(root) != 1:
+        raise XmlParseException('Invalid roslaunch XML syntax: %s' % e)
+    if not handler.closed:
         raise XmlParseException('Invalid roslaunch XML syntax: no root <launch> tag')
-    return root[0]
+    return handler.args
+
+
+class _RootClosed(Exception):
+    pass
+
+
+class _TopLevelArgsHandler(object):
+    '''
+      Collects the names of the <arg> children of the root <launch> tag from expat events.
+    '''
+    __slots__ = ['args', 'depth', 'closed']
+
+    def __init__(self):
+        self.args = []
+        self.depth = 0
+        self.closed = False
+
+    def start_element(self, name, attributes):
+        if name == 'launch' and self.depth > 0 or name != 'launch' and self.depth == 0:
+            raise XmlParseException('Invalid roslaunch XML syntax: no root <launch> tag')
+        if self.depth == 1 and name == 'arg':
+            if 'name' not in attributes:
+                raise XmlParseException('Invalid roslaunch XML syntax: top-level <arg> without a name')
+            self.args.append(attributes['name'].strip())
+        self.depth += 1
+
+    def end_element(self, name):
+        self.depth -= 1
+        if self.depth == 0:
+            self.closed = True
+            raise _RootClosed()
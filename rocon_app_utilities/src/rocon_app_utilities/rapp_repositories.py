@@ -15,8 +15,15 @@ from rosdistro.loader import load_url
 import rospkg
 import rospkg.environment
 import sys
+import tarfile
+import tempfile
 
+from . import tarball_resources
+from .exceptions import InvalidDeltaException, InvalidSnapshotException
+from .index_delta import apply_delta, delta_url_for_index, read_delta
+from .index_shards import SHARDS_MANIFEST_EXTENSION, is_sharded_index, load_sharded_index, update_shards
 from .indexer import RappIndexer, read_tarball
+from .snapshot import RappSnapshot, read_archive, write_snapshot
 
 _rapp_repositories_list_file = os.path.join(rospkg.get_ros_home(), 'rocon', 'rapp', 'rapp.list')
 
@@ -100,18 +107,18 @@ def uri2url(uri):
 
 def is_index(url_or_uri):
     '''
-      Check if the URI or URL points to an index archive.
+      Check if the URI or URL points to an index archive or to the manifest of a sharded index.
 
       :param url_or_uri: the URI or URL
       :type url_or_uri: str
 
-      :returns: true, if URI or URL ends with '.index.tar.gz'
+      :returns: true, if URI or URL ends with '.index.tar.gz', '.index.tar.xz', '.index.tar' or '.index.yaml'
       :rtype: bool
     '''
-    return url_or_uri.endswith('.index.tar.gz')
+    return is_sharded_index(url_or_uri) or any(url_or_uri.endswith(extension) for extension in tarball_resources.ARCHIVE_EXTENSIONS.values())
 
 
-def build_index(base_paths, package_whitelist=None, package_blacklist=[]):
+def build_index(base_paths, package_whitelist=None, package_blacklist=[], use_cache=True, workers=1):
     '''
       Builds the index of rapps found under a list of base paths.
 
@@ -121,6 +128,10 @@ def build_index(base_paths, package_whitelist=None, package_blacklist=[]):
       :type package_whitelist: [str]
       :param package_blacklist: list of blacklisted package
       :type package_blacklist: [str]
+      :param use_cache: reuse unchanged rapps from the parse cache
+      :type use_cache: bool
+      :param workers: number of processes parsing rapp files
+      :type workers: int
 
       :returns: the index
       :rtype: rocon_app_utilities.RappIndexer
@@ -129,7 +140,7 @@ def build_index(base_paths, package_whitelist=None, package_blacklist=[]):
     assert isinstance(base_paths, list)
     combined_index = RappIndexer(raw_data={})
     for base_path in reversed(base_paths):
-        index = RappIndexer(packages_path=base_path, package_whitelist=package_whitelist, package_blacklist=package_blacklist)
+        index = RappIndexer(packages_path=base_path, package_whitelist=package_whitelist, package_blacklist=package_blacklist, source=base_path, use_cache=use_cache, workers=workers)
         combined_index.merge(index)
     combined_index.source = ':'.join(base_paths)
     return combined_index
@@ -150,10 +161,10 @@ def get_index_dest_prefix_for_base_paths(base_paths):
     return os.path.join(base_path, filename_prefix)
 
 
-def get_index(uri, package_whitelist=None, package_blacklist=[]):
+def get_index(uri, package_whitelist=None, package_blacklist=[], live=False):
     '''
       Gets the index of the rapp repository identified by the URI.
-      If the URI is a local folder it checks for the existance of a cached archive first.
+      If the URI is a local folder or a remote index archive it checks for the existance of a cached archive first.
 
       :param uri: the URI
       :type uri: str
@@ -161,17 +172,36 @@ def get_index(uri, package_whitelist=None, package_blacklist=[]):
       :type package_whitelist: [str]
       :param package_blacklist: list of blacklisted package
       :type package_blacklist: [str]
+      :param live: index local folders from their files (using the parse cache) instead of their cached archive,
+                   e.g. to follow changes of the files (see index_watcher)
+      :type live: bool
 
       :returns: the index
       :rtype: rocon_app_utilities.RappIndexer
     '''
     logger.debug('get_index(%s)' % uri)
+    if is_sharded_index(uri):
+        # only the shards of the selected packages are loaded
+        if not os.path.isabs(uri) and os.path.isfile(get_cached_index_path(uri)):
+            return load_index('file://%s' % get_cached_index_path(uri), package_whitelist=package_whitelist, package_blacklist=package_blacklist)
+        return load_index(uri2url(uri), package_whitelist=package_whitelist, package_blacklist=package_blacklist)
     if is_index(uri):
+        if os.path.isabs(uri) and os.path.isfile(uri):
+            snapshot_path = '%s.index.snapshot' % get_index_dest_prefix_for_base_paths([uri])
+            return load_index_snapshot(uri, snapshot_path, package_whitelist=package_whitelist, package_blacklist=package_blacklist)
+        cached_path = get_cached_index_path(uri)
+        if os.path.isfile(cached_path):
+            # mirrored by update_remote_index
+            snapshot_path = '%s.index.snapshot' % get_index_dest_prefix_for_base_paths([uri])
+            return load_index_snapshot(cached_path, snapshot_path, package_whitelist=package_whitelist, package_blacklist=package_blacklist)
         url = uri2url(uri)
         return load_index(url, package_whitelist=package_whitelist, package_blacklist=package_blacklist)
     url = uri2url(uri)
-    index_path = has_index(url)
+    index_path = has_index(url) if not live else None
     if index_path:
+        if is_index(index_path) and not is_sharded_index(index_path):
+            snapshot_path = '%s.index.snapshot' % get_index_dest_prefix_for_base_paths(url)
+            return load_index_snapshot(index_path, snapshot_path, package_whitelist=package_whitelist, package_blacklist=package_blacklist)
         index_url = 'file://%s' % index_path
         return load_index(index_url, package_whitelist=package_whitelist, package_blacklist=package_blacklist)
     return build_index(url, package_whitelist=package_whitelist, package_blacklist=package_blacklist)
@@ -188,11 +218,12 @@ def has_index(base_paths):
       :rtype: str
     '''
     dest_prefix = get_index_dest_prefix_for_base_paths(base_paths)
-    path = '%s.index.tar.gz' % dest_prefix
-    if os.path.exists(path):
-        logger.debug('has_index(%s) %s' % (base_paths, path))
-        return path
-    path = '%s.index.yaml' % dest_prefix
+    for extension in tarball_resources.ARCHIVE_EXTENSIONS.values():
+        path = dest_prefix + extension
+        if os.path.exists(path):
+            logger.debug('has_index(%s) %s' % (base_paths, path))
+            return path
+    path = dest_prefix + SHARDS_MANIFEST_EXTENSION
     if os.path.exists(path):
         logger.debug('has_index(%s) %s' % (base_paths, path))
         return path
@@ -200,7 +231,7 @@ def has_index(base_paths):
     return None
 
 
-def get_combined_index(package_whitelist=None, package_blacklist=[]):
+def get_combined_index(package_whitelist=None, package_blacklist=[], live=False):
     '''
       Gets the combined index of the all registered rapp repositories.
 
@@ -208,6 +239,8 @@ def get_combined_index(package_whitelist=None, package_blacklist=[]):
       :type package_whitelist: [str]
       :param package_blacklist: list of blacklisted package
       :type package_blacklist: [str]
+      :param live: index local folders from their files, see get_index
+      :type live: bool
 
       :returns: the index
       :rtype: rocon_app_utilities.RappIndexer
@@ -216,14 +249,30 @@ def get_combined_index(package_whitelist=None, package_blacklist=[]):
     combined_index = RappIndexer(raw_data={})
     uris = load_uris()
     for uri in reversed(uris):
-        index = get_index(uri, package_whitelist=package_whitelist, package_blacklist=package_blacklist)
+        index = get_index(uri, package_whitelist=package_whitelist, package_blacklist=package_blacklist, live=live)
         combined_index.merge(index)
     return combined_index
 
 
+def get_local_base_paths():
+    '''
+      Gets the local folders of the registered rapp repositories.
+
+      :returns: the list of paths
+      :rtype: [str]
+    '''
+    base_paths = []
+    for uri in load_uris():
+        if not is_index(uri):
+            url = uri2url(uri)
+            if isinstance(url, list):
+                base_paths.extend(url)
+    return base_paths
+
+
 def load_index(index_url, package_whitelist=None, package_blacklist=[]):
     '''
-      Loads the index for a URL pointing to an index archive.
+      Loads the index for a URL pointing to an index archive or to the manifest of a sharded index.
 
       :param index_url: the URL
       :type index_url: str
@@ -236,9 +285,12 @@ def load_index(index_url, package_whitelist=None, package_blacklist=[]):
       :rtype: rocon_app_utilities.RappIndexer
     '''
     logger.debug('load_index(%s)' % index_url)
-    if not index_url.endswith('.index.tar.gz'):
-        raise NotImplementedError("The url of the index must end with '.index.tar.gz'")
-    logger.debug('load_index() load gzipped tar index')
+    if not is_index(index_url):
+        raise NotImplementedError("The url of the index must end with one of %s" % (list(tarball_resources.ARCHIVE_EXTENSIONS.values()) + [SHARDS_MANIFEST_EXTENSION]))
+    if is_sharded_index(index_url):
+        logger.debug('load_index() load sharded index')
+        return load_sharded_index(index_url, package_whitelist=package_whitelist, package_blacklist=package_blacklist)
+    logger.debug('load_index() load tar index')
     tar_gz_str = load_url(index_url, skip_decode=True)
     tar_gz_stream = StringIO(tar_gz_str)
     index = read_tarball(fileobj=tar_gz_stream, package_whitelist=package_whitelist, package_blacklist=package_blacklist)
@@ -246,6 +298,114 @@ def load_index(index_url, package_whitelist=None, package_blacklist=[]):
     return index
 
 
+def get_cached_index_path(index_url):
+    '''
+      Returns the path of the local copy of a remote index archive or sharded index manifest.
+
+      :param index_url: the URL of the index archive or manifest
+      :type index_url: str
+
+      :returns: the path, it has the extension of the URL
+      :rtype: str
+    '''
+    for extension in list(tarball_resources.ARCHIVE_EXTENSIONS.values()) + [SHARDS_MANIFEST_EXTENSION]:
+        if index_url.endswith(extension):
+            return get_index_dest_prefix_for_base_paths([index_url]) + extension
+    raise NotImplementedError("The url of the index must end with one of %s" % (list(tarball_resources.ARCHIVE_EXTENSIONS.values()) + [SHARDS_MANIFEST_EXTENSION]))
+
+
+def update_remote_index(index_url):
+    '''
+      Updates the local copy of a remote index archive. If a copy exists, only the delta published next to
+      the archive (see index_delta.delta_url_for_index) is downloaded and applied to it. The whole archive is
+      downloaded if there is no copy yet, no delta is published or it was taken from another version.
+      Of a sharded index, only the archives of the packages which changed are downloaded.
+
+      :param index_url: the URL of the index archive
+      :type index_url: str
+
+      :returns: the path of the local copy
+      :rtype: str
+    '''
+    cached_path = get_cached_index_path(index_url)
+    if is_sharded_index(index_url):
+        base_path = os.path.dirname(cached_path)
+        if not os.path.exists(base_path):
+            os.makedirs(base_path)
+        update_shards(index_url, cached_path)
+        return cached_path
+    codec = [c for c, extension in tarball_resources.ARCHIVE_EXTENSIONS.items() if cached_path.endswith(extension)][0]
+    if os.path.isfile(cached_path):
+        delta_url = delta_url_for_index(index_url)
+        try:
+            manifest, members = read_delta(fileobj=StringIO(load_url(delta_url, skip_decode=True)))
+            apply_delta(cached_path, manifest, members, codec=codec)
+            logger.debug("update_remote_index() applied '%s' to '%s'" % (delta_url, cached_path))
+            return cached_path
+        except (IOError, OSError, EOFError, tarfile.TarError, InvalidDeltaException) as e:
+            logger.debug("update_remote_index() cannot apply '%s' [%s]" % (delta_url, str(e)))
+
+    data = load_url(index_url, skip_decode=True)
+    base_path = os.path.dirname(cached_path)
+    if not os.path.exists(base_path):
+        os.makedirs(base_path)
+    fd, tmp_filename = tempfile.mkstemp(prefix='.rapp_index_', dir=base_path)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.rename(tmp_filename, cached_path)
+    logger.debug("update_remote_index() downloaded '%s' to '%s'" % (index_url, cached_path))
+    return cached_path
+
+
+def load_index_snapshot(index_path, snapshot_path, package_whitelist=None, package_blacklist=[]):
+    '''
+      Loads the index of a local index archive from its snapshot if the snapshot is fresh. Otherwise the
+      archive is loaded and a new snapshot of it is written.
+
+      :param index_path: path of the index archive
+      :type index_path: str
+      :param snapshot_path: path of its snapshot
+      :type snapshot_path: str
+      :param package_whitelist: list of target package list
+      :type package_whitelist: [str]
+      :param package_blacklist: list of blacklisted package
+      :type package_blacklist: [str]
+
+      :returns: the index
+      :rtype: rocon_app_utilities.RappIndexer
+    '''
+    index_url = 'file://%s' % index_path
+    try:
+        snapshot = RappSnapshot(snapshot_path)
+    except InvalidSnapshotException as e:
+        logger.debug('load_index_snapshot() %s' % str(e))
+        snapshot = None
+    if snapshot is not None and snapshot.is_fresh(index_path):
+        # the snapshot stays open for the rapps which are unpickled on demand
+        index = snapshot.load_index(package_whitelist, package_blacklist)
+        # files of the archive are read from it only when they are needed
+        for root in snapshot.resource_roots:
+            index.archives.append(tarball_resources.register(tarball_resources.TarballResources(root, archive=index_path)))
+        logger.debug("load_index_snapshot() loaded '%s'" % snapshot_path)
+        index.source = index_url
+        return index
+    if snapshot is not None:
+        snapshot.close()
+
+    if package_whitelist or package_blacklist:
+        # a snapshot always holds the complete archive
+        return load_index(index_url, package_whitelist=package_whitelist, package_blacklist=package_blacklist)
+    # the snapshot is signed with the very contents it is taken from, the archive may be replaced meanwhile
+    data, archive = read_archive(index_path)
+    index = read_tarball(fileobj=StringIO(data))
+    index.source = index_url
+    try:
+        write_snapshot(index, snapshot_path, archive)
+    except (IOError, OSError) as e:
+        logger.debug("load_index_snapshot() failed to write snapshot '%s' [%s]" % (snapshot_path, str(e)))
+    return index
+
+
 def _get_rapps_index_base_path():
     '''
       Gets the folder in which the registered rapp repositories URIs as well as the cached index archives are stored.
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+#################################################################################
+'''
+ Existence checks of rapp resources (.launch, .interface, .parameters, icons)
+ served from directory listings, so that indexing lists each rapp directory
+ once instead of stat'ing every resource, and a cache of the reasons why
+ resources could not be found.
+'''
+#################################################################################
+
+from __future__ import division, print_function
+import contextlib
+import os
+import threading
+
+from . import tarball_resources
+
+import logging
+import sys
+logger = logging.getLogger('resource_cache')
+logger.addHandler(logging.StreamHandler(sys.stderr))
+#logger.setLevel(logging.DEBUG)
+
+_listings = {}  # directory : frozenset of its entries, None if it can not be listed
+_scopes = 0  # number of active listing_cache() blocks, listings are only kept while there is one
+_missing_resources = {}  # (resource, ROS_PACKAGE_PATH) : reason why it does not exist
+_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def listing_cache():
+    '''
+      Keeps the directory listings read by exists() while the block runs, e.g. for one index build.
+      Files created or removed meanwhile may go unnoticed, so blocks should be short lived.
+      Blocks may be nested, the listings are dropped when the outermost one ends.
+    '''
+    global _scopes
+    with _lock:
+        _scopes += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _scopes -= 1
+            if _scopes == 0:
+                logger.debug('listing_cache() drop %d listings' % len(_listings))
+                _listings.clear()
+
+
+def exists(path):
+    '''
+      Checks whether a virtual or regular file exists like tarball_resources.exists. Inside a
+      listing_cache() block, a regular path is looked up in the listing of its directory.
+
+      :param path: virtual or regular path
+      :type path: str
+
+      :rtype: bool
+    '''
+    if not _scopes or tarball_resources.find(path) is not None:
+        return tarball_resources.exists(path)
+    directory, name = os.path.split(os.path.normpath(path))
+    if not name or name == os.pardir:
+        return os.path.exists(path)
+    entries = _listing(directory or os.curdir)
+    return entries is not None and name in entries
+
+
+def _listing(directory):
+    entries = _listings.get(directory, False)
+    if entries is False:
+        try:
+            entries = frozenset(os.listdir(directory))
+        except OSError:
+            entries = None
+        with _lock:
+            if _scopes:
+                _listings[directory] = entries
+    return entries
+
+
+def lookup_missing_resource(resource):
+    '''
+      :returns: the reason stored for a resource which could not be found, None if there is none
+      :rtype: str
+    '''
+    return _missing_resources.get((resource, os.environ.get('ROS_PACKAGE_PATH')))
+
+
+def store_missing_resource(resource, reason):
+    '''
+      Remembers why a resource could not be found, so that the package path is not crawled again to tell.
+      The reason is kept as long as ROS_PACKAGE_PATH does not change.
+
+      :param resource: the resource as referenced by the rapp
+      :type resource: str
+      :param reason: the error message
+      :type reason: str
+    '''
+    with _lock:
+        _missing_resources[(resource, os.environ.get('ROS_PACKAGE_PATH'))] = reason
+
+
+def clear_resource_cache():
+    with _lock:
+        _listings.clear()
+        _missing_resources.clear()
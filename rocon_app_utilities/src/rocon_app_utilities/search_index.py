@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+#################################################################################
+
+from __future__ import division, print_function
+import bisect
+import re
+
+#################################################################################
+# Search Index
+#################################################################################
+
+# Weight of a token by the field it is taken from, a rapp scores the highest weight among its fields
+SEARCH_FIELD_WEIGHTS = {'display': 4.0, 'name': 3.0, 'package': 2.0, 'description': 1.0}
+# Factor of the weight of a token which only starts with a query term
+PREFIX_MATCH_FACTOR = 0.5
+
+_token_pattern = re.compile(r'[^\W_]+', re.UNICODE)
+_unicode = type(u'')
+
+
+def tokenize(text):
+    '''
+      Splits a text into lower case words, e.g. 'rocon_apps/Moo Chirp' into ['rocon', 'apps', 'moo', 'chirp'].
+
+      :param text: the text, None for none
+      :type text: str
+
+      :rtype: [str]
+    '''
+    if not text:
+        return []
+    if not isinstance(text, (str, _unicode)):
+        text = str(text)
+    return _token_pattern.findall(text.lower())
+
+
+def searchable_fields(resource_name, raw_data):
+    '''
+      Returns the texts of a rapp which are searched.
+
+      :param resource_name: rapp name, '<package>/<name>'
+      :type resource_name: str
+      :param raw_data: its raw data, resolved to include the inherited display and description
+      :type raw_data: dict
+
+      :returns: text by field, see SEARCH_FIELD_WEIGHTS
+      :rtype: {str: str}
+    '''
+    package, unused_sep, name = resource_name.rpartition('/')
+    return {'display': raw_data.get('display'),
+            'description': raw_data.get('description'),
+            'name': name,
+            'package': package}
+
+
+class SearchIndex(object):
+    '''
+      Inverted index of the words of rapp display names, descriptions, names and packages. The words are
+      also kept sorted, so that the words starting with a query term are found by bisection. A query only
+      visits the postings of the matching words, regardless of the number of rapps.
+    '''
+
+    __slots__ = ['tokens', '_postings', '_words', '_words_dirty']
+
+    def __init__(self):
+        self.tokens = {}  # resource_name : {word: weight}
+        self._postings = {}  # word : {resource_name: weight}
+        self._words = []  # sorted words of the postings
+        self._words_dirty = False
+
+    def add(self, resource_name, fields):
+        '''
+          Adds a rapp.
+
+          :param resource_name: rapp name
+          :type resource_name: str
+          :param fields: its texts by field, see searchable_fields
+          :type fields: {str: str}
+        '''
+        self.remove(resource_name)
+        tokens = {}
+        for field, text in fields.items():
+            weight = SEARCH_FIELD_WEIGHTS.get(field, 1.0)
+            for word in tokenize(text):
+                if tokens.get(word, 0.0) < weight:
+                    tokens[word] = weight
+        self.tokens[resource_name] = tokens
+        for word, weight in tokens.items():
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = {}
+                self._words_dirty = True
+            postings[resource_name] = weight
+
+    def remove(self, resource_name):
+        for word in self.tokens.pop(resource_name, {}):
+            postings = self._postings.get(word)
+            if postings is not None:
+                postings.pop(resource_name, None)
+                if not postings:
+                    del self._postings[word]
+                    self._words_dirty = True
+
+    def query(self, text, limit=None):
+        '''
+          Finds the rapps matching every word of the text, exactly or by prefix.
+
+          :param text: the query, e.g. 'turtle teleop'
+          :type text: str
+          :param limit: maximum number of results, None for all
+          :type limit: int
+
+          :returns: names and scores of the matching rapps, best first
+          :rtype: [(str, float)]
+        '''
+        scores = None
+        for term in set(tokenize(text)):
+            term_scores = {}
+            for word in self._words_starting_with(term):
+                factor = 1.0 if word == term else PREFIX_MATCH_FACTOR
+                for resource_name, weight in self._postings[word].items():
+                    if term_scores.get(resource_name, 0.0) < weight * factor:
+                        term_scores[resource_name] = weight * factor
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = dict((name, score + term_scores[name]) for name, score in scores.items() if name in term_scores)
+            if not scores:
+                break
+        ranked = sorted((scores or {}).items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit is not None else ranked
+
+    def _words_starting_with(self, term):
+        if self._words_dirty:
+            self._words = sorted(self._postings)
+            self._words_dirty = False
+        words = []
+        i = bisect.bisect_left(self._words, term)
+        while i < len(self._words) and self._words[i].startswith(term):
+            words.append(self._words[i])
+            i += 1
+        return words
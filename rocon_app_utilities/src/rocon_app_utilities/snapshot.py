@@ -0,0 +1,421 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+#################################################################################
+'''
+ Binary snapshots of an already parsed index, stored next to the cached index archives.
+
+ Layout::
+
+   'RAPPSNAP' | version, header length (2 x uint32, little endian) | header | records
+
+ The header is a pickled dict holding the offset table of the records, the rapp packages, the invalid
+ rapps and the signature of the index archive the snapshot was taken from. Next to the offset and length
+ of its record, the offset table holds the summary (see rapp.RappSummary) and the chain of every rapp, so
+ that the chains and the compatibility index are built without unpickling any record. Every record is the
+ pickled, already classified raw data of one rapp including the standard args of its launch file. Records
+ are read from a memory mapped file and only unpickled when the rapp is requested.
+'''
+#################################################################################
+
+from __future__ import division, print_function
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+import mmap
+import os
+import struct
+import tempfile
+
+from . import tarball_resources
+from .compact import RAPP_STRINGS
+from .exceptions import InvalidSnapshotException, ParentRappNotFoundException, RappCyclicChainException, RappMalformedException
+from .indexer import RappIndexer
+from .rapp import Rapp, RappSummary
+from .rapp_loader import get_cached_launch_args, get_launch_args, seed_launch_args
+
+import logging
+import sys
+logger = logging.getLogger('snapshot')
+logger.addHandler(logging.StreamHandler(sys.stderr))
+#logger.setLevel(logging.DEBUG)
+
+SNAPSHOT_MAGIC = b'RAPPSNAP'
+# Bump whenever the layout of the header or the records changes
+SNAPSHOT_VERSION = 3
+
+_prefix = struct.Struct('<II')
+
+
+def is_snapshot_fresh(snapshot_filename, source_filename):
+    '''
+      Checks if a snapshot exists and was taken from the current contents of the index archive, see
+      RappSnapshot.is_fresh.
+
+      :param snapshot_filename: path of the snapshot
+      :type snapshot_filename: str
+      :param source_filename: path of the index archive
+      :type source_filename: str
+
+      :rtype: bool
+    '''
+    try:
+        snapshot = RappSnapshot(snapshot_filename)
+    except InvalidSnapshotException:
+        return False
+    try:
+        return snapshot.is_fresh(source_filename)
+    finally:
+        snapshot.close()
+
+
+def read_archive(filename):
+    '''
+      Reads an index archive along with the signature write_snapshot identifies it by: its size, mtime, ctime
+      and inode, taken before it is read, and its virtual root (see tarball_resources.archive_root), i.e.
+      the md5 of its contents.
+
+      :param filename: path of the archive
+      :type filename: str
+
+      :returns: the contents and the signature of the archive
+      :rtype: (bytes, tuple)
+
+      :raises: IOError, OSError: the archive cannot be read
+    '''
+    with open(filename, 'rb') as f:
+        st = os.fstat(f.fileno())
+        data = f.read()
+    return data, (len(data), st.st_mtime, st.st_ctime, st.st_ino, tarball_resources.archive_root(data))
+
+
+def write_snapshot(index, filename, archive=None):
+    '''
+      Writes a snapshot of the index. The standard args of the launch files of all implementations are
+      parsed now so that loading the snapshot does not have to.
+
+      :param index: the index
+      :type index: rocon_app_utilities.RappIndexer
+      :param filename: path of the snapshot
+      :type filename: str
+      :param archive: signature of the index archive the index was read from, see read_archive. A snapshot
+                      without one is never fresh
+      :type archive: tuple
+
+      :raises: IOError, OSError: the snapshot cannot be written
+    '''
+    index._update_chains()
+    packages = {}  # package.xml path : catkin package
+    entries = {}  # resource_name : (offset, length, summary, names of the rapps in its chain ancestor first or None)
+    records = []
+    offset = 0
+    for resource_name in sorted(index.raw_data):
+        rapp = index.raw_data[resource_name]
+        package = getattr(rapp, 'package', None)
+        package_key = None
+        if package is not None:
+            package_key = package.filename
+            packages[package_key] = package
+        launch_args = None
+        if rapp.is_implementation and 'launch' in rapp.raw_data:
+            try:
+                get_launch_args(rapp.raw_data['launch'])
+            except RappMalformedException:
+                pass  # reported when the launch args are requested
+            launch_args = get_cached_launch_args(rapp.raw_data['launch'])
+        record = pickle.dumps((rapp.filename, rapp.yaml_data, rapp.raw_data, rapp.type, rapp.is_implementation, rapp.is_ancestor, package_key, launch_args), pickle.HIGHEST_PROTOCOL)
+        entries[resource_name] = (offset, len(record), tuple(rapp.summary()), _chain_of(index, resource_name))
+        records.append(record)
+        offset += len(record)
+
+    header = {'source': index.source,
+              'packages': packages,
+              'entries': entries,
+              'paths': dict((name, (path, package.filename if package is not None else None)) for name, (path, package) in index.raw_data_path.items()),
+              # rapps which cannot be merged onto their parent are only found when they are resolved
+              'invalid_data': dict((k, v) for k, v in index.invalid_data.items() if k not in index._chain_errors),
+              'chain_errors': dict((k, _dump_chain_error(e)) for k, e in index._chain_errors.items() if _dump_chain_error(e) is not None),
+              # virtual roots of the index archive the rapps were read from, see tarball_resources
+              'resource_roots': sorted(tarball_resources.registered_roots([rapp.filename for rapp in index.raw_data.values()])),
+              'archive': archive}
+    header = pickle.dumps(header, pickle.HIGHEST_PROTOCOL)
+
+    base_path = os.path.dirname(filename)
+    if base_path and not os.path.exists(base_path):
+        os.makedirs(base_path)
+    fd, tmp_filename = tempfile.mkstemp(prefix='.rapp_snapshot_', dir=base_path or None)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(_prefix.pack(SNAPSHOT_VERSION, len(header)))
+            f.write(header)
+            for record in records:
+                f.write(record)
+        os.rename(tmp_filename, filename)
+    except Exception:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+    logger.debug("write_snapshot() %d rapps to '%s'" % (len(records), filename))
+
+
+def _chain_of(index, resource_name):
+    '''
+      :returns: names of the rapps in the chain of a rapp of the index, ancestor first, None if it has no chain
+      :rtype: (str)
+    '''
+    if resource_name not in index._chains:
+        return None
+    chain = [resource_name]
+    while index.raw_data[chain[-1]].parent_name:
+        chain.append(index.raw_data[chain[-1]].parent_name)
+    return tuple(reversed(chain))
+
+
+def _dump_chain_error(e):
+    '''
+      :returns: picklable form of an error of _update_chains, see _load_chain_error. None for other errors
+      :rtype: tuple
+    '''
+    if isinstance(e, ParentRappNotFoundException):
+        return ('parent', e.resource_name, e.parent_name)
+    if isinstance(e, RappCyclicChainException):
+        return ('cycle', list(e.stack))
+    return None
+
+
+def _load_chain_error(dumped):
+    if dumped[0] == 'parent':
+        return ParentRappNotFoundException(dumped[1], dumped[2])
+    return RappCyclicChainException(dumped[1])
+
+
+class RappSnapshot(object):
+    '''
+      Read access to a snapshot written by write_snapshot. Rapps are unpickled on demand.
+    '''
+
+    __slots__ = ['filename', 'source', 'invalid_data', 'chain_errors', 'paths', 'resource_roots', 'archive', '_packages', '_entries', '_mmap', '_base']
+
+    def __init__(self, filename):
+        '''
+          :param filename: path of the snapshot
+          :type filename: str
+
+          :raises: InvalidSnapshotException: the snapshot is missing, truncated, corrupted or of another version
+        '''
+        self.filename = filename
+        self._mmap = None
+        try:
+            with open(filename, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            start = len(SNAPSHOT_MAGIC) + _prefix.size
+            if self._mmap[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                raise InvalidSnapshotException("'%s' is not a rapp index snapshot" % filename)
+            version, header_length = _prefix.unpack(self._mmap[len(SNAPSHOT_MAGIC):start])
+            if version != SNAPSHOT_VERSION:
+                raise InvalidSnapshotException("snapshot '%s' has version %d instead of %d" % (filename, version, SNAPSHOT_VERSION))
+            header = pickle.loads(self._mmap[start:start + header_length])
+        except InvalidSnapshotException:
+            self.close()
+            raise
+        except (IOError, OSError, EOFError, ValueError, TypeError, struct.error, pickle.UnpicklingError) as e:
+            self.close()
+            raise InvalidSnapshotException("cannot read snapshot '%s' [%s]" % (filename, str(e)))
+        self._base = start + header_length
+        self.source = header['source']
+        self.invalid_data = header['invalid_data']
+        self.chain_errors = header['chain_errors']
+        self.paths = header['paths']
+        self.resource_roots = header['resource_roots']
+        self.archive = header['archive']
+        self._packages = header['packages']
+        self._entries = header['entries']
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def is_fresh(self, source_filename):
+        '''
+          Checks if the snapshot was taken from the current contents of the index archive, see read_archive.
+          An archive of another size is not, one with the same mtime, ctime and inode is. Otherwise, e.g. when
+          the archive was touched or replaced by a copy preserving its mtime (whose ctime changes anyway), its
+          contents are hashed and compared.
+
+          :param source_filename: path of the index archive
+          :type source_filename: str
+
+          :rtype: bool
+        '''
+        if self.archive is None:
+            return False
+        size, mtime, ctime, inode, root = self.archive
+        try:
+            st = os.stat(source_filename)
+            if st.st_size != size:
+                return False
+            if (st.st_mtime, st.st_ctime, st.st_ino) == (mtime, ctime, inode):
+                return True
+            logger.debug("is_fresh() hashing '%s', it was modified or replaced" % source_filename)
+            with open(source_filename, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError) as e:  # ValueError: empty file
+            logger.debug("is_fresh() cannot read '%s' [%s]" % (source_filename, str(e)))
+            return False
+        try:
+            return tarball_resources.archive_root(data) == root
+        finally:
+            data.close()
+
+    def names(self):
+        '''
+          :returns: names of the rapps in the snapshot
+          :rtype: [str]
+        '''
+        return list(self._entries.keys())
+
+    def __contains__(self, resource_name):
+        return resource_name in self._entries
+
+    def load_rapp(self, resource_name):
+        '''
+          Unpickles a single rapp.
+
+          :param resource_name: rapp name
+          :type resource_name: str
+
+          :returns: the raw rapp as it was indexed
+          :rtype: rocon_app_utilities.Rapp
+
+          :raises: KeyError: the rapp is not in the snapshot
+          :raises: InvalidSnapshotException: the record is corrupted
+        '''
+        offset, length = self._entries[resource_name][:2]
+        start = self._base + offset
+        try:
+            filename, yaml_data, raw_data, rapp_type, is_implementation, is_ancestor, package_key, launch_args = pickle.loads(self._mmap[start:start + length])
+        except (EOFError, ValueError, TypeError, pickle.UnpicklingError) as e:
+            raise InvalidSnapshotException("corrupted record of '%s' in snapshot '%s' [%s]" % (resource_name, self.filename, str(e)))
+
+        r = Rapp(resource_name)
+        r.filename = RAPP_STRINGS.intern_string(filename)
+        r.raw_data = RAPP_STRINGS.intern_data(raw_data)
+        r.yaml_data = RAPP_STRINGS.intern_overlay(yaml_data, r.raw_data)
+        r.type = rapp_type
+        r.is_implementation = is_implementation
+        r.is_ancestor = is_ancestor
+        r.parent_name = r.raw_data.get('parent_name')
+        r.package = self._packages.get(package_key)
+        if launch_args is not None:
+            signature, args = launch_args
+            seed_launch_args(r.raw_data['launch'], signature, args)
+        return r
+
+    def summary(self, resource_name):
+        '''
+          :returns: the summary of a rapp stored in the offset table
+          :rtype: rocon_app_utilities.rapp.RappSummary
+
+          :raises: KeyError: the rapp is not in the snapshot
+        '''
+        return RappSummary(*self._entries[resource_name][2])
+
+    def load_index(self, package_whitelist=None, package_blacklist=[]):
+        '''
+          Creates an index of the rapps in the snapshot. Its raw rapps are unpickled on their first lookup
+          (see SnapshotRapps), so the snapshot must not be closed while the index is in use. Unless packages
+          are filtered, which may break chains, the chains stored in the snapshot are taken as they are.
+
+          :param package_whitelist: list of target package list
+          :type package_whitelist: [str]
+          :param package_blacklist: list of blacklisted package
+          :type package_blacklist: [str]
+
+          :returns: the index
+          :rtype: rocon_app_utilities.RappIndexer
+        '''
+        def accepted(resource_name):
+            package_name = resource_name.split('/')[0]
+            if package_whitelist and package_name not in package_whitelist:
+                return False
+            return not (package_blacklist and package_name in package_blacklist)
+
+        raw_data = SnapshotRapps(self, [name for name in self._entries if accepted(name)])
+        index = RappIndexer(raw_data=raw_data, package_whitelist=package_whitelist, package_blacklist=package_blacklist, source=self.source)
+        index.raw_data_path = dict((name, (path, self._packages.get(package_key))) for name, (path, package_key) in self.paths.items() if accepted(name))
+        index.invalid_data = dict((k, v) for k, v in self.invalid_data.items() if accepted(k))
+        if len(raw_data) == len(self._entries):
+            index._set_chains(dict((name, frozenset(entry[3])) for name, entry in self._entries.items() if entry[3] is not None),
+                              dict((name, _load_chain_error(e)) for name, e in self.chain_errors.items()))
+        return index
+
+
+class SnapshotRapps(Mapping):
+    '''
+      Read-only mapping of the raw rapps of a snapshot. A rapp is unpickled on its first lookup and kept
+      afterwards, the snapshot stays open as long as the mapping is referenced.
+    '''
+    __slots__ = ['_snapshot', '_names', '_rapps']
+
+    def __init__(self, snapshot, names):
+        '''
+          :param snapshot: the open snapshot
+          :type snapshot: RappSnapshot
+          :param names: names of the rapps of the snapshot to hold
+          :type names: [str]
+        '''
+        self._snapshot = snapshot
+        self._names = frozenset(names)
+        self._rapps = {}  # resource_name : rapp unpickled so far
+
+    def __getitem__(self, key):
+        '''
+          :raises: KeyError: the rapp is not held
+          :raises: InvalidSnapshotException: its record is corrupted
+        '''
+        rapp = self._rapps.get(key)
+        if rapp is None:
+            if key not in self._names:
+                raise KeyError(key)
+            rapp = self._rapps[key] = self._snapshot.load_rapp(key)
+        return rapp
+
+    def __contains__(self, key):
+        return key in self._names
+
+    def summary(self, key):
+        '''
+          returns the summary of a rapp without unpickling it, see RappIndexer._summary
+
+          :rtype: rocon_app_utilities.rapp.RappSummary
+
+          :raises: KeyError: the rapp is not held
+        '''
+        if key not in self._names:
+            raise KeyError(key)
+        rapp = self._rapps.get(key)
+        return rapp.summary() if rapp is not None else self._snapshot.summary(key)
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __setitem__(self, key, value):
+        raise TypeError('snapshot rapps are read-only')
+
+    __delitem__ = __setitem__
+
+    def __repr__(self):
+        return repr(dict(self.items()))
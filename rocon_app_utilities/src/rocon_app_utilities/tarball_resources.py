@@ -0,0 +1,442 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+#################################################################################
+'''
+ Read access to the files of an index archive without extracting it.
+
+ The members of an archive are held in memory and addressed by virtual paths below
+ ~/.ros/rocon/rapp/resources/<md5 of the archive>/. Only when a file is needed on
+ disk, e.g. the launch file of a rapp which is started, it is materialised at its
+ virtual path. The size of that directory is bounded by RESOURCE_CACHE_SIZE whenever an
+ archive is registered and when the process exits, least recently materialised files are
+ removed first.
+
+ All file access of the rapp loader goes through exists(), read() and signature(),
+ which fall back to the regular filesystem for paths which are not virtual. An
+ archive is registered for as long as an index holding rapps of it references it
+ (see RappIndexer.archives).
+'''
+#################################################################################
+
+from __future__ import division, print_function
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import BytesIO as StringIO
+import atexit
+import collections
+import errno
+import gzip
+import hashlib
+import mmap
+import os
+import tarfile
+import tempfile
+import weakref
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+import catkin_pkg.package
+import rospkg
+
+from .exceptions import UnsupportedArchiveCodecException
+
+import logging
+import sys
+logger = logging.getLogger('tarball_resources')
+logger.addHandler(logging.StreamHandler(sys.stderr))
+#logger.setLevel(logging.DEBUG)
+
+_resource_cache_dir = os.path.join(rospkg.get_ros_home(), 'rocon', 'rapp', 'resources')
+
+# Upper bound of the materialised resources in bytes
+RESOURCE_CACHE_SIZE = 64 * 1024 * 1024
+
+_registry = weakref.WeakValueDictionary()  # virtual root : TarballResources referenced by an index
+
+# Suffix of the index archives by codec
+ARCHIVE_EXTENSIONS = collections.OrderedDict([('gz', '.index.tar.gz'), ('xz', '.index.tar.xz'), ('none', '.index.tar')])
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_XZ_MAGIC = b'\xfd7zXZ\x00'
+
+
+class TarballResources(object):
+    '''
+      The regular files of an index archive, addressed by virtual paths below its root.
+    '''
+
+    __slots__ = ['root', 'archive', '_members', '__weakref__']
+
+    def __init__(self, root, members=None, archive=None):
+        '''
+          :param root: virtual root directory of the members
+          :type root: str
+          :param members: contents of the members by their name in the archive
+          :type members: {str: bytes}
+          :param archive: path of the archive to read the members from on first access, if members is None
+          :type archive: str
+        '''
+        self.root = root
+        self.archive = archive
+        self._members = members
+
+    @classmethod
+    def from_tarball(cls, name=None, fileobj=None):
+        '''
+          Reads all members of a gzip, xz or uncompressed tarball into memory.
+
+          :param name: the pathname of the archive
+          :type name: str
+          :param fileobj: alternative to a file object opened for name
+          :type fileobj: file
+
+          :rtype: TarballResources
+
+          :raises: UnsupportedArchiveCodecException: the archive is xz compressed and lzma is not installed
+        '''
+        if fileobj is not None:
+            data = fileobj.read()
+            return cls(archive_root(data), _read_members(data), name)
+        with open(name, 'rb') as f:
+            # uncompressed archives are not copied into memory as a whole
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(archive_root(data), _read_members(data), name)
+        finally:
+            data.close()
+
+    def members(self):
+        if self._members is None:
+            logger.debug("members() read '%s'" % self.archive)
+            self._members = TarballResources.from_tarball(name=self.archive).members()
+        return self._members
+
+    def path(self, member_name):
+        '''
+          :returns: virtual path of a member
+          :rtype: str
+        '''
+        return os.path.join(self.root, member_name)
+
+    def contains(self, path):
+        '''
+          :returns: True if the path is below the virtual root, regardless of whether such a member exists
+          :rtype: bool
+        '''
+        return path.startswith(self.root + os.sep)
+
+    def _member_name(self, path):
+        return os.path.normpath(path)[len(self.root) + 1:]
+
+    def exists(self, path):
+        return self._member_name(path) in self.members()
+
+    def read(self, path):
+        '''
+          :returns: the contents of the member at the virtual path
+          :rtype: bytes
+
+          :raises: IOError: no such member
+        '''
+        try:
+            return self.members()[self._member_name(path)]
+        except KeyError:
+            raise IOError(errno.ENOENT, 'No such file in index archive', path)
+
+    def materialize(self, path):
+        '''
+          Writes the member to its virtual path unless it is there already.
+
+          :returns: the path
+          :rtype: str
+
+          :raises: IOError: no such member
+        '''
+        data = self.read(path)
+        if os.path.isfile(path) and os.path.getsize(path) == len(data):
+            os.utime(path, None)  # mark as recently used
+            return path
+        base_path = os.path.dirname(path)
+        if not os.path.exists(base_path):
+            os.makedirs(base_path)
+        fd, tmp_filename = tempfile.mkstemp(prefix='.resource_', dir=base_path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(tmp_filename, path)
+        logger.debug("materialize() '%s'" % path)
+        return path
+
+    def resource_index_from_package_exports(self, export_tag, package_whitelist=None, package_blacklist=[]):
+        '''
+          Same as rocon_python_utils.ros.resource_index_from_package_exports for the packages in the archive.
+
+          :returns: {resource_name: (virtual path, catkin package)} of existing and of missing resources
+          :rtype: dict, dict
+        '''
+        resources = {}
+        invalid_resources = {}
+        for member_name in sorted(self.members()):
+            if os.path.basename(member_name) != catkin_pkg.package.PACKAGE_MANIFEST_FILENAME:
+                continue
+            package_filename = self.path(member_name)
+            package = catkin_pkg.package.parse_package_string(self.members()[member_name], filename=package_filename)
+            if package_whitelist:
+                if package.name not in package_whitelist:
+                    continue
+            elif package.name in package_blacklist:
+                continue
+            for export in package.exports:
+                if export.tagname != export_tag:
+                    continue
+                resource_name = package.name + '/' + os.path.splitext(os.path.basename(export.content))[0]
+                resource_filename = os.path.normpath(os.path.join(os.path.dirname(package_filename), export.content))
+                if self.contains(resource_filename) and self.exists(resource_filename):
+                    resources[resource_name] = (resource_filename, package)
+                else:
+                    invalid_resources[resource_name] = (resource_filename, package)
+        return resources, invalid_resources
+
+
+def archive_root(data):
+    '''
+      Returns the virtual root of the members of an archive, which is specific to the contents of the archive.
+
+      :param data: the archive
+      :type data: bytes or mmap.mmap
+
+      :rtype: str
+    '''
+    return os.path.join(_resource_cache_dir, hashlib.md5(data).hexdigest())
+
+
+def _read_members(data):
+    '''
+      Reads the regular and hard linked files of a gzip, xz or uncompressed tarball.
+
+      :param data: the archive
+      :type data: bytes or mmap.mmap
+
+      :raises: UnsupportedArchiveCodecException: the archive is xz compressed and lzma is not installed
+    '''
+    if data[:len(_GZIP_MAGIC)] == _GZIP_MAGIC:
+        fileobj = gzip.GzipFile(fileobj=StringIO(data[:]), mode='rb')
+    elif data[:len(_XZ_MAGIC)] == _XZ_MAGIC:
+        if lzma is None:
+            raise UnsupportedArchiveCodecException('reading xz index archives requires the lzma module')
+        fileobj = StringIO(lzma.decompress(data[:]))
+    elif isinstance(data, mmap.mmap):
+        fileobj = data
+    else:
+        fileobj = StringIO(data)
+    members = {}
+    with tarfile.open(fileobj=fileobj, mode='r:') as tar:
+        for tarinfo in tar:
+            if tarinfo.isfile() or tarinfo.islnk():
+                members[os.path.normpath(tarinfo.name)] = tar.extractfile(tarinfo).read()
+    return members
+
+
+def members_digest(members):
+    '''
+      Identifies the contents of an archive regardless of its codec and member metadata.
+
+      :param members: contents of the members by name
+      :type members: {str: bytes}
+
+      :returns: md5 over the sorted member names and contents
+      :rtype: str
+    '''
+    md5 = hashlib.md5()
+    for name in sorted(members):
+        md5.update(name.encode('utf-8') if not isinstance(name, bytes) else name)
+        md5.update(b'\0')
+        md5.update(hashlib.md5(members[name]).digest())
+    return md5.hexdigest()
+
+
+def write_archive(filename, members, codec='gz'):
+    '''
+      Writes a reproducible tarball: members are sorted, carry neither timestamps nor owners and members with
+      identical contents are stored once, the others are hard links to it.
+
+      :param filename: the pathname of the archive
+      :type filename: str
+      :param members: names and contents of the members
+      :type members: [(str, bytes)]
+      :param codec: one of ARCHIVE_EXTENSIONS
+      :type codec: str
+
+      :raises: ValueError: the codec is unknown
+      :raises: UnsupportedArchiveCodecException: the codec is xz and lzma is not installed
+    '''
+    if codec not in ARCHIVE_EXTENSIONS:
+        raise ValueError("unknown index archive codec '%s', use one of %s" % (codec, list(ARCHIVE_EXTENSIONS.keys())))
+    if codec == 'xz' and lzma is None:
+        raise UnsupportedArchiveCodecException('writing xz index archives requires the lzma module')
+
+    buf = StringIO()
+    stored = {}  # md5 of contents : name of the member holding them
+    with tarfile.open(fileobj=buf, mode='w:', format=tarfile.GNU_FORMAT) as tar:
+        for name, data in sorted(members):
+            tarinfo = tarfile.TarInfo(name)
+            tarinfo.mode = 0o644
+            tarinfo.mtime = 0
+            tarinfo.uid = tarinfo.gid = 0
+            tarinfo.uname = tarinfo.gname = ''
+            digest = hashlib.md5(data).hexdigest()
+            if digest in stored:
+                tarinfo.type = tarfile.LNKTYPE
+                tarinfo.linkname = stored[digest]
+                tar.addfile(tarinfo)
+            else:
+                stored[digest] = name
+                tarinfo.size = len(data)
+                tar.addfile(tarinfo, StringIO(data))
+    data = buf.getvalue()
+
+    if codec == 'gz':
+        compressed = StringIO()
+        with gzip.GzipFile(filename='', mode='wb', fileobj=compressed, mtime=0) as f:
+            f.write(data)
+        data = compressed.getvalue()
+    elif codec == 'xz':
+        data = lzma.compress(data)
+    with open(filename, 'wb') as f:
+        f.write(data)
+
+
+def _prune_cache():
+    '''
+      Removes the least recently materialised resources while the cache exceeds RESOURCE_CACHE_SIZE. Walks the
+      whole cache, so it is only run when an archive is registered and at exit, not per materialised file.
+    '''
+    files = []
+    total = 0
+    for dirpath, unused_dirnames, filenames in os.walk(_resource_cache_dir):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+    for unused_mtime, size, path in sorted(files):
+        if total <= RESOURCE_CACHE_SIZE:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+atexit.register(_prune_cache)
+
+#################################################################################
+# Virtual filesystem
+#################################################################################
+
+
+def register(resources):
+    '''
+      Makes the members of an archive accessible by their virtual paths for as long as the returned archive is
+      referenced, e.g. by the indices holding rapps of it. An archive already registered under the same root
+      has the same contents and is kept.
+
+      :param resources: the archive
+      :type resources: TarballResources
+
+      :returns: the registered archive, to be referenced by the caller
+      :rtype: TarballResources
+    '''
+    registered = _registry.get(resources.root)
+    if registered is None:
+        _registry[resources.root] = registered = resources
+        _prune_cache()
+    elif registered._members is None and resources._members is not None:
+        registered._members = resources._members  # read already, spare reading it again
+    return registered
+
+
+def registered_roots(paths):
+    '''
+      :returns: the virtual roots of the registered archives the given paths are in
+      :rtype: set
+    '''
+    return set(resources.root for resources in list(_registry.values()) if any(resources.contains(p) for p in paths if p))
+
+
+def find(path):
+    '''
+      :returns: the registered archive holding the virtual path or None
+      :rtype: TarballResources
+    '''
+    for resources in list(_registry.values()):
+        if resources.contains(path):
+            return resources
+    return None
+
+
+def exists(path):
+    resources = find(path)
+    if resources is not None:
+        return resources.exists(path)
+    return os.path.exists(path)
+
+
+def read(path):
+    '''
+      :returns: the contents of a virtual or regular file
+      :rtype: bytes
+
+      :raises: IOError: the file does not exist
+    '''
+    resources = find(path)
+    if resources is not None:
+        return resources.read(path)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def signature(path):
+    '''
+      :returns: a value which changes with the contents of the file or None if it does not exist.
+                Members of an archive never change, their root is specific to the archive contents.
+      :rtype: tuple
+    '''
+    resources = find(path)
+    if resources is not None:
+        return (resources.root,) if resources.exists(path) else None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+
+def materialize(path):
+    '''
+      Makes sure a file which might be a member of an index archive exists on disk, e.g. before the
+      launch file of a rapp is started.
+
+      :param path: virtual or regular path
+      :type path: str
+
+      :returns: the path
+      :rtype: str
+    '''
+    if path:
+        resources = find(path)
+        if resources is not None:
+            return resources.materialize(path)
+    return path
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+#################################################################################
+'''
+ Loads the yaml files of rapps (.rapp, .interface, .parameters) with the libyaml
+ safe loader where available and keeps the parsed documents for the life of the
+ process, so that a file referenced by many rapps is parsed once.
+'''
+#################################################################################
+
+from __future__ import division, print_function
+import threading
+import yaml
+
+from . import tarball_resources
+
+# libyaml is optional, the pure python loader parses the same documents
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+_documents = {}  # path : (signature, document)
+_lock = threading.Lock()
+
+
+class FrozenDict(dict):
+    '''
+      dict of a cached document, which must not change as it is shared by everyone loading the file.
+      Pickled and copied as a plain dict.
+    '''
+    __slots__ = []
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('cached yaml document is read-only, copy it to modify it')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+    def __deepcopy__(self, memo):
+        return dict((k, _thaw(v)) for k, v in self.items())
+
+
+class FrozenList(list):
+    '''
+      list of a cached document, see FrozenDict. Pickled and copied as a plain list.
+    '''
+    __slots__ = []
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('cached yaml document is read-only, copy it to modify it')
+
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = reverse = sort = _read_only
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+    def __deepcopy__(self, memo):
+        return [_thaw(v) for v in self]
+
+
+for _dumper in [yaml.Dumper, yaml.SafeDumper]:
+    yaml.add_representer(FrozenDict, yaml.representer.SafeRepresenter.represent_dict, Dumper=_dumper)
+    yaml.add_representer(FrozenList, yaml.representer.SafeRepresenter.represent_list, Dumper=_dumper)
+
+
+def load_yaml(path):
+    '''
+      Parses a yaml file, or returns the document parsed earlier if the file did not change since
+      (see tarball_resources.signature).
+
+      :param path: virtual or regular path of the file
+      :type path: str
+
+      :returns: the document, its dicts and lists are read-only (FrozenDict, FrozenList)
+      :rtype: object
+
+      :raises: IOError: the file does not exist
+      :raises: yaml.YAMLError: the file is no valid yaml
+    '''
+    signature = tarball_resources.signature(path)
+    cached = _documents.get(path)
+    if cached is not None and signature is not None and cached[0] == signature:
+        return cached[1]
+    document = _freeze(yaml.load(tarball_resources.read(path), Loader=SafeLoader))
+    if signature is not None:
+        with _lock:
+            _documents[path] = (signature, document)
+    return document
+
+
+def clear_yaml_cache():
+    with _lock:
+        _documents.clear()
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return FrozenDict((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return FrozenList(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, dict):
+        return dict((k, _thaw(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_thaw(v) for v in value]
+    return value
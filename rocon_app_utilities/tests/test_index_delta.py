@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+
+##############################################################################
+# Imports
+##############################################################################
+
+# enable some python3 compatibility options:
+# (unicode_literals not compatible with python2 uuid module)
+from __future__ import absolute_import, print_function
+
+from nose.tools import assert_equal, assert_raises, assert_true
+import os
+import shutil
+import tempfile
+
+from rocon_app_utilities.exceptions import InvalidDeltaException
+from rocon_app_utilities.index_delta import apply_delta, delta_url_for_index, diff_archives, read_delta
+import rocon_app_utilities.tarball_resources as tarball_resources
+from rocon_app_utilities.rapp_repositories import build_index, get_index, update_remote_index
+
+##############################################################################
+# Tests
+##############################################################################
+
+
+def _write_versions(tempdir):
+    '''
+      Writes the index archives of two versions of rocon_apps, the second one with a changed
+      listener and without text_to_speech.
+    '''
+    repo_path = os.path.join(tempdir, 'rocon_apps')
+    shutil.copytree(os.path.join(os.path.dirname(__file__), '..', '..', 'rocon_apps'), repo_path)
+    old_filename = build_index([repo_path], use_cache=False).write_tarball(os.path.join(tempdir, 'old'))
+
+    with open(os.path.join(repo_path, 'apps', 'listener', 'listener.rapp'), 'a') as f:
+        f.write('\n# changed\n')
+    with open(os.path.join(repo_path, 'package.xml')) as f:
+        package_xml = f.read()
+    with open(os.path.join(repo_path, 'package.xml'), 'w') as f:
+        f.write(package_xml.replace('<rocon_app>apps/text_to_speech/text_to_speech.rapp</rocon_app>', ''))
+    new_filename = build_index([repo_path], use_cache=False).write_tarball(os.path.join(tempdir, 'new'))
+    return old_filename, new_filename
+
+
+def _digest(filename):
+    return tarball_resources.members_digest(tarball_resources.TarballResources.from_tarball(name=filename).members())
+
+
+def test_diff_and_apply():
+    tempdir = tempfile.mkdtemp(suffix='', prefix='test_index_delta_')
+    try:
+        old_filename, new_filename = _write_versions(tempdir)
+        delta_filename = os.path.join(tempdir, 'new.delta.tar.gz')
+        manifest = diff_archives(old_filename, new_filename, delta_filename)
+        assert_equal(manifest['rapps']['added'], [])
+        assert_true('rocon_apps/listener' in manifest['rapps']['changed'])
+        assert_true('rocon_apps/talker' not in manifest['rapps']['changed'])
+        assert_equal(manifest['rapps']['removed'], ['rocon_apps/text_to_speech'])
+        assert_true(any(name.endswith('listener.rapp') for name in manifest['resources']['changed']))
+        assert_true(any(name.endswith('text_to_speech.rapp') for name in manifest['resources']['removed']))
+
+        manifest, members = read_delta(name=delta_filename)
+        patched_filename = os.path.join(tempdir, 'patched.index.tar.gz')
+        apply_delta(old_filename, manifest, members, filename=patched_filename)
+        assert_equal(_digest(patched_filename), _digest(new_filename))
+
+        # the delta does not apply to any other version
+        assert_raises(InvalidDeltaException, apply_delta, delta_filename, manifest, members, filename=patched_filename)
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_update_remote_index():
+    tempdir = tempfile.mkdtemp(suffix='', prefix='test_index_delta_')
+
+    # override default location of the cached index archives
+    import rocon_app_utilities.rapp_repositories
+    rocon_app_utilities.rapp_repositories._rapp_repositories_list_file = os.path.join(tempdir, 'cache', 'rapp.list')
+    try:
+        old_filename, new_filename = _write_versions(tempdir)
+        published_filename = os.path.join(tempdir, 'rocon_apps.index.tar.gz')
+        index_url = 'file://%s' % published_filename
+
+        # the first update downloads the archive
+        shutil.copy(old_filename, published_filename)
+        cached_filename = update_remote_index(index_url)
+        assert_equal(_digest(cached_filename), _digest(old_filename))
+        assert_true('rocon_apps/text_to_speech' in get_index(index_url).raw_data)
+
+        # later ones only apply the delta
+        shutil.copy(new_filename, published_filename)
+        diff_archives(old_filename, new_filename, delta_url_for_index(published_filename))
+        os.remove(published_filename)
+        assert_equal(update_remote_index(index_url), cached_filename)
+        assert_equal(_digest(cached_filename), _digest(new_filename))
+        assert_true('rocon_apps/text_to_speech' not in get_index(index_url).raw_data)
+
+        # an applied delta is skipped
+        assert_equal(update_remote_index(index_url), cached_filename)
+    finally:
+        shutil.rmtree(tempdir)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+
+##############################################################################
+# Imports
+##############################################################################
+
+# enable some python3 compatibility options:
+# (unicode_literals not compatible with python2 uuid module)
+from __future__ import absolute_import, print_function
+
+from nose.tools import assert_equal, assert_raises, assert_true
+import os
+import shutil
+import tempfile
+import threading
+
+from rocon_app_utilities.exceptions import RappMalformedException
+from rocon_app_utilities.index_watcher import IndexWatcher, find_rapps_reading, index_dependencies
+from rocon_app_utilities.rapp_repositories import build_index
+
+##############################################################################
+# Tests
+##############################################################################
+
+
+def test_refresh_changed_rapps():
+    tempdir = tempfile.mkdtemp(suffix='', prefix='test_index_watcher_')
+    try:
+        repo_path = os.path.join(tempdir, 'rocon_apps')
+        shutil.copytree(os.path.join(os.path.dirname(__file__), '..', '..', 'rocon_apps'), repo_path)
+        index = build_index([repo_path], use_cache=False)
+        talker_path = os.path.join(repo_path, 'apps', 'talker', 'talker.rapp')
+        assert_true(talker_path in index_dependencies(index))
+        assert_true(os.path.join(repo_path, 'package.xml') in index_dependencies(index))
+        unused_compatible, unused_incompatible, unused_invalid = index.get_compatible_rapps('rocon:/', lazy_specs=True)
+        listener = index._resolved['rocon_apps/listener'][0]
+
+        chirp_path = os.path.join(repo_path, 'apps', 'chirp', 'chirp.rapp')
+        with open(chirp_path) as f:
+            chirp = f.read()
+        with open(chirp_path, 'w') as f:
+            f.write(chirp.replace('display: Chirp', 'display: Tweet'))
+        affected = index.refresh(build_index([repo_path], use_cache=False))
+
+        # the changed ancestor and the rapps inheriting from it, nothing else
+        assert_true('rocon_apps/chirp' in affected)
+        assert_true('rocon_apps/moo_chirp' in affected)
+        assert_true('rocon_apps/listener' not in affected)
+        assert_true(index._resolved['rocon_apps/listener'][0] is listener)
+        assert_equal(index.refresh(build_index([repo_path], use_cache=False)), set([]))
+
+        # a launch file edited into invalid xml leaves the raw data unchanged, the rapp is resolved again anyway
+        assert_equal(index.get_rapp('rocon_apps/talker').data['launch_args'], [])
+        talker_launch_path = os.path.join(repo_path, 'apps', 'talker', 'talker.launch')
+        with open(talker_launch_path, 'w') as f:
+            f.write('<launch><node')
+        new_index = build_index([repo_path], use_cache=False)
+        edited = find_rapps_reading(new_index, set([talker_launch_path]))
+        assert_equal(edited, set(['rocon_apps/talker']))
+        assert_true('rocon_apps/talker' in index.refresh(new_index, edited))
+        assert_raises(RappMalformedException, lambda: index.get_rapp('rocon_apps/talker').data['launch_args'])
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_watcher_debounces():
+    tempdir = tempfile.mkdtemp(suffix='', prefix='test_index_watcher_')
+    try:
+        paths = [os.path.join(tempdir, name) for name in ['foo.rapp', 'foo.launch']]
+        for path in paths:
+            with open(path, 'w') as f:
+                f.write('')
+        calls = []
+        called = threading.Event()
+
+        def callback(changed):
+            calls.append(changed)
+            called.set()
+
+        watcher = IndexWatcher(callback, debounce=0.3, poll_period=0.1, use_inotify=False)
+        watcher.watch(set(paths + [tempdir]))
+        watcher.start()
+        try:
+            for path in paths:
+                with open(path, 'w') as f:
+                    f.write('changed')
+            called.wait(5.0)
+        finally:
+            watcher.stop()
+        assert_equal(len(calls), 1)
+        assert_true(set(paths).issubset(calls[0]))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_watcher_notices_changes_during_callback():
+    tempdir = tempfile.mkdtemp(suffix='', prefix='test_index_watcher_')
+    try:
+        path = os.path.join(tempdir, 'foo.rapp')
+        with open(path, 'w') as f:
+            f.write('')
+        calls = []
+        called = threading.Event()
+
+        def callback(changed):
+            calls.append(changed)
+            if len(calls) == 1:
+                # edited again while the index is rebuilt, before the watched paths are updated
+                with open(path, 'w') as f:
+                    f.write('changed again')
+                watcher.watch(set([path]))
+            else:
+                called.set()
+
+        watcher = IndexWatcher(callback, debounce=0.3, poll_period=0.1, use_inotify=False)
+        watcher.watch(set([path]))
+        watcher.start()
+        try:
+            with open(path, 'w') as f:
+                f.write('changed')
+            called.wait(5.0)
+        finally:
+            watcher.stop()
+        assert_equal(calls, [set([path]), set([path])])
+    finally:
+        shutil.rmtree(tempdir)
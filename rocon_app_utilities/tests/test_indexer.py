@@ -13,7 +13,10 @@
 from __future__ import absolute_import, print_function
 
 from nose.tools import assert_raises, assert_true
+import itertools
 import os
+import shutil
+import tempfile
 import rocon_console.console as console
 
 import rocon_uri
@@ -21,6 +24,8 @@ from rocon_uri.exceptions import RoconURIValueError
 from rocon_app_utilities import *
 from rocon_app_utilities import *
 from rocon_app_utilities.exceptions import *
+from rocon_app_utilities.compatibility_index import CompatibilityIndex
+from rocon_app_utilities.interface_index import PublicConnection, compile_public_interface
 
 default_data = [('basic/child',             '/test_rapps/indexer/basic/child.rapp'),
                 ('basic/parent',            '/test_rapps/indexer/basic/parent.rapp'),
@@ -48,6 +53,8 @@ cyclic_data = [('cyclic/child',            '/test_rapps/indexer/cyclic/child.rap
                ('cyclic/parent',           '/test_rapps/indexer/cyclic/parent.rapp')
               ]
 
+rocon_apps_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'rocon_apps'))
+
 compat_data = [('compat/turtlebot_teleop',  '/test_rapps/indexer/compat/turtlebot_teleop.rapp'),
                ('compat/kobuki_teleop',     '/test_rapps/indexer/compat/kobuki_teleop.rapp'),
                ('compat/teleop',            '/test_rapps/indexer/compat/teleop.rapp')
@@ -185,12 +192,343 @@ class TestRappIndexer():
 
 
 
+def test_resolve_cache():
+    print_title('Test Resolve Cache')
+
+    indexer = index_rocon_apps()
+
+    # resolved once, handed out as views on the same data, which is copied on write
+    first = indexer.get_rapp('rocon_apps/moo_chirp')
+    second = indexer.get_rapp('rocon_apps/moo_chirp')
+    assert_true(first is not second)
+    assert_true(first.raw_data['public_interface'] is second.raw_data['public_interface'])
+    assert_true(first.data is not second.data)
+    assert_true(first.raw_data['display'] == 'Moo Chirp')
+    first.raw_data['display'] = 'Oink Chirp'
+    del first.raw_data['icon']
+    assert_true(first.raw_data['display'] == 'Oink Chirp' and 'icon' not in first.raw_data)
+    assert_true(second.raw_data['display'] == 'Moo Chirp' and 'icon' in second.raw_data)
+    assert_true(indexer.get_rapp('rocon_apps/moo_chirp').raw_data['display'] == 'Moo Chirp')
+    assert_true(first.raw_data['public_interface'] is second.raw_data['public_interface'])
+    first = second
+
+    # siblings share what they inherit from their ancestor instead of holding copies
+    lion = indexer.get_rapp('rocon_apps/lion_chirp')
+    assert_true(lion.raw_data['public_interface'] is first.raw_data['public_interface'])
+    assert_true('parent_name' not in lion.raw_data)
+    writable = lion.raw_data.copy()
+    writable['display'] = 'Oink Chirp'
+    assert_true(lion.raw_data['display'] == 'Lion Chirp')
+
+    # merging a new version of the ancestor invalidates the children
+    other = RappIndexer(raw_data={'rocon_apps/chirp': indexer.get_raw_rapp('rocon_apps/chirp')})
+    indexer.merge(other)
+    assert_true(indexer._resolve('rocon_apps/moo_chirp').raw_data._parent is not first.raw_data._parent)
+    assert_true(indexer._resolve('rocon_apps/talker').raw_data._own is indexer._resolve('rocon_apps/talker').raw_data._own)
+
+
+def test_chain_errors():
+    print_title('Test Chain Errors')
+
+    implementation = {'compatibility': 'rocon:/', 'launch': '/talker.launch'}
+    data = {'ancestor': create_rapp('ancestor', {'display': 'Ancestor', 'description': 'virtual'}),
+            'child': create_rapp('child', dict(implementation, parent_name='ancestor')),
+            'cyclic/child': create_rapp('cyclic/child', dict(implementation, parent_name='cyclic/parent')),
+            'cyclic/parent': create_rapp('cyclic/parent', dict(implementation, parent_name='cyclic/child')),
+            'orphan': create_rapp('orphan', dict(implementation, parent_name='missing'))}
+    indexer = RappIndexer(raw_data=data)
+
+    resolved = indexer._resolve('child')
+    assert_true(resolved.ancestor_name == 'ancestor')
+    assert_true(resolved.type == 'Implementation Ancestor')
+    assert_true(resolved.raw_data['display'] == 'Ancestor')
+    assert_raises(RappCyclicChainException, indexer._resolve, 'cyclic/child')
+    assert_raises(ParentRappNotFoundException, indexer._resolve, 'orphan')
+    assert_raises(RappInvalidChainException, indexer._resolve, 'ancestor')
+
+    unused_compatible, unused_incompatible, invalid = indexer.get_compatible_rapps('rocon:/')
+    assert_true(set(['cyclic/child', 'cyclic/parent', 'orphan']).issubset(invalid.keys()))
+    assert_true(set(['cyclic/child', 'cyclic/parent', 'orphan']).issubset(indexer.invalid_data.keys()))
+
+
+def test_compatibility_index():
+    print_title('Test Compatibility Index')
+
+    uris = {'any': 'rocon:/',
+            'kobuki': 'rocon:/kobuki',
+            'turtlebot': 'rocon:/turtlebot2',
+            'kobuki_or_turtlebot_indigo': 'rocon:/turtlebot2|kobuki/*/indigo',
+            'pr2': 'rocon:/pr2'}
+    index = CompatibilityIndex()
+    for name, uri in uris.items():
+        index.add(name, uri)
+    index.remove('pr2')
+
+    for query in ['rocon:/', 'rocon:/kobuki', 'rocon:/kobuki/dude/indigo', 'rocon:/kobuki/dude/hydro', 'rocon:/pr2']:
+        compatible, incompatible, invalid = index.query(query)
+        expected = set(name for name, uri in uris.items() if name != 'pr2' and rocon_uri.is_compatible(uri, query))
+        assert_true(compatible == expected)
+        assert_true(incompatible == set(uris.keys()) - set(['pr2']) - expected)
+        assert_true(not invalid)
+
+
+def test_compatible_rapps_for_uris():
+    print_title('Test Compatible Rapps For Uris')
+
+    indexer = index_rocon_apps()
+
+    uris = ['rocon:/', 'rocon:/turtlebot2', 'rocon:/pc/dude/hydro|indigo/precise|trusty']
+    matrix = indexer.get_compatible_rapps_for_uris(uris)
+    assert_true(sorted(matrix.keys()) == sorted(uris))
+    for uri in uris:
+        compatible, incompatible, invalid = indexer.get_compatible_rapps(uri)
+        batch_compatible, batch_incompatible, batch_invalid = matrix[uri]
+        assert_true(sorted(batch_compatible.keys()) == sorted(compatible.keys()))
+        assert_true(sorted(batch_incompatible.keys()) == sorted(incompatible.keys()))
+        assert_true(batch_invalid == invalid)
+
+    # a rapp compatible with several uris is resolved only once
+    shared = set(matrix[uris[0]][0]) & set(matrix[uris[2]][0])
+    assert_true(shared)
+    for resource_name in shared:
+        assert_true(matrix[uris[0]][0][resource_name] is matrix[uris[2]][0][resource_name])
+
+
+def test_lazy_specs():
+    print_title('Test Lazy Specs')
+
+    tempdir = tempfile.mkdtemp(prefix='test_lazy_specs_')
+    try:
+        launch = os.path.join(tempdir, 'talker.launch')
+        with open(launch, 'w') as f:
+            f.write('<launch><arg name="gateway_name"/><arg name="other"/></launch>')
+        broken_launch = os.path.join(tempdir, 'broken.launch')
+        with open(broken_launch, 'w') as f:
+            f.write('<launch><arg')
+
+        data = {}
+        for name, path in [('talker', launch), ('broken', broken_launch)]:
+            data[name] = create_implementation(name, os.path.join(tempdir, name + '.rapp'), launch=path)
+        indexer = RappIndexer(raw_data=data)
+
+        # launch files are checked up front by default
+        compatible, unused_incompatible, invalid = indexer.get_compatible_rapps('rocon:/')
+        assert_true(sorted(compatible.keys()) == ['talker'])
+        assert_true('broken' in invalid)
+        assert_true(compatible['talker'].data['launch_args'] == ['gateway_name'])
+
+        # lazily, launch files are parsed on first access only
+        compatible, unused_incompatible, invalid = indexer.get_compatible_rapps('rocon:/', lazy_specs=True)
+        assert_true(sorted(compatible.keys()) == ['broken', 'talker'])
+        assert_true('launch_args' not in compatible['talker'].data.keys())
+        assert_true('launch_args' in compatible['talker'].data)
+        assert_true(compatible['talker'].data['launch_args'] == ['gateway_name'])
+        assert_true('launch_args' in compatible['talker'].data.keys())
+        assert_raises(RappMalformedException, compatible['broken'].data.__getitem__, 'launch_args')
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_merge_layers():
+    print_title('Test Merge Layers')
+
+    lowest = create_index('lowest', ['talker', 'listener'])
+    lowest.invalid_data = {'broken': 'missing launch'}
+    middle = create_index('middle', ['talker', 'broken'])
+    top = create_index('top', ['talker', 'teleop'])
+    combined = RappIndexer(raw_data={})
+    for index in [lowest, middle, top]:
+        combined.merge(index)
+
+    # rapps are taken from the topmost index holding them, without being copied
+    assert_true(sorted(combined.raw_data.keys()) == ['broken', 'listener', 'talker', 'teleop'])
+    assert_true(combined.raw_data['talker'] is top.raw_data['talker'])
+    assert_true(combined.raw_data['listener'] is lowest.raw_data['listener'])
+    assert_true(combined.get_rapp_sources('talker') == ['top', 'middle', 'lowest'])
+    assert_true(combined.get_rapp_sources('listener') == ['lowest'])
+    assert_raises(RappNotExistException, combined.get_rapp_sources, 'missing')
+    assert_raises(TypeError, combined.raw_data.__setitem__, 'talker', None)
+
+    # a rapp which is valid in a higher layer is not reported as invalid
+    assert_true('broken' not in combined.invalid_data)
+    assert_true(combined._resolve('talker').raw_data['display'] == 'top')
+    compatible, unused_incompatible, unused_invalid = combined.get_compatible_rapps('rocon:/', lazy_specs=True)
+    assert_true(sorted(compatible.keys()) == ['broken', 'listener', 'talker', 'teleop'])
+
+    # layers pushed after the first lookup shadow the resolved rapps
+    combined.merge(create_index('override', ['listener']))
+    assert_true(combined._resolve('listener').raw_data['display'] == 'override')
+    assert_true(combined.get_rapp_sources('listener') == ['override', 'lowest'])
+
+
+def test_find_interface():
+    print_title('Test Find Interface')
+
+    twist = {'publishers': [], 'services': [], 'subscribers': [{'name': '/teleop/cmd_vel', 'type': 'geometry_msgs/Twist'}]}
+    chatter = {'publishers': [{'name': 'chatter', 'type': 'std_msgs/String'}], 'subscribers': [], 'services': []}
+    implementation = {'compatibility': 'rocon:/', 'launch': '/teleop.launch'}
+    data = {'teleop': create_rapp('teleop', {'display': 'Teleop', 'description': 'virtual', 'public_interface': twist}),
+            'kobuki_teleop': create_rapp('kobuki_teleop', dict(implementation, parent_name='teleop')),
+            'talker': create_rapp('talker', dict(implementation, display='Talker', description='talker', public_interface=chatter)),
+            'orphan': create_rapp('orphan', dict(implementation, parent_name='missing'))}
+    indexer = RappIndexer(raw_data=data)
+
+    # children are found by the connections they inherit
+    assert_true(sorted(indexer.find_interface(msg_type='geometry_msgs/Twist')) == ['kobuki_teleop', 'teleop'])
+    assert_true(indexer.find_interface('subscribers', '/teleop/cmd_vel')['kobuki_teleop'] == [('subscribers', '/teleop/cmd_vel', 'geometry_msgs/Twist')])
+    assert_true(indexer.find_interface('publishers', '/teleop/cmd_vel') == {})
+    assert_true(sorted(indexer.find_interface(name='chatter', msg_type='std_msgs/String')) == ['talker'])
+    assert_true(indexer.find_interface(name='chatter', msg_type='geometry_msgs/Twist') == {})
+    assert_raises(ValueError, indexer.find_interface, 'publishers')
+
+    # the index follows changes of the parents
+    twist_publisher = {'publishers': [{'name': '/cmd_vel', 'type': 'geometry_msgs/Twist'}], 'subscribers': [], 'services': []}
+    other = RappIndexer(raw_data={'teleop': create_rapp('teleop', {'display': 'Teleop', 'description': 'virtual', 'public_interface': twist_publisher}),
+                                  'missing': create_rapp('missing', {'display': 'Missing', 'description': 'virtual'})})
+    indexer.merge(other)
+    assert_true(indexer.find_interface(name='/teleop/cmd_vel') == {})
+    assert_true(sorted(indexer.find_interface('publishers', msg_type='geometry_msgs/Twist')) == ['kobuki_teleop', 'teleop'])
+
+
+def test_public_interface_table():
+    print_title('Test Public Interface Table')
+
+    twist = {'subscribers': [{'name': '/teleop/cmd_vel', 'type': 'geometry_msgs/Twist'}], 'publishers': ['odom']}
+    table = compile_public_interface(twist)
+    assert_true(table == (PublicConnection('publishers', 'odom', None, False), PublicConnection('subscribers', '/teleop/cmd_vel', 'geometry_msgs/Twist', True)))
+    assert_raises(AttributeError, setattr, table[0], 'name', 'other')
+    assert_true(compile_public_interface(None) == ())
+
+    # compiled once along with the specification, children get the inherited connections
+    r = create_implementation('teleop', public_interface=twist)
+    child = create_rapp('kobuki_teleop', {'compatibility': 'rocon:/kobuki', 'launch': '/teleop.launch', 'parent_name': 'teleop'})
+    indexer = RappIndexer(raw_data={'teleop': r, 'kobuki_teleop': child})
+    rapp = indexer._resolve('kobuki_teleop')
+    rapp.load_rapp_specs_from_file(lazy=True)
+    assert_true('public_interface_table' in rapp.data)
+    assert_true(rapp.data['public_interface_table'] == table)
+    assert_true(rapp.data['public_interface_table'] is rapp.data['public_interface_table'])
+
+
+def test_search():
+    print_title('Test Search')
+
+    indexer = index_rocon_apps()
+
+    assert_true(indexer.search('moo')[0][0] == 'rocon_apps/moo_chirp')
+    assert_true([name for name, unused_score in indexer.search('Chirp lion')] == ['rocon_apps/lion_chirp'])
+    teleops = [name for name, unused_score in indexer.search('tele')]
+    assert_true(teleops[0] == 'rocon_apps/teleop' and 'rocon_apps/video_teleop' in teleops)
+    assert_true(set(['rocon_apps/make_a_map', 'rocon_apps/waypoint_nav']).issubset(name for name, unused_score in indexer.search('robot')))
+    assert_true(len(indexer.search('rocon', limit=2)) == 2)
+    assert_true(indexer.search('xyzzy') == [] and indexer.search('') == [])
+
+    # the index follows changes of the rapps, children are found by the texts they inherit
+    data = {'display': 'Tiger Chirp', 'parent_name': 'rocon_apps/chirp', 'compatibility': 'rocon:/', 'launch': '/tiger.launch'}
+    tiger = create_rapp('rocon_apps/lion_chirp', data, '/lion_chirp.rapp')
+    indexer.merge(RappIndexer(raw_data={'rocon_apps/lion_chirp': tiger}))
+    assert_true([name for name, unused_score in indexer.search('tiger')] == ['rocon_apps/lion_chirp'])
+    assert_true(indexer.search('lion') == [('rocon_apps/lion_chirp', 3.0)])  # by its name only
+    assert_true('rocon_apps/lion_chirp' in [name for name, unused_score in indexer.search('audible')])
+
+
+def test_capabilities():
+    print_title('Test Capabilities')
+
+    requirements = {'talker': [],
+                    'teleop': ['std_capabilities/DifferentialMobileBase'],
+                    'follower': ['std_capabilities/DifferentialMobileBase', 'std_capabilities/RGBDSensor'],
+                    'snapshot': ['std_capabilities/RGBDSensor']}
+    indexer = RappIndexer(raw_data=dict((name, create_implementation(name, required_capabilities=[{'name': c} for c in caps]) if caps else create_implementation(name))
+                                        for name, caps in requirements.items()))
+    base = set(['std_capabilities/DifferentialMobileBase'])
+
+    runnable, missing = indexer.filter_capabilities(base)
+    assert_true(runnable == set(['talker', 'teleop']))
+    assert_true(missing == {'follower': frozenset(['std_capabilities/RGBDSensor']), 'snapshot': frozenset(['std_capabilities/RGBDSensor'])})
+    runnable, missing = indexer.filter_capabilities(set([]), ['talker', 'follower', 'unknown'])
+    assert_true(runnable == set(['talker']) and sorted(missing) == ['follower'])
+    assert_true(indexer.find_rapps_unlocked_by('std_capabilities/RGBDSensor', base) == set(['follower', 'snapshot']))
+    assert_true(indexer.find_rapps_unlocked_by('std_capabilities/RGBDSensor', set([])) == set(['snapshot']))
+    assert_true(indexer.find_rapps_requiring(['std_capabilities/DifferentialMobileBase']) == set(['teleop', 'follower']))
+
+    # the index follows changes of the rapps
+    indexer.merge(RappIndexer(raw_data={'snapshot': create_implementation('snapshot')}))
+    assert_true(indexer.filter_capabilities(set([]))[0] == set(['talker', 'snapshot']))
+    assert_true(indexer.get_capability_requirements(['snapshot']) == {'snapshot': frozenset([])})
+
+
+def test_iter_rapps():
+    print_title('Test Iter Rapps')
+
+    indexer = index_rocon_apps()
+    compatible, unused_incompatible, unused_invalid = indexer.get_compatible_rapps('rocon:/')
+
+    chirps = [r.resource_name for r in indexer.iter_rapps(ancestor='rocon_apps/chirp')]
+    assert_true(chirps == sorted(name for name, r in compatible.items() if r.ancestor_name == 'rocon_apps/chirp'))
+    assert_true(len(chirps) > 2)
+    first = next(indexer.iter_rapps(uri='rocon:/', ancestor='rocon_apps/chirp', load_specs=True))
+    assert_true(first.resource_name == chirps[0] and first.data['name'] == chirps[0])
+    assert_true('rocon_apps/chirp' in [r.resource_name for r in indexer.iter_rapps(types=['Virtual Ancestor'], resolve=False)])
+    assert_true(not list(indexer.iter_rapps(packages=['other_apps'])))
+    turtlebot_compatible = indexer.get_compatible_rapps('rocon:/turtlebot2')[0]
+    assert_true([r.resource_name for r in indexer.iter_rapps(uri='rocon:/turtlebot2')] == sorted(turtlebot_compatible))
+
+    # rapps past the consumed ones are neither resolved nor checked
+    checked = []
+
+    def predicate(rapp):
+        checked.append(rapp.resource_name)
+        return True
+    page = list(itertools.islice(indexer.iter_rapps(predicate=predicate), 2))
+    assert_true([r.resource_name for r in page] == checked and len(checked) == 2)
+
+    # only the chains of the consumed rapps are resolved
+    indexer = index_rocon_apps()
+    assert_true(not indexer._resolved)
+    first = next(indexer.iter_rapps(ancestor='rocon_apps/chirp'))
+    assert_true(set(indexer._resolved) == indexer._resolved[first.resource_name][1])
+    assert_true([r.resource_name for r in indexer.iter_rapps(ancestor='rocon_apps/chirp')] == chirps)
+    assert_true(sorted(r.resource_name for r in indexer.iter_rapps()) == sorted(compatible))
+
+
 def print_title(title):
     print(console.bold + "\n******************************************************" + console.reset)
     print(console.bold + "* " + str(title) + console.reset)
     print(console.bold + "******************************************************" + console.reset)
 
 
+def create_rapp(name, data, filename=None, yaml_data=None):
+    '''
+      Loads a rapp from its raw data, which also serves as its yaml data unless given.
+    '''
+    r = Rapp(name)
+    r.load_rapp_yaml(filename if filename else '/%s.rapp' % name, dict(data) if yaml_data is None else yaml_data, data)
+    return r
+
+
+def create_implementation(name, filename=None, **fields):
+    '''
+      Loads a runnable rapp compatible with any robot, whose display name and description are its name
+      unless given in the fields.
+    '''
+    data = {'display': name, 'description': name, 'compatibility': 'rocon:/', 'launch': '/%s.launch' % name}
+    data.update(fields)
+    return create_rapp(name, data, filename)
+
+
+def create_index(source, names):
+    '''
+      Creates an index of implementations, whose display name is the source of the index.
+    '''
+    data = dict((name, create_implementation(name, '/%s/%s.rapp' % (source, name), display=source)) for name in names)
+    return RappIndexer(raw_data=data, source=source)
+
+
+def index_rocon_apps():
+    return RappIndexer(packages_path=rocon_apps_path, use_cache=False)
+
+
 def load_data(data, verbose=False):
     if verbose:
         console.pretty_println('Loading Test Rapps..',console.bold)
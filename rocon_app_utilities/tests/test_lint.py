@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+
+##############################################################################
+# Imports
+##############################################################################
+
+# enable some python3 compatibility options:
+# (unicode_literals not compatible with python2 uuid module)
+from __future__ import absolute_import, print_function
+
+from nose.tools import assert_equal, assert_true
+import json
+import os
+import shutil
+import tempfile
+
+from rocon_app_utilities.lint import lint_path
+
+##############################################################################
+# Tests
+##############################################################################
+
+
+def test_lint():
+    tempdir = tempfile.mkdtemp(suffix='', prefix='test_lint_')
+    try:
+        repo_path = os.path.join(tempdir, 'rocon_apps')
+        shutil.copytree(os.path.join(os.path.dirname(__file__), '..', '..', 'rocon_apps'), repo_path)
+        apps_path = os.path.join(repo_path, 'apps')
+        # several problems of the same rapp are all reported
+        with open(os.path.join(apps_path, 'listener', 'listener.rapp'), 'a') as f:
+            f.write('\nbogus: 1\n')
+        with open(os.path.join(apps_path, 'listener', 'listener.launch'), 'w') as f:
+            f.write('<launch><arg name="gateway_name"/>\n')
+        os.remove(os.path.join(apps_path, 'talker', 'talker.interface'))
+        os.mkdir(os.path.join(apps_path, 'orphan'))
+        with open(os.path.join(apps_path, 'orphan', 'orphan.rapp'), 'w') as f:
+            f.write('parent_name: rocon_apps/missing\ncompatibility: rocon:/\nlaunch: ../talker/talker.launch\n')
+        with open(os.path.join(repo_path, 'package.xml')) as f:
+            package_xml = f.read()
+        with open(os.path.join(repo_path, 'package.xml'), 'w') as f:
+            f.write(package_xml.replace('<export>', '<export>\n    <rocon_app>apps/orphan/orphan.rapp</rocon_app>'))
+
+        report = lint_path(repo_path, workers=2)
+        rapps = report['rapps']
+        assert_equal(sorted(set(p['check'] for p in rapps['rocon_apps/listener']['problems'])), ['fields', 'launch'])
+        assert_equal([p['check'] for p in rapps['rocon_apps/talker']['problems']], ['resource'])
+        assert_equal([p['check'] for p in rapps['rocon_apps/orphan']['problems']], ['chain'])
+        assert_equal(rapps['rocon_apps/chirp']['problems'], [])
+        assert_equal(rapps['rocon_apps/chirp']['type'], 'Virtual Ancestor')
+        assert_equal(report['summary']['invalid'], 3)
+        assert_true(report['timings']['total'] >= report['timings']['check'])
+
+        # the same report without a process pool, and it can be dumped as json
+        serial_report = lint_path(repo_path)
+        assert_equal(serial_report['summary'], dict(report['summary'], workers=1))
+        assert_equal(json.loads(json.dumps(serial_report))['summary']['rapps'], len(rapps))
+    finally:
+        shutil.rmtree(tempdir)
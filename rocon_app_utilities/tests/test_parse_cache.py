@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+
+##############################################################################
+# Imports
+##############################################################################
+
+# enable some python3 compatibility options:
+# (unicode_literals not compatible with python2 uuid module)
+from __future__ import absolute_import, print_function
+
+from nose.tools import assert_equal, assert_raises, assert_true
+import copy
+import os
+import pickle
+import shutil
+import tempfile
+
+from rocon_app_utilities import resource_cache
+from rocon_app_utilities.exceptions import RappResourceNotExistException
+from rocon_app_utilities.indexer import _parse_rapp_file
+from rocon_app_utilities.parse_cache import RappParseCache
+from rocon_app_utilities.rapp_loader import _find_resource
+from rocon_app_utilities.rapp_repositories import build_index
+from rocon_app_utilities.yaml_cache import load_yaml
+
+##############################################################################
+# Tests
+##############################################################################
+
+
+def test_parse_cache():
+    tempdir = tempfile.mkdtemp(suffix='', prefix='test_parse_cache_')
+
+    # override default location of the parse cache
+    import rocon_app_utilities.parse_cache
+    rocon_app_utilities.parse_cache._parse_cache_file = os.path.join(tempdir, 'rapp_parse.cache')
+    try:
+        repo_path = os.path.join(os.path.dirname(__file__), 'test_rapp_repos')
+        cold_index = build_index([repo_path])
+        rapp_path = cold_index.raw_data_path['test_package_for_rapps/foo'][0]
+        cache = RappParseCache()
+        assert_true(rapp_path in cache.entries)
+
+        # warm index is served from the cache and yields the same data
+        warm_index = build_index([repo_path])
+        assert_equal(warm_index.raw_data.keys(), cold_index.raw_data.keys())
+        assert_equal(warm_index.get_raw_rapp('test_package_for_rapps/foo').raw_data,
+                     cold_index.get_raw_rapp('test_package_for_rapps/foo').raw_data)
+        assert_true(cache.lookup(rapp_path) is not None)
+        assert_equal(cache.hits, 1)
+
+        # changing the size of the rapp file invalidates the entry
+        copied_path = os.path.join(tempdir, 'foo.rapp')
+        shutil.copy(rapp_path, copied_path)
+        cache.store(copied_path, [(copied_path, cache.signature(copied_path))], {}, {})
+        assert_true(cache.lookup(copied_path) is not None)
+        with open(copied_path, 'a') as f:
+            f.write('\n# touched\n')
+        assert_true(cache.lookup(copied_path) is None)
+
+        # the signatures are the ones taken before parsing, a file changed meanwhile misses
+        yaml_data, raw_data, reason, signatures = _parse_rapp_file('test_package_for_rapps/foo', copied_path)
+        assert_equal([p for p, unused_sig in signatures], [copied_path])
+        with open(copied_path, 'a') as f:
+            f.write('\n# touched while parsing\n')
+        cache.store(copied_path, signatures, yaml_data, raw_data, reason)
+        assert_true(cache.lookup(copied_path) is None)
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_yaml_cache():
+    tempdir = tempfile.mkdtemp(suffix='', prefix='test_yaml_cache_')
+    try:
+        path = os.path.join(tempdir, 'foo.interface')
+        with open(path, 'w') as f:
+            f.write('publishers: [{name: chatter, type: std_msgs/String}]\n')
+        document = load_yaml(path)
+        assert_true(load_yaml(path) is document)
+        assert_raises(TypeError, document.__setitem__, 'subscribers', [])
+        assert_raises(TypeError, document['publishers'].append, {})
+
+        # copies are plain and writable
+        copied = copy.deepcopy(document)
+        copied['publishers'].append({'name': 'other'})
+        assert_equal(type(pickle.loads(pickle.dumps(document, pickle.HIGHEST_PROTOCOL))), dict)
+        assert_equal(len(document['publishers']), 1)
+
+        # parsed again once the file changed
+        with open(path, 'w') as f:
+            f.write('publishers: []\nsubscribers: []\n')
+        os.utime(path, (0, 0))
+        assert_equal(load_yaml(path), {'publishers': [], 'subscribers': []})
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_resource_cache():
+    tempdir = tempfile.mkdtemp(suffix='', prefix='test_resource_cache_')
+    import rocon_python_utils.ros
+    find_resource_from_string = rocon_python_utils.ros.find_resource_from_string
+    crawled = []
+
+    def counting_find_resource_from_string(resource):
+        crawled.append(resource)
+        return find_resource_from_string(resource)
+    rocon_python_utils.ros.find_resource_from_string = counting_find_resource_from_string
+    try:
+        path = os.path.join(tempdir, 'foo.launch')
+        with open(path, 'w') as f:
+            f.write('<launch/>\n')
+        with resource_cache.listing_cache():
+            assert_true(resource_cache.exists(path))
+            assert_true(resource_cache.exists(os.path.join(tempdir, 'sub', '..', 'foo.launch')))
+            assert_true(not resource_cache.exists(os.path.join(tempdir, 'bar.launch')))
+            assert_true(not resource_cache.exists(os.path.join(tempdir, 'missing', 'bar.launch')))
+            # the listing is kept for the block
+            with open(os.path.join(tempdir, 'bar.launch'), 'w') as f:
+                f.write('<launch/>\n')
+            assert_true(not resource_cache.exists(os.path.join(tempdir, 'bar.launch')))
+        assert_true(resource_cache.exists(os.path.join(tempdir, 'bar.launch')))
+
+        # the package path is crawled once per missing resource
+        resource_cache.clear_resource_cache()
+        assert_equal(_find_resource(tempdir, 'foo.launch'), path)
+        for unused_i in range(3):
+            assert_raises(RappResourceNotExistException, _find_resource, tempdir, 'baz.launch')
+        assert_equal(crawled, ['baz.launch'])
+    finally:
+        rocon_python_utils.ros.find_resource_from_string = find_resource_from_string
+        resource_cache.clear_resource_cache()
+        shutil.rmtree(tempdir)
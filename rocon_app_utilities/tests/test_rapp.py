@@ -12,13 +12,20 @@
 # (unicode_literals not compatible with python2 uuid module)
 from __future__ import absolute_import, print_function
 
-from nose.tools import assert_raises, assert_true
+from nose.tools import assert_equal, assert_raises, assert_true
+import gc
 import os
+import shutil
+import tempfile
 import rocon_console.console as console
 
+from rocon_app_utilities.compact import InternTable
 from rocon_app_utilities.rapp import *
+from rocon_app_utilities.rapp_loader import get_launch_args
 from rocon_app_utilities.exceptions import *
 
+from .test_indexer import create_rapp
+
 ##############################################################################
 # Tests
 ##############################################################################
@@ -134,6 +141,76 @@ def test_rapp_inheritance():
          ('icon',              'rocon_apps/talker.png')]
     assert_true(validate(child.raw_data, d))
 
+def test_rapp_interning():
+    print_title('Sharing Interned Rapp Data')
+
+    rapps = []
+    for name in ['talker', 'chatter']:
+        interface = {'publishers': [{'name': '/chatter', 'type': 'std_msgs/String'}], 'subscribers': []}
+        data = {'display': name, 'description': name, 'compatibility': 'rocon:/', 'launch': '/%s.launch' % name, 'public_interface': interface}
+        rapps.append(create_rapp('rocon_apps/' + name, data, yaml_data=dict(data, public_interface='/%s.interface' % name)))
+    talker, chatter = rapps
+    assert_true(talker.raw_data['public_interface'] is chatter.raw_data['public_interface'])
+    assert_true(talker.yaml_data['public_interface'] == '/talker.interface')
+    assert_true(talker.yaml_data['launch'] is talker.raw_data['launch'])
+    assert_true(dict(talker.yaml_data) == talker.yaml_data.copy() and len(talker.yaml_data) == 5)
+    assert_raises(TypeError, talker.yaml_data.__setitem__, 'launch', None)
+
+    # shared values are read-only, so a change of one rapp can not show in the other
+    assert_raises(TypeError, talker.raw_data['public_interface']['publishers'].append, {'name': '/other', 'type': 'std_msgs/String'})
+    assert_raises(TypeError, talker.raw_data['public_interface'].__setitem__, 'publishers', [])
+    assert_equal(len(chatter.raw_data['public_interface']['publishers']), 1)
+
+    # pooled structures are released with the last rapp holding them
+    table = InternTable()
+    interface = table.intern({'publishers': [{'name': '/chatter', 'type': 'std_msgs/String'}]})
+    assert_true(table.intern({'publishers': [{'name': '/chatter', 'type': 'std_msgs/String'}]}) is interface)
+    assert_equal(len(table), 3)
+    del interface
+    gc.collect()
+    assert_equal(len(table), 0)
+
+
+def test_launch_args():
+    print_title('Extracting Top-Level Launch Args')
+
+    tempdir = tempfile.mkdtemp(suffix='', prefix='test_launch_args_')
+    try:
+        launch_files = {'valid': '''<?xml version="1.0"?>
+<!-- leading comment -->
+<launch>
+  <arg name=" gateway_name "/>
+  <include file="$(find foo)/foo.launch">
+    <arg name="rocon_uri" value="rocon:/"/>
+  </include>
+  <group ns="bar"><arg name="simulation" default="false"/></group>
+  <arg name="application_namespace" default=""/>
+  <arg name="unknown"/>
+</launch>
+''',
+                        'malformed': '<launch><arg name="gateway_name"></launch>',
+                        'no_launch': '<node name="foo"/>',
+                        'unnamed_arg': '<launch><arg default="foo"/></launch>'}
+        paths = {}
+        for name, contents in launch_files.items():
+            paths[name] = os.path.join(tempdir, name + '.launch')
+            with open(paths[name], 'w') as f:
+                f.write(contents)
+
+        # nested args are not top-level args
+        assert_equal(get_launch_args(paths['valid']), ['gateway_name', 'application_namespace'])
+        for name in ['malformed', 'no_launch', 'unnamed_arg']:
+            assert_raises(RappMalformedException, get_launch_args, paths[name])
+
+        # parsed again once the file changed
+        with open(paths['valid'], 'w') as f:
+            f.write('<launch><arg name="rocon_uri"/></launch>')
+        os.utime(paths['valid'], (0, 0))
+        assert_equal(get_launch_args(paths['valid']), ['rocon_uri'])
+    finally:
+        shutil.rmtree(tempdir)
+
+
 def print_title(title):
     print(console.bold + "\n****************************************************************************************" + console.reset)
     print(console.bold + "* " + str(title) + console.reset)
@@ -12,14 +12,21 @@
 # (unicode_literals not compatible with python2 uuid module)
 from __future__ import absolute_import, print_function
 
-from nose.tools import assert_equal, assert_false, assert_true
+from nose.tools import assert_equal, assert_false, assert_raises, assert_true
+import gc
 import os
 import shutil
+import tarfile
 import tempfile
+import yaml
 
 import rocon_console.console as console
 
-from rocon_app_utilities.rapp_repositories import build_index, get_index, get_index_dest_prefix_for_base_paths, has_index, load_index, load_uris, save_uris
+from rocon_app_utilities.exceptions import InvalidIndexShardsException
+from rocon_app_utilities.index_shards import load_sharded_index, update_shards, write_shards
+from rocon_app_utilities.indexer import RappIndexer, read_tarball
+import rocon_app_utilities.tarball_resources as tarball_resources
+from rocon_app_utilities.rapp_repositories import build_index, get_cached_index_path, get_index, get_index_dest_prefix_for_base_paths, has_index, load_index, load_uris, save_uris, update_remote_index
 
 ##############################################################################
 # Tests
@@ -63,3 +70,177 @@ def test_rapp_repositories():
 
     finally:
         shutil.rmtree(tempdir)
+
+
+def test_build_index_parallel():
+    repo_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'rocon_apps'))
+    serial_index = build_index([repo_path], use_cache=False)
+    parallel_index = build_index([repo_path], use_cache=False, workers=4)
+
+    assert_equal(sorted(parallel_index.raw_data.keys()), sorted(serial_index.raw_data.keys()))
+    assert_equal(parallel_index.invalid_data, serial_index.invalid_data)
+    for resource_name, rapp in serial_index.raw_data.items():
+        assert_equal(parallel_index.raw_data[resource_name].raw_data, rapp.raw_data)
+
+
+def test_read_tarball_in_memory():
+    tempdir = tempfile.mkdtemp(suffix='', prefix='test_read_tarball_')
+
+    # override default location of materialised resources
+    tarball_resources._resource_cache_dir = os.path.join(tempdir, 'resources')
+    try:
+        repo_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'rocon_apps'))
+        index = build_index([repo_path], use_cache=False)
+        archive_prefix = os.path.join(tempdir, 'rocon_apps')
+        index.write_tarball(archive_prefix)
+
+        tarball_index = read_tarball(name='%s.index.tar.gz' % archive_prefix)
+        assert_equal(sorted(tarball_index.raw_data.keys()), sorted(index.raw_data.keys()))
+        assert_equal(tarball_index.raw_data['rocon_apps/talker'].raw_data['public_interface'],
+                     index.raw_data['rocon_apps/talker'].raw_data['public_interface'])
+
+        # nothing is written to disk until a resource is materialised
+        rapp = tarball_index.get_rapp('rocon_apps/talker')
+        launch = rapp.data['launch']
+        assert_true(launch.startswith(tarball_resources._resource_cache_dir))
+        assert_false(os.path.exists(tarball_resources._resource_cache_dir))
+        assert_equal(rapp.data['launch_args'], index.get_rapp('rocon_apps/talker').data['launch_args'])
+        assert_equal(tarball_resources.materialize(launch), launch)
+        with open(launch, 'rb') as f:
+            with open(index.raw_data['rocon_apps/talker'].raw_data['launch'], 'rb') as original:
+                assert_equal(f.read(), original.read())
+
+        # an archive written from an archive has the same members
+        tarball_index.write_tarball(os.path.join(tempdir, 'copy'))
+        copied_index = read_tarball(name=os.path.join(tempdir, 'copy.index.tar.gz'))
+        assert_equal(sorted(copied_index.raw_data.keys()), sorted(index.raw_data.keys()))
+
+        # archives stay registered as long as an index references them, regardless of their number
+        singles = []
+        for resource_name in sorted(index.raw_data)[:10]:
+            filename = RappIndexer(raw_data={resource_name: index.raw_data[resource_name]}).write_tarball(os.path.join(tempdir, resource_name.replace('/', '_')))
+            singles.append((resource_name, read_tarball(name=filename)))
+        for resource_name, single_index in singles:
+            assert_true(tarball_resources.exists(single_index.get_raw_rapp(resource_name).filename))
+        assert_true(tarball_resources.exists(launch))
+        filename = singles[0][1].get_raw_rapp(singles[0][0]).filename
+        del singles[:], single_index
+        gc.collect()
+        assert_equal(tarball_resources.registered_roots([filename]), set([]))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_write_tarball_reproducible():
+    tempdir = tempfile.mkdtemp(suffix='', prefix='test_write_tarball_')
+    try:
+        repo_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'rocon_apps'))
+        index = build_index([repo_path], use_cache=False)
+
+        codecs = ['gz', 'none'] + (['xz'] if tarball_resources.lzma is not None else [])
+        for codec in codecs:
+            first = index.write_tarball(os.path.join(tempdir, 'first'), codec)
+            second = build_index([repo_path], use_cache=False).write_tarball(os.path.join(tempdir, 'second'), codec)
+            with open(first, 'rb') as f:
+                with open(second, 'rb') as g:
+                    assert_true(f.read() == g.read())
+
+            # read back regardless of the codec
+            tarball_index = read_tarball(name=first)
+            assert_equal(sorted(tarball_index.raw_data.keys()), sorted(index.raw_data.keys()))
+            for resource_name, rapp in index.raw_data.items():
+                assert_equal(tarball_index.raw_data[resource_name].raw_data['display'], rapp.raw_data['display'])
+        assert_raises(ValueError, index.write_tarball, os.path.join(tempdir, 'third'), 'bz2')
+
+        # identical files are stored once
+        members = tarball_resources.TarballResources.from_tarball(name=os.path.join(tempdir, 'first.index.tar')).members()
+        with tarfile.open(os.path.join(tempdir, 'first.index.tar')) as tar:
+            links = [tarinfo for tarinfo in tar if tarinfo.islnk()]
+            for tarinfo in links:
+                assert_equal(members[tarinfo.name], members[tarinfo.linkname])
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_sharded_index():
+    tempdir = tempfile.mkdtemp(suffix='', prefix='test_sharded_index_')
+
+    # override default location of the cached index archives
+    import rocon_app_utilities.rapp_repositories
+    rocon_app_utilities.rapp_repositories._rapp_repositories_list_file = os.path.join(tempdir, 'cache', 'rapp.list')
+    try:
+        repo_paths = [os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'rocon_apps')),
+                      os.path.abspath(os.path.join(os.path.dirname(__file__), 'test_rapp_repos'))]
+        index = build_index(repo_paths, use_cache=False)
+        manifest_filename = write_shards(index, os.path.join(tempdir, 'published', 'repos'))
+        manifest_url = 'file://%s' % manifest_filename
+        shards_path = os.path.join(tempdir, 'published', 'repos.shards')
+        assert_equal(sorted(os.listdir(shards_path)), ['rocon_apps.index.tar.gz', 'test_package_for_rapps.index.tar.gz'])
+
+        sharded_index = get_index(manifest_url)
+        assert_equal(sorted(sharded_index.raw_data.keys()), sorted(index.raw_data.keys()))
+
+        # only the shards of the selected packages are fetched
+        assert_equal(update_remote_index(manifest_url), get_cached_index_path(manifest_url))
+        os.remove(os.path.join(shards_path, 'test_package_for_rapps.index.tar.gz'))
+        whitelisted_index = get_index(manifest_url, package_whitelist=['rocon_apps'])
+        assert_true(whitelisted_index.raw_data)
+        assert_true(all(name.startswith('rocon_apps/') for name in whitelisted_index.raw_data))
+        blacklisted_index = get_index(manifest_url, package_blacklist=['test_package_for_rapps'])
+        assert_equal(sorted(blacklisted_index.raw_data.keys()), sorted(whitelisted_index.raw_data.keys()))
+
+        # the local copy only downloads the shards which changed
+        write_shards(index, os.path.join(tempdir, 'published', 'repos'))
+        assert_equal(update_shards(manifest_url, get_cached_index_path(manifest_url)), [])
+        assert_equal(sorted(get_index(manifest_url).raw_data.keys()), sorted(index.raw_data.keys()))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_sharded_index_of_many_packages():
+    tempdir = tempfile.mkdtemp(suffix='', prefix='test_sharded_index_')
+    try:
+        package_names = ['test_package_%d' % i for i in range(10)]
+        for package_name in package_names:
+            app_path = os.path.join(tempdir, 'src', package_name, 'apps', 'foo')
+            os.makedirs(app_path)
+            with open(os.path.join(app_path, 'foo.rapp'), 'w') as f:
+                f.write('display: Foo\ndescription: foo\n')
+            with open(os.path.join(tempdir, 'src', package_name, 'package.xml'), 'w') as f:
+                f.write(PACKAGE_XML % package_name)
+        index = build_index([os.path.join(tempdir, 'src')], use_cache=False)
+        manifest_filename = write_shards(index, os.path.join(tempdir, 'published', 'repos'))
+        manifest_url = 'file://%s' % manifest_filename
+
+        # every shard stays readable, however many packages are whitelisted
+        sharded_index = load_sharded_index(manifest_url, package_whitelist=package_names)
+        assert_equal(sorted(sharded_index.raw_data.keys()), sorted('%s/foo' % p for p in package_names))
+        assert_true(all(tarball_resources.exists(rapp.filename) for rapp in sharded_index.raw_data.values()))
+
+        # an archive which does not match the digest of the manifest is rejected
+        with open(manifest_filename) as f:
+            manifest = yaml.safe_load(f)
+        manifest['packages']['test_package_3']['digest'] = '0' * 32
+        with open(manifest_filename, 'w') as f:
+            yaml.safe_dump(manifest, f)
+        assert_raises(InvalidIndexShardsException, load_sharded_index, manifest_url)
+        assert_raises(InvalidIndexShardsException, update_shards, manifest_url, os.path.join(tempdir, 'cache', 'repos.index.yaml'))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+PACKAGE_XML = '''<package>
+  <name>%s</name>
+  <version>0.0.0</version>
+  <description>.</description>
+  <maintainer email="noreply@example.com">Nobody</maintainer>
+  <license>BSD</license>
+
+  <buildtool_depend>catkin</buildtool_depend>
+
+  <run_depend>rocon_app_utilities</run_depend>
+  <export>
+    <rocon_app>apps/foo/foo.rapp</rocon_app>
+  </export>
+</package>
+'''
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+#
+# License: BSD
+#   https://raw.github.com/robotics-in-concert/rocon_app_platform/license/LICENSE
+#
+
+##############################################################################
+# Imports
+##############################################################################
+
+# enable some python3 compatibility options:
+# (unicode_literals not compatible with python2 uuid module)
+from __future__ import absolute_import, print_function
+
+from nose.tools import assert_equal, assert_raises, assert_true
+import os
+import shutil
+import tempfile
+
+from rocon_app_utilities.exceptions import InvalidSnapshotException
+from rocon_app_utilities.rapp_repositories import build_index, get_index, get_index_dest_prefix_for_base_paths
+from rocon_app_utilities.snapshot import RappSnapshot, is_snapshot_fresh, write_snapshot
+
+##############################################################################
+# Tests
+##############################################################################
+
+
+def test_snapshot():
+    tempdir = tempfile.mkdtemp(suffix='', prefix='test_snapshot_')
+    try:
+        repo_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'rocon_apps'))
+        index = build_index([repo_path], use_cache=False)
+        snapshot_path = os.path.join(tempdir, 'rocon_apps.index.snapshot')
+        write_snapshot(index, snapshot_path)
+
+        snapshot = RappSnapshot(snapshot_path)
+        try:
+            assert_equal(sorted(snapshot.names()), sorted(index.raw_data.keys()))
+            talker = snapshot.load_rapp('rocon_apps/talker')
+            assert_equal(talker.raw_data, index.raw_data['rocon_apps/talker'].raw_data)
+            assert_equal(talker.type, index.raw_data['rocon_apps/talker'].type)
+
+            # rapps are unpickled on their first lookup
+            loaded = snapshot.load_index(package_whitelist=['rocon_apps'])
+            assert_equal(sorted(loaded.raw_data.keys()), sorted(index.raw_data.keys()))
+            assert_equal(loaded.raw_data._rapps, {})
+            assert_equal(loaded.get_raw_rapp('rocon_apps/talker').raw_data, talker.raw_data)
+            assert_equal(list(loaded.raw_data._rapps.keys()), ['rocon_apps/talker'])
+
+            assert_equal(loaded.invalid_data, index.invalid_data)
+
+            # chains and the compatibility index are built from the offset table alone
+            unfiltered = snapshot.load_index()
+            assert_equal(unfiltered._chains, index._chains)
+            unfiltered._update_chains()
+            unfiltered._update_compatibility()
+            assert_equal(unfiltered.raw_data._rapps, {})
+            compatible, unused_incompatible, unused_invalid = loaded.get_compatible_rapps('rocon:/')
+            expected, unused_incompatible, unused_invalid = index.get_compatible_rapps('rocon:/')
+            assert_equal(sorted(compatible.keys()), sorted(expected.keys()))
+            assert_equal(loaded.get_rapp('rocon_apps/moo_chirp').data['launch_args'],
+                         index.get_rapp('rocon_apps/moo_chirp').data['launch_args'])
+        finally:
+            snapshot.close()
+
+        # anything but a snapshot of the current version is rejected
+        broken_path = os.path.join(tempdir, 'broken.index.snapshot')
+        with open(broken_path, 'wb') as f:
+            f.write(b'RAPPSNAP\x00')
+        assert_raises(InvalidSnapshotException, RappSnapshot, broken_path)
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_get_index_prefers_snapshot():
+    tempdir = tempfile.mkdtemp(suffix='', prefix='test_snapshot_')
+
+    # override default location of the cached index archives
+    import rocon_app_utilities.rapp_repositories
+    rocon_app_utilities.rapp_repositories._rapp_repositories_list_file = os.path.join(tempdir, 'rapp.list')
+    try:
+        repo_path = os.path.join(os.path.dirname(__file__), 'test_rapp_repos')
+        archive_prefix = get_index_dest_prefix_for_base_paths([repo_path])
+        build_index([repo_path]).write_tarball(archive_prefix)
+
+        # the first load extracts the archive and takes the snapshot, the next loads use it
+        snapshot_path = '%s.index.snapshot' % archive_prefix
+        index = get_index(repo_path)
+        assert_true(is_snapshot_fresh(snapshot_path, '%s.index.tar.gz' % archive_prefix))
+        index2 = get_index(repo_path)
+        assert_equal(index2.raw_data.keys(), ['test_package_for_rapps/foo'])
+        assert_equal(index2.raw_data['test_package_for_rapps/foo'].raw_data, index.raw_data['test_package_for_rapps/foo'].raw_data)
+
+        # a touched archive is hashed and still fresh as long as its contents did not change
+        archive_path = '%s.index.tar.gz' % archive_prefix
+        os.utime(archive_path, (1, 1))
+        assert_true(is_snapshot_fresh(snapshot_path, archive_path))
+
+        # an archive replaced by one with an older mtime, e.g. copied with 'cp -p', is not served from the snapshot
+        empty_path = os.path.join(tempdir, 'empty')
+        os.makedirs(empty_path)
+        build_index([empty_path]).write_tarball(archive_prefix)
+        os.utime(archive_path, (0, 0))
+        assert_true(not is_snapshot_fresh(snapshot_path, archive_path))
+        assert_equal(list(get_index(repo_path).raw_data.keys()), [])
+        assert_true(is_snapshot_fresh(snapshot_path, archive_path))
+    finally:
+        shutil.rmtree(tempdir)